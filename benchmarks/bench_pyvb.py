@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Measure how much time pyvb spends orchestrating pyenv
+
+Each scenario builds a matrix of environments against a fake pyenv (see
+fake_pyenv.py) which sleeps instead of compiling, so what's left is pyvb's
+own overhead plus the simulated build time. For each scenario we report wall
+time, how many times pyenv was run, and the peak RSS of the pyvb process.
+
+Run it with 'invoke bench' or, for example:
+
+    python benchmarks/bench_pyvb.py --scenarios 1,4,20 --jobs 4 -- --incremental
+
+Arguments after -- are passed to pyvb.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_pyenv
+
+# run pyvb and write its peak RSS to the file named by the first argument
+RUNNER = """
+import resource, sys
+import pyvb.__main__
+code = pyvb.__main__.main(sys.argv[2:])
+with open(sys.argv[1], "w") as file:
+    file.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+sys.exit(code)
+"""
+
+
+def run_pyvb(workdir, env, pyvb_args):
+    """Run pyvb once, return wall seconds, pyenv invocations, and peak RSS in KiB"""
+    log = os.path.join(workdir, "pyenv.log")
+    rss = os.path.join(workdir, "rss")
+    if os.path.exists(log):
+        os.unlink(log)
+    env = dict(env, FAKE_PYENV_LOG=log)
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", RUNNER, rss] + pyvb_args, env=env, check=True)
+    elapsed = time.perf_counter() - start
+
+    spawned = 0
+    if os.path.exists(log):
+        with open(log, encoding="utf-8") as file:
+            spawned = len(file.readlines())
+    with open(rss, encoding="utf-8") as file:
+        peak = int(file.read())
+    if sys.platform == "darwin":
+        # macOS reports bytes, linux reports kilobytes
+        peak //= 1024
+    return elapsed, spawned, peak
+
+
+def run_scenario(count, args):
+    """Build count environments twice in a fresh fake pyenv, and report on both runs"""
+    with tempfile.TemporaryDirectory(prefix="pyvb-bench-") as workdir:
+        root = os.path.join(workdir, "pyenv")
+        fake_pyenv.make_root(root, fake_pyenv.make_catalog(minors=args.catalog_minors))
+        env = dict(
+            os.environ,
+            PYENV_ROOT=root,
+            XDG_CACHE_HOME=os.path.join(workdir, "cache"),
+            PATH=os.path.join(root, "bin") + os.pathsep + os.environ["PATH"],
+            FAKE_PYENV_INSTALL_SECONDS=str(args.install_seconds),
+            FAKE_PYENV_VIRTUALENV_SECONDS=str(args.virtualenv_seconds),
+        )
+        versions = ",".join("3.{}".format(x) for x in range(count))
+        pyvb_args = ["bench", "-p", versions, "--jobs", str(args.jobs)]
+        pyvb_args.extend(args.pyvb_args)
+        for run in ["cold", "warm"]:
+            elapsed, spawned, peak = run_pyvb(workdir, env, pyvb_args)
+            print(
+                "{:>9} {:>5} {:>10.2f} {:>12} {:>14}".format(
+                    count, run, elapsed, spawned, peak
+                )
+            )
+
+
+def main():
+    """Run the benchmark scenarios"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--scenarios",
+        default="1,4,20",
+        help="comma separated numbers of environments to build, default 1,4,20",
+    )
+    parser.add_argument("--jobs", type=int, default=1, help="passed to pyvb --jobs")
+    parser.add_argument(
+        "--install-seconds",
+        type=float,
+        default=0.2,
+        help="how long the fake pyenv takes to install a python",
+    )
+    parser.add_argument(
+        "--virtualenv-seconds",
+        type=float,
+        default=0.05,
+        help="how long the fake pyenv takes to create a virtualenv",
+    )
+    parser.add_argument(
+        "--catalog-minors",
+        type=int,
+        default=40,
+        help="number of minor versions in the fake catalog, each with 25 patches",
+    )
+    parser.add_argument("pyvb_args", nargs="*", help="extra arguments for pyvb")
+    args = parser.parse_args()
+
+    print(
+        "{:>9} {:>5} {:>10} {:>12} {:>14}".format(
+            "versions", "run", "wall (s)", "subprocesses", "peak RSS (KiB)"
+        )
+    )
+    for count in args.scenarios.split(","):
+        run_scenario(int(count), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Micro-benchmark for looking up the latest python version in a large catalog
+
+Compares the linear scan which pyvb used to do against VersionIndex. Run it
+with 'invoke bench' or 'python benchmarks/bench_version_index.py'.
+"""
+
+import re
+import timeit
+
+from pyvb.versions import VersionIndex
+
+
+def make_catalog(minors=40, patches=60):
+    """Build a synthetic catalog with thousands of entries"""
+    catalog = []
+    for minor in range(minors):
+        for patch in range(patches):
+            catalog.append("3.{}.{}".format(minor, patch))
+            catalog.append("3.{}.{}rc1".format(minor, patch))
+        catalog.append("3.{}-dev".format(minor))
+    for minor in range(minors):
+        for patch in range(patches):
+            catalog.append("pypy3.{}-7.3.{}".format(minor, patch))
+    return catalog
+
+
+def linear_scan(catalog, major_minor):
+    """The algorithm pyvb used before VersionIndex"""
+    prereleases = re.compile(r"(dev$|rc[0-9]+$|b[0-9]+$)")
+    pythons = list(filter(lambda x: not prereleases.search(x), catalog))
+    for version in reversed(pythons):
+        if version.startswith(major_minor):
+            return version
+    return None
+
+
+def main():
+    """Run the benchmark and print the results"""
+    catalog = make_catalog()
+    queries = ["3.{}".format(minor) for minor in range(0, 40, 4)]
+    number = 20
+
+    scan = timeit.timeit(
+        lambda: [linear_scan(catalog, q) for q in queries], number=number
+    )
+    build = timeit.timeit(lambda: VersionIndex(catalog), number=number)
+    index = VersionIndex(catalog)
+    lookup = timeit.timeit(lambda: [index.latest(q) for q in queries], number=number)
+
+    per_query = number * len(queries)
+    print("catalog entries:     {}".format(len(catalog)))
+    print("linear scan:         {:10.2f} us/query".format(scan / per_query * 1e6))
+    print("build index:         {:10.2f} us/build".format(build / number * 1e6))
+    print("index lookup:        {:10.2f} us/query".format(lookup / per_query * 1e6))
+
+
+if __name__ == "__main__":
+    main()
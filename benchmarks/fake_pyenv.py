@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A fake pyenv for benchmarking pyvb
+
+make_root() builds a directory which looks like $PYENV_ROOT, with a catalog of
+python-build definitions and a `pyenv` executable which runs this file.
+The fake pyenv understands the handful of commands pyvb uses. It sleeps
+instead of compiling pythons or creating virtualenvs, and it logs every
+invocation so we can count how many times pyvb ran it.
+
+The fake is configured with environment variables:
+
+    FAKE_PYENV_LOG                   file to append each invocation to
+    FAKE_PYENV_INSTALL_SECONDS       how long `pyenv install` takes
+    FAKE_PYENV_VIRTUALENV_SECONDS    how long `pyenv virtualenv` takes
+"""
+
+import os
+import shutil
+import sys
+import time
+
+from pyvb.discovery import sort_versions
+
+VERSION = "2.6.8"
+
+
+def make_catalog(minors=40, patches=25):
+    """Return a list of versions, about the size of the real pyenv catalog"""
+    catalog = []
+    for minor in range(minors):
+        catalog.append("3.{}-dev".format(minor))
+        for patch in range(patches):
+            catalog.append("3.{}.{}".format(minor, patch))
+        catalog.append("pypy3.{}-7.3.0".format(minor))
+    return catalog
+
+
+def make_root(root, catalog):
+    """Build a fake pyenv installation in root"""
+    definitions = os.path.join(root, "plugins", "python-build", "share", "python-build")
+    os.makedirs(definitions)
+    for version in catalog:
+        with open(os.path.join(definitions, version), "w", encoding="utf-8") as file:
+            file.write("# fake definition\n")
+    os.makedirs(os.path.join(root, "versions"))
+
+    libexec = os.path.join(root, "libexec")
+    os.makedirs(libexec)
+    shim = os.path.join(libexec, "pyenv")
+    with open(shim, "w", encoding="utf-8") as file:
+        file.write(
+            '#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(
+                sys.executable, os.path.abspath(__file__)
+            )
+        )
+    os.chmod(shim, 0o755)
+    with open(os.path.join(libexec, "pyenv---version"), "w", encoding="utf-8") as file:
+        file.write('#!/bin/sh\nversion="{}"\n'.format(VERSION))
+    os.makedirs(os.path.join(root, "bin"))
+    os.symlink(shim, os.path.join(root, "bin", "pyenv"))
+
+
+def _sleep(variable):
+    time.sleep(float(os.environ.get(variable, "0")))
+
+
+def _install(root, version, force=False):
+    """Pretend to compile a python"""
+    python = os.path.join(root, "versions", version, "bin", "python")
+    if os.path.exists(python):
+        if not force:
+            return 0
+        os.unlink(python)
+    _sleep("FAKE_PYENV_INSTALL_SECONDS")
+    os.makedirs(os.path.dirname(python), exist_ok=True)
+    with open(python, "w", encoding="utf-8") as file:
+        file.write("#!/bin/sh\n")
+    os.chmod(python, 0o755)
+    return 0
+
+
+def _virtualenv(root, version, name):
+    """Pretend to create a virtualenv"""
+    base = os.path.join(root, "versions", version)
+    if not os.path.isdir(base):
+        print("pyenv-virtualenv: `{}' is not installed in pyenv.".format(version))
+        return 1
+    _sleep("FAKE_PYENV_VIRTUALENV_SECONDS")
+    env = os.path.join(base, "envs", name)
+    os.makedirs(os.path.join(env, "bin"))
+    with open(os.path.join(env, "pyvenv.cfg"), "w", encoding="utf-8") as file:
+        file.write("home = {}\n".format(os.path.join(base, "bin")))
+    os.symlink(os.path.join(base, "bin", "python"), os.path.join(env, "bin", "python"))
+    os.symlink(env, os.path.join(root, "versions", name))
+    return 0
+
+
+def _uninstall(root, name):
+    path = os.path.join(root, "versions", name)
+    if os.path.islink(path):
+        shutil.rmtree(os.path.realpath(path), ignore_errors=True)
+        os.unlink(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    return 0
+
+
+def main(argv):
+    """Act like pyenv"""
+    log = os.environ.get("FAKE_PYENV_LOG")
+    if log:
+        with open(log, "a", encoding="utf-8") as file:
+            file.write(" ".join(argv) + "\n")
+    root = os.environ["PYENV_ROOT"]
+
+    if argv == ["--version"]:
+        print("pyenv {}".format(VERSION))
+        return 0
+    if argv == ["install", "--list"]:
+        definitions = os.path.join(
+            root, "plugins", "python-build", "share", "python-build"
+        )
+        print("Available versions:")
+        # python-build sorts numerically, so 3.10 comes after 3.9
+        for version in sort_versions(os.listdir(definitions)):
+            print("  {}".format(version))
+        return 0
+    if argv[:2] in (["install", "-s"], ["install", "-f"]):
+        return _install(root, argv[2], force=argv[1] == "-f")
+    if argv[:2] == ["uninstall", "-f"]:
+        return _uninstall(root, argv[2])
+    if argv[:2] == ["virtualenv", "-p"]:
+        return _virtualenv(root, argv[3], argv[4])
+    print("fake pyenv: unknown command: {}".format(" ".join(argv)), file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
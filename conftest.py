@@ -1,15 +1,38 @@
 #
 # -*- coding: utf-8 -*-
 
+import shutil
+import subprocess
+
 import pytest
 import pyvb
 
 
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """Keep the on-disk caches used by pyvb out of the real home directory"""
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache))
+    return cache
+
+
 @pytest.fixture
-def prog(mocker, pythons):
+def pyenv_root(tmp_path, monkeypatch):
+    """An empty $PYENV_ROOT, so tests can't disturb real pythons or environments"""
+    root = tmp_path / "pyenv"
+    (root / "versions").mkdir(parents=True)
+    monkeypatch.setenv("PYENV_ROOT", str(root))
+    return root
+
+
+@pytest.fixture
+def prog(mocker, pythons, pyenv_root):
     """An instance of the Pyvb class, mocked to always return a known list of pythons"""
     all_mock = mocker.patch("pyvb.Pyvb._get_all_pythons")
-    all_mock.return_value = pythons
+    all_mock.side_effect = lambda: iter(pythons.splitlines(keepends=True))
+    # make sure we use the pythons fixture, not any python-build on this machine
+    mocker.patch("pyvb.discovery.available_pythons", return_value=None)
+    mocker.patch("pyvb.Pyvb.pyenv_version", return_value="pyenv 1.2.16")
     return pyvb.Pyvb()
 
 
@@ -412,3 +435,69 @@ def pythons():
   stackless-3.4.7
   stackless-3.5.4
 """
+
+
+@pytest.fixture
+def fake_env(pyenv_root):
+    """Make fake pythons and environments under $PYENV_ROOT/versions
+
+    Call the returned function with a version to make an installed python, or
+    with a version and a name to make an environment built from that python.
+    """
+
+    def make(version, name=None):
+        base = pyenv_root / "versions" / version
+        python = base / "bin" / "python"
+        if not python.exists():
+            python.parent.mkdir(parents=True)
+            python.write_text("#!/bin/sh\n")
+            python.chmod(0o755)
+        if not name:
+            return base
+        env = base / "envs" / name
+        (env / "bin").mkdir(parents=True)
+        (env / "pyvenv.cfg").write_text("home = {}\n".format(python.parent))
+        # venv puts the directory name in the prompt
+        (env / "bin" / "activate").write_text(
+            'VIRTUAL_ENV="{}"\nPS1="({}) ${{PS1:-}}"\n'.format(env, name)
+        )
+        (env / "bin" / "python").symlink_to(python)
+        (pyenv_root / "versions" / name).symlink_to(env)
+        return env
+
+    return make
+
+
+@pytest.fixture
+def pyenv_run(mocker, fake_env, pyenv_root):
+    """Patch subprocess.run to act like pyenv on the fake $PYENV_ROOT
+
+    pyenv install makes a fake python, or with -f a new one in place of the old
+    one, pyenv virtualenv makes a fake environment, and pyenv uninstall removes
+    either. Anything else does nothing. Returns the mock.
+    """
+
+    def run(argv, **kwargs):
+        if argv[:3] == ["pyenv", "install", "-s"]:
+            fake_env(argv[-1])
+        elif argv[:3] == ["pyenv", "install", "-f"]:
+            # build it again, which makes a new python executable
+            python = pyenv_root / "versions" / argv[-1] / "bin" / "python"
+            if python.exists():
+                python.unlink()
+                python.write_text("#!/bin/sh\n")
+                python.chmod(0o755)
+            else:
+                fake_env(argv[-1])
+        elif argv[:2] == ["pyenv", "virtualenv"]:
+            fake_env(argv[-2], argv[-1])
+        elif argv[:2] == ["pyenv", "uninstall"]:
+            path = pyenv_root / "versions" / argv[-1]
+            if path.is_symlink():
+                shutil.rmtree(str(path.resolve()))
+                path.unlink()
+            elif path.is_dir():
+                shutil.rmtree(str(path))
+        return subprocess.CompletedProcess(argv, 0)
+
+    return mocker.patch("subprocess.run", side_effect=run)
@@ -16,7 +16,8 @@ with open(path.join(here, "README.rst"), encoding="utf-8") as f:
 
 setup(
     name="pyvb",
-    use_scm_version=True,
+    # write the version to a module so pyvb doesn't have to look it up at runtime
+    use_scm_version={"write_to": "src/pyvb/_version.py"},
     description="A command line tool for building python virtual environments.",
     long_description=long_description,
     author="Jared Crapo",
@@ -41,6 +42,8 @@ setup(
     package_dir={"": "src"},
     python_requires=">=3.5",
     setup_requires=["setuptools_scm"],
+    # --batch reads TOML, which the standard library only can from 3.11
+    install_requires=['tomli; python_version < "3.11"'],
     # dependencies for development and testing
     # $ pip install -e .[dev]
     extras_require={
@@ -56,6 +59,7 @@ setup(
             "twine",
             "rope",
             "invoke",
+            'tomli; python_version < "3.11"',
         ],
     },
     # define the scripts that should be created on installation
@@ -24,11 +24,19 @@
 pyvb - Python Virtual Environment Builder
 """
 
-from pkg_resources import get_distribution, DistributionNotFound
-
 from .pyvb import Pyvb  # noqa F401
 
+# setuptools_scm writes _version.py when pyvb is built or installed. Looking up
+# the distribution metadata instead is much slower, so only do it as a fallback.
 try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    __version__ = "unknown"
+    from ._version import version as __version__
+except ImportError:  # pragma: no cover
+    try:
+        import importlib.metadata
+    except ImportError:
+        __version__ = "unknown"
+    else:
+        try:
+            __version__ = importlib.metadata.version(__name__)
+        except importlib.metadata.PackageNotFoundError:
+            __version__ = "unknown"
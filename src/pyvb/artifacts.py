@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A cache of compiled pythons, so each one only has to be built once
+"""
+
+import os
+import platform
+from typing import Dict, Optional
+
+from . import files
+
+# environment variables which python-build passes to configure and the compiler
+BUILD_VARIABLES = [
+    "CC",
+    "CFLAGS",
+    "CPPFLAGS",
+    "LDFLAGS",
+    "CONFIGURE_OPTS",
+    "PYTHON_CONFIGURE_OPTS",
+    "PYTHON_CFLAGS",
+    "PYTHON_MAKE_OPTS",
+]
+
+SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size like 500M or 20G into a number of bytes
+
+    >>> parse_size('20G')
+    21474836480
+    >>> parse_size('1024')
+    1024
+    """
+    size = size.strip().upper().rstrip("B")
+    suffix = size[-1:] if size[-1:] in SUFFIXES else ""
+    number = size[: len(size) - len(suffix)]
+    try:
+        return int(float(number) * SUFFIXES[suffix])
+    except ValueError:
+        raise ValueError("invalid size: {}".format(size)) from None
+
+
+def build_options(environ=None) -> Dict[str, str]:
+    """Return the build settings which change what python-build produces"""
+    if environ is None:
+        environ = os.environ
+    return {name: environ[name] for name in BUILD_VARIABLES if environ.get(name)}
+
+
+def compiler_version(environ=None) -> str:
+    """Return the first line of `$CC --version`, which identifies the compiler
+
+    CC comes from environ, or if it isn't set there, from the settings python
+    itself was built with. If the compiler can't be run, the command is
+    returned instead.
+    """
+    # pylint: disable=import-outside-toplevel
+    import shlex
+    import subprocess
+    import sysconfig
+
+    if environ is None:
+        environ = os.environ
+    command = environ.get("CC") or sysconfig.get_config_var("CC") or "cc"
+    try:
+        process = subprocess.run(
+            shlex.split(command) + ["--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=False,
+        )
+    except (OSError, ValueError):
+        return command
+    lines = (process.stdout or "").splitlines()
+    if process.returncode or not lines:
+        return command
+    return lines[0].strip()
+
+
+class ArtifactCache:
+    """A directory of compiled pythons, as tarballs keyed by how they were built
+
+    The directory may be shared by many hosts, for example on network storage.
+    Tarballs are written under a temporary name and renamed into place, so
+    readers never see a partial one. When the cache grows beyond max_bytes the
+    least recently used tarballs are removed.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(
+        version: str,
+        prefix: str,
+        options: Optional[dict] = None,
+        compiler: Optional[str] = None,
+    ) -> str:
+        """Return the cache key for a python build
+
+        :version: the python version, like 3.8.1
+        :prefix: the directory the python is installed in. Compiled pythons
+                 have this path built in, so they can only be restored to
+                 the same place.
+        :options: the build settings, see build_options()
+        :compiler: the compiler's version, see compiler_version(), so
+                   upgrading the compiler doesn't restore old builds
+        """
+        # pylint: disable=import-outside-toplevel
+        import hashlib
+        import json
+
+        if options is None:
+            options = build_options()
+        if compiler is None:
+            compiler = compiler_version()
+        ingredients = {
+            "version": version,
+            "prefix": prefix,
+            "options": options,
+            "compiler": compiler,
+            "system": platform.system(),
+            "machine": platform.machine(),
+            "libc": platform.libc_ver(),
+        }
+        as_json = json.dumps(ingredients, sort_keys=True).encode("utf-8")
+        digest = hashlib.sha256(as_json).hexdigest()[:32]
+        return "{}-{}".format(version, digest)
+
+    def _tarball(self, key: str) -> str:
+        return os.path.join(self.path, key + ".tar.gz")
+
+    def restore(self, key: str, prefix: str) -> bool:
+        """Unpack a cached python into prefix
+
+        :return: True if the python was in the cache and has been restored
+        """
+        # pylint: disable=import-outside-toplevel
+        import shutil
+        import tarfile
+        import tempfile
+
+        tarball = self._tarball(key)
+        if not os.path.isfile(tarball):
+            return False
+        parent = os.path.dirname(prefix)
+        os.makedirs(parent, exist_ok=True)
+        # unpack next to the destination, then rename it into place
+        staging = tempfile.mkdtemp(dir=parent, prefix=".pyvb-restore-")
+        try:
+            with tarfile.open(tarball, "r:gz") as tar:
+                # pythons contain symlinks, which the stricter filters reject
+                if hasattr(tarfile, "tar_filter"):
+                    tar.extractall(staging, filter="tar")
+                else:  # pragma: no cover
+                    tar.extractall(staging)
+            os.rename(os.path.join(staging, "python"), prefix)
+        except (OSError, tarfile.TarError):
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        # mark it as recently used
+        os.utime(tarball)
+        return True
+
+    def store(self, key: str, prefix: str):
+        """Pack the python installed in prefix into the cache"""
+        # pylint: disable=import-outside-toplevel
+        import tarfile
+        import tempfile
+
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=self.path, prefix=".pyvb-store-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                with tarfile.open(fileobj=file, mode="w:gz") as tar:
+                    tar.add(prefix, arcname="python")
+            os.replace(tmpname, self._tarball(key))
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used tarballs until the cache fits in max_bytes"""
+        if self.max_bytes is None:
+            return
+        tarballs = []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".tar.gz") and not entry.name.startswith(
+                        "."
+                    ):
+                        stat = entry.stat()
+                        tarballs.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in tarballs)
+        for _, size, path in sorted(tarballs):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
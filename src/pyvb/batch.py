@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Read a batch file which lists many projects to build environments for
+
+A batch file is TOML, like this:
+
+    [defaults]
+    python = ["3.7", "3.8"]
+
+    [projects.fred]
+    python = "3.6,3.8"
+    requirements = "fred/requirements.txt"
+
+    [projects.wilma]
+
+Each project gets an environment for each of its python versions, named
+like the basename argument, ie fred-3.8.1. Projects without a python list
+use the one in defaults, then the one given on the command line. Relative
+requirements paths are relative to the batch file.
+"""
+
+import os
+from typing import List, Optional
+
+PROJECT_KEYS = {"python", "requirements"}
+
+
+class BatchError(Exception):
+    """Raised when a batch file can't be read or doesn't make sense"""
+
+
+# pylint: disable=too-few-public-methods
+class Project:
+    """Data class to hold the settings for one project in a batch file"""
+
+    def __init__(self, name, pythons=None, requirements=None):
+        self.name = name
+        # a list of python version specifiers, or None to use the defaults
+        self.pythons: Optional[List[str]] = pythons
+        # an absolute path to a requirements file, or None
+        self.requirements: Optional[str] = requirements
+
+
+def _load_toml(path: str) -> dict:
+    try:
+        import tomllib  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover
+        try:
+            import tomli as tomllib  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            raise BatchError(
+                "reading batch files requires python 3.11 or the tomli package"
+            ) from None
+    try:
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+    except OSError as err:
+        raise BatchError("can't read {}: {}".format(path, err)) from None
+    except tomllib.TOMLDecodeError as err:
+        raise BatchError("{}: {}".format(path, err)) from None
+
+
+def _settings(path: str, where: str, table) -> dict:
+    """Validate the settings for a project or the defaults"""
+    if not isinstance(table, dict):
+        raise BatchError("{}: {} must be a table".format(path, where))
+    unknown = set(table) - PROJECT_KEYS
+    if unknown:
+        raise BatchError(
+            "{}: unknown setting in {}: {}".format(
+                path, where, ", ".join(sorted(unknown))
+            )
+        )
+    settings = {}
+    pythons = table.get("python")
+    if pythons is not None:
+        if isinstance(pythons, str):
+            pythons = [pythons]
+        if not isinstance(pythons, list) or not all(
+            isinstance(x, str) for x in pythons
+        ):
+            raise BatchError(
+                "{}: python in {} must be a list of versions".format(path, where)
+            )
+        settings["pythons"] = pythons
+    requirements = table.get("requirements")
+    if requirements is not None:
+        if not isinstance(requirements, str):
+            raise BatchError(
+                "{}: requirements in {} must be a path".format(path, where)
+            )
+        settings["requirements"] = os.path.join(
+            os.path.dirname(os.path.abspath(path)), requirements
+        )
+    return settings
+
+
+def load_batch(path: str) -> List[Project]:
+    """Read a batch file and return the projects in it, in the order they are listed"""
+    data = _load_toml(path)
+    unknown = set(data) - {"defaults", "projects"}
+    if unknown:
+        raise BatchError(
+            "{}: unknown table: {}".format(path, ", ".join(sorted(unknown)))
+        )
+    defaults = _settings(path, "defaults", data.get("defaults", {}))
+    projects = data.get("projects", {})
+    if not isinstance(projects, dict) or not projects:
+        raise BatchError("{}: no projects".format(path))
+
+    result = []
+    for name, table in projects.items():
+        settings = dict(defaults)
+        settings.update(_settings(path, "projects.{}".format(name), table))
+        result.append(Project(name, **settings))
+    return result
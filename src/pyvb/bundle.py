@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Bundles of an installed python and its environments, to copy to another host
+
+A bundle is a gzipped tarball. The python is under python/, each environment
+under envs/NAME/, and the last member, bundle.json, lists where they came
+from and the sha256 of every file. Bundles are written and read as streams,
+so neither end holds the whole thing in memory or seeks in it.
+
+The pyvb export and import commands are here too.
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import discovery, locations
+from .environment import Environment
+
+MANIFEST = "bundle.json"
+FORMAT = 1
+
+CHUNK = 1024 * 1024
+
+
+class BundleError(Exception):
+    """Raised when a bundle can't be read, or its contents don't match their checksums"""
+
+
+# pylint: disable=too-few-public-methods
+class _HashingReader:
+    """Wrap a file, keeping the sha256 of what has been read from it"""
+
+    def __init__(self, file):
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        """Read from the file, and add what was read to the sha256"""
+        data = self.file.read(size)
+        self.sha256.update(data)
+        return data
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 of a file, reading a chunk at a time"""
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _add_tree(tar, top: str, arcname: str, skip: Iterable[str], files: Dict):
+    """Add a directory tree to a tarball, recording the sha256 of each file"""
+    for dirpath, dirnames, filenames in os.walk(top):
+        relative = os.path.relpath(dirpath, top)
+        if relative == ".":
+            dirnames[:] = [name for name in dirnames if name not in skip]
+        base = os.path.normpath(os.path.join(arcname, relative))
+        tar.addfile(tar.gettarinfo(dirpath, base))
+        # os.walk lists symlinks to directories as directories
+        for name in sorted(dirnames) + sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name in dirnames and not os.path.islink(path):
+                continue
+            info = tar.gettarinfo(path, base + "/" + name)
+            if info.isreg():
+                with open(path, "rb") as file:
+                    reader = _HashingReader(file)
+                    tar.addfile(info, reader)
+                files[info.name] = reader.sha256.hexdigest()
+            else:
+                # symlinks, and hardlinks to files already added
+                tar.addfile(info)
+
+
+def write_bundle(
+    fileobj, version: str, prefix: str, environments: Dict[str, str], root: str
+):
+    """Write a bundle of a python and some of its environments to a binary file
+
+    :version: the python version, like 3.8.1
+    :prefix: the directory the python is installed in
+    :environments: a dictionary of environment name to the directory it is in
+    :root: $PYENV_ROOT, so paths inside the bundle can be rewritten on import
+    """
+    import tarfile  # pylint: disable=import-outside-toplevel
+
+    files = {}
+    with tarfile.open(fileobj=fileobj, mode="w|gz") as tar:
+        # environments are bundled separately, under their own names
+        _add_tree(tar, prefix, "python", ["envs"], files)
+        for name, path in sorted(environments.items()):
+            _add_tree(tar, path, "envs/" + name, [], files)
+        manifest = {
+            "format": FORMAT,
+            "version": version,
+            "root": root,
+            "prefix": prefix,
+            "environments": environments,
+            "files": files,
+        }
+        data = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+        info = tarfile.TarInfo(MANIFEST)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def _check_name(name: str, environments: set):
+    """Refuse members which aren't part of a python or environment"""
+    parts = name.split("/")
+    if ".." in parts or name.startswith("/"):
+        raise BundleError("bundle member {} is outside the bundle".format(name))
+    if parts[0] == "python" or (parts[0] == "envs" and len(parts) > 1):
+        if parts[0] == "envs":
+            environments.add(parts[1])
+        return
+    raise BundleError("unexpected bundle member {}".format(name))
+
+
+def read_bundle(fileobj, dest: str) -> dict:
+    """Unpack a bundle from a binary file into the directory dest, and verify it
+
+    Members are written to disk as they are read. Their checksums are
+    compared with the manifest at the end, so dest should be a staging
+    directory which is thrown away if this raises BundleError.
+
+    :return: the bundle manifest
+    """
+    manifest, digests, environments = _unpack(fileobj, dest)
+    _verify(manifest, digests, environments)
+    return manifest
+
+
+def _unpack(fileobj, dest: str) -> Tuple[Optional[dict], Dict[str, str], set]:
+    """Extract the members of a bundle, and read its manifest
+
+    :return: the manifest, or None if there wasn't one, the sha256 of each
+             file extracted, and the names of the environments found
+    """
+    import tarfile  # pylint: disable=import-outside-toplevel
+
+    digests = {}
+    environments = set()
+    manifest = None
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+            for member in tar:
+                if member.name == MANIFEST:
+                    manifest = json.load(tar.extractfile(member))
+                    continue
+                if manifest is not None:
+                    raise BundleError("bundle has members after {}".format(MANIFEST))
+                _check_name(member.name, environments)
+                # pythons contain symlinks, which the stricter filters reject
+                if hasattr(tarfile, "tar_filter"):
+                    tar.extract(member, dest, filter="tar")
+                else:  # pragma: no cover
+                    tar.extract(member, dest)
+                if member.isreg():
+                    digests[member.name] = file_digest(os.path.join(dest, member.name))
+    except (tarfile.TarError, EOFError, ValueError, OSError) as err:
+        raise BundleError("can't read bundle: {}".format(err)) from None
+    return manifest, digests, environments
+
+
+def _verify(manifest, digests: Dict[str, str], environments: set):
+    """Check what was unpacked against the bundle manifest"""
+    if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+        raise BundleError(
+            "bundle has no {} or it is from another pyvb".format(MANIFEST)
+        )
+    names = [manifest.get("version")] + list(manifest.get("environments", {}))
+    for name in names:
+        if not isinstance(name, str) or not name or name.startswith(".") or "/" in name:
+            raise BundleError("bad name {!r} in {}".format(name, MANIFEST))
+    if set(manifest.get("environments", {})) != environments:
+        raise BundleError("bundle environments don't match {}".format(MANIFEST))
+    expected = manifest.get("files", {})
+    for name in sorted(set(expected) | set(digests)):
+        if expected.get(name) != digests.get(name):
+            raise BundleError("checksum mismatch for {}".format(name))
+
+
+def rewrite_tree(top: str, replacements: List[Tuple[str, str]]) -> int:
+    """Replace old paths with new ones in the text files and symlinks under top
+
+    Files with a NUL byte are binaries, where a path of a different length
+    can't be changed, so they are left alone. Each path is rewritten once,
+    by the longest old path it starts with, so a new path which starts with
+    an old one isn't rewritten again.
+
+    :return: how many files and symlinks were rewritten
+    """
+    if all(old == new for old, new in replacements):
+        return 0
+    paths = {os.fsencode(old): os.fsencode(new) for old, new in replacements}
+    olds = sorted(paths, key=len, reverse=True)
+    # an old path only matches a whole path, or the start of a longer one
+    pattern = re.compile(
+        b"(?:" + b"|".join(re.escape(old) for old in olds) + b")(?![\\w.-])"
+    )
+    rewritten = 0
+    for dirpath, dirnames, filenames in os.walk(top):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                if _rewrite_link(path, pattern, paths):
+                    rewritten += 1
+            elif name in filenames and _rewrite_file(path, pattern, paths):
+                rewritten += 1
+    return rewritten
+
+
+def _rewrite_link(path: str, pattern, paths: Dict[bytes, bytes]) -> bool:
+    """Replace the old path a symlink starts with
+
+    :return: True if the symlink was changed
+    """
+    link = os.fsencode(os.readlink(path))
+    match = pattern.match(link)
+    if not match:
+        return False
+    old = match.group()
+    if paths[old] == old:
+        return False
+    if link != old and not link.startswith(old + os.fsencode(os.sep)):
+        return False
+    os.unlink(path)
+    # link starts with old, so that is the first occurrence
+    os.symlink(os.fsdecode(link.replace(old, paths[old], 1)), path)
+    return True
+
+
+def _rewrite_file(path: str, pattern, paths: Dict[bytes, bytes]) -> bool:
+    """Replace old paths in a text file, keeping its permissions
+
+    :return: True if the file was changed
+    """
+    with open(path, "rb") as file:
+        content = original = file.read()
+    if b"\0" in content:
+        return False
+    content = pattern.sub(lambda match: paths[match.group()], content)
+    if content == original:
+        return False
+    # the file may be hardlinked, so write a new one rather than editing it
+    tmpname = path + ".pyvb-rewrite"
+    with open(tmpname, "wb") as file:
+        file.write(content)
+    os.chmod(tmpname, os.stat(path).st_mode)
+    os.replace(tmpname, path)
+    return True
+
+
+def _export_parser():
+    """Build the argument parser for pyvb export"""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="pyvb export",
+        description="""Pack an installed python and the environments pyvb has
+        built from it into one compressed file, which 'pyvb import' can unpack
+        on another host without compiling anything.""",
+    )
+
+    version_help = "the python version to export, like 3.8.1"
+    parser.add_argument("version", help=version_help)
+
+    output_help = """Write the bundle to FILE, or to standard output if FILE
+    is -. Default is pyvb-VERSION.tar.gz"""
+    parser.add_argument("--output", "-o", metavar="FILE", help=output_help)
+
+    environment_help = """Only include the environment NAME. Use more than once
+    to include several. Default is every environment pyvb has built from the
+    python."""
+    parser.add_argument(
+        "--environment",
+        "-e",
+        metavar="NAME",
+        action="append",
+        help=environment_help,
+    )
+
+    verbose_help = "Display progress information"
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", default=False, help=verbose_help
+    )
+
+    return parser
+
+
+def _import_parser():
+    """Build the argument parser for pyvb import"""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="pyvb import",
+        description="""Unpack a bundle made by 'pyvb export' into $PYENV_ROOT.
+        Every file is checked against its checksum, and paths are changed to
+        suit this $PYENV_ROOT. If the python is already installed it is kept,
+        and environments with the same names are replaced.""",
+    )
+
+    bundle_help = "the bundle to import, or - to read it from standard input"
+    parser.add_argument("bundle", help=bundle_help)
+
+    verbose_help = "Display progress information"
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", default=False, help=verbose_help
+    )
+
+    return parser
+
+
+def export_main(prog, argv: List[str]) -> int:
+    """Entry point for 'pyvb export'
+
+    :prog: the Pyvb, which knows what has been built and how to report it
+    :return: an exit code, 1 if the python isn't installed
+    """
+    parser = _export_parser()
+    args = parser.parse_args(argv)
+    prog.verbose = args.verbose
+    if args.output == "-":
+        # the bundle goes to standard output, so messages mustn't
+        output = sys.stdout.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            return _export(prog, parser, args, output)
+    return _export(prog, parser, args, args.output)
+
+
+def _export(prog, parser, args, output) -> int:
+    """Export the bundle, once we know where messages can go"""
+    if not discovery.is_installed(args.version):
+        print("{}: python {} is not installed".format(parser.prog, args.version))
+        return 1
+    output = output or "pyvb-{}.tar.gz".format(args.version)
+    try:
+        count = export_python(prog, args.version, output, args.environment)
+    except (OSError, BundleError) as err:
+        print("{}: {}".format(parser.prog, err))
+        return 1
+    print(
+        "pyvb: exported python {} and {} environments to {}".format(
+            args.version, count, args.output or output
+        )
+    )
+    return 0
+
+
+def export_python(prog, version: str, output, names=None) -> int:
+    """Write a bundle of a python and the environments pyvb built from it
+
+    :output: the file name to write, or a binary file object
+    :names: the environments to include, default all of them
+    :return: the number of environments in the bundle
+    """
+    # pylint: disable=import-outside-toplevel
+    import tempfile
+
+    # a module level import would be shadowed by the files of a bundle
+    from . import files
+
+    environments = _environments_to_export(prog, version, names)
+    prefix = os.path.join(locations.versions_dir(), version)
+    root = locations.pyenv_root()
+    prog.status_message(
+        "exporting python {} and {} environments".format(version, len(environments))
+    )
+    with prog.tracer.span("export", version=version):
+        if not isinstance(output, str):
+            write_bundle(output, version, prefix, environments, root)
+            output.flush()
+            return len(environments)
+        # write it under a temporary name, so a partial bundle is never left
+        directory = os.path.dirname(os.path.abspath(output))
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".pyvb-export-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                write_bundle(file, version, prefix, environments, root)
+            os.replace(tmpname, output)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+    return len(environments)
+
+
+def _environments_to_export(prog, version: str, names=None) -> Dict[str, str]:
+    """Find the environments pyvb built from a python
+
+    :names: the environments wanted, default all of them
+    :return: a dictionary of environment name to the directory it is in
+    """
+    environments = {}
+    for name, entry in sorted(prog.manifest.environments().items()):
+        if entry.get("version") != version or (names and name not in names):
+            continue
+        path = Environment(name).path
+        if os.path.isdir(path):
+            environments[name] = os.path.realpath(path)
+    missing = set(names or ()) - set(environments)
+    if missing:
+        raise BundleError(
+            "no environment {} built from python {}".format(
+                ", ".join(sorted(missing)), version
+            )
+        )
+    return environments
+
+
+def import_main(prog, argv: List[str]) -> int:
+    """Entry point for 'pyvb import'
+
+    :prog: the Pyvb, which knows what has been built and how to report it
+    :return: an exit code, 1 if the bundle could not be imported
+    """
+    parser = _import_parser()
+    args = parser.parse_args(argv)
+    prog.verbose = args.verbose
+    try:
+        if args.bundle == "-":
+            version, names = import_bundle(prog, sys.stdin.buffer)
+        else:
+            with open(args.bundle, "rb") as file:
+                version, names = import_bundle(prog, file)
+    except (OSError, BundleError, subprocess.CalledProcessError) as err:
+        print("{}: {}".format(parser.prog, err))
+        return 1
+    prog.finish_deletions()
+    print("pyvb: imported python {} and {} environments".format(version, len(names)))
+    return 0
+
+
+def import_bundle(prog, fileobj) -> Tuple[str, List[str]]:
+    """Unpack a bundle into $PYENV_ROOT
+
+    The bundle is unpacked and verified in a staging directory, then paths
+    from the host it was made on are rewritten, and the python and each
+    environment are moved into place.
+
+    :fileobj: a binary file to read the bundle from
+    :return: a tuple of the python version and the names of the environments
+    """
+    # pylint: disable=import-outside-toplevel
+    import shutil
+    import tempfile
+
+    versions = locations.versions_dir()
+    os.makedirs(versions, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=versions, prefix=".pyvb-import-")
+    try:
+        prog.status_message("unpacking bundle")
+        with prog.tracer.span("unpack"):
+            manifest = read_bundle(fileobj, staging)
+        version = manifest["version"]
+        old_prefix = manifest["prefix"]
+        old_root = manifest["root"]
+        prefix = os.path.join(versions, version)
+        root = locations.pyenv_root()
+
+        with prog.locked("python", version):
+            if discovery.is_installed(version):
+                prog.status_message(
+                    "python {} is already installed, keeping it".format(version)
+                )
+            else:
+                prog.status_message("installing python {}".format(version))
+                python = os.path.join(staging, "python")
+                rewrite_tree(python, [(old_prefix, prefix), (old_root, root)])
+                os.rename(python, prefix)
+                prog.manifest.record_python(version, installed=True)
+
+        names = sorted(manifest["environments"])
+        for name in names:
+            _import_environment(
+                prog,
+                Environment(name, version),
+                os.path.join(staging, "envs", name),
+                manifest["environments"][name],
+                [(old_prefix, prefix), (old_root, root)],
+            )
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return version, names
+
+
+def _import_environment(prog, env, source: str, old_path: str, replacements):
+    """Move an unpacked environment into place, replacing any with the same name
+
+    :source: the directory the environment was unpacked in
+    :old_path: where the environment was on the host it came from
+    :replacements: pairs of other old and new paths to rewrite
+    """
+    prog.status_message("installing environment {}".format(env.name))
+    prog.lock_environment(env)
+    staging = env.make_staging()
+    # lay it out the same way pyenv virtualenv does
+    real = os.path.join(locations.versions_dir(), env.version, "envs", staging.name)
+    try:
+        rewrite_tree(source, [(old_path, real)] + replacements)
+        os.makedirs(os.path.dirname(real), exist_ok=True)
+        os.rename(source, real)
+        os.symlink(real, staging.path)
+    except BaseException:
+        prog.discard_staging(env)
+        raise
+    prog.replace_environment(env)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+An on-disk cache of the python versions which pyenv can install
+"""
+
+import json
+import os
+import time
+from typing import Iterable, Iterator, List, Optional
+
+from . import files, locations
+
+
+class CatalogCache:
+    """Cache the output of `pyenv install --list` between invocations of pyvb
+
+    The cache file has a json header line, then a line for each version, so
+    it can be read and written a line at a time.
+
+    The cache is keyed by the pyenv version and the modification time of the
+    python-build definitions directory, so upgrading pyenv or adding a
+    definition invalidates it. Entries older than `ttl` seconds are also
+    ignored.
+    """
+
+    DEFAULT_TTL = 24 * 60 * 60
+
+    def __init__(self, path: Optional[str] = None, ttl: int = DEFAULT_TTL):
+        if path is None:
+            path = os.path.join(locations.cache_dir(), "catalog.txt")
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def key(pyenv_version: Optional[str]) -> dict:
+        """Build the key which decides whether a cached catalog is still valid"""
+        definitions = locations.python_build_definitions()
+        mtime = None
+        if definitions:
+            mtime = os.stat(definitions).st_mtime
+        return {"pyenv_version": pyenv_version, "definitions_mtime": mtime}
+
+    def load(self, key: dict) -> Optional[Iterator[str]]:
+        """Return the cached versions a line at a time, or None if the cache is
+        missing, stale, or unreadable"""
+        try:
+            # pylint: disable=consider-using-with
+            file = open(self.path, encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            header = json.loads(file.readline())
+        except ValueError:
+            header = None
+        if (
+            not isinstance(header, dict)
+            or header.get("key") != key
+            or time.time() - header.get("created", 0) > self.ttl
+        ):
+            file.close()
+            return None
+        return self._read(file)
+
+    @staticmethod
+    def _read(file) -> Iterator[str]:
+        with file:
+            for line in file:
+                yield line.rstrip("\n")
+
+    def save(self, key: dict, versions: Iterable[str]) -> List[str]:
+        """Read all of versions and store them in the cache
+
+        The file is replaced atomically so concurrent invocations never see a
+        partially written cache. If reading versions fails, nothing is saved.
+        Failure to write the cache is not an error.
+
+        :return: the versions
+        """
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        versions = list(versions)
+        directory = os.path.dirname(self.path)
+        header = {"key": key, "created": time.time()}
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".catalog-")
+        except OSError:
+            return versions
+        try:
+            files.share(fd)
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(json.dumps(header) + "\n")
+                for version in versions:
+                    file.write(version + "\n")
+            os.replace(tmpname, self.path)
+        except OSError:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+        return versions
+
+
+def parse_catalog(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the versions in the output of `pyenv install --list`
+
+    >>> list(parse_catalog(["Available versions:\\n", "  3.8.0\\n", "  3.8.1\\n"]))
+    ['3.8.0', '3.8.1']
+    """
+    for line in lines:
+        version = line.strip()
+        if version and version != "Available versions:":
+            yield version
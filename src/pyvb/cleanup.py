@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Decide which pythons and environments can be removed to reclaim disk space
+"""
+
+import os
+import re
+import time
+from typing import List, Optional
+
+from . import locations
+
+# environments being built are named like this, see Environment.make_staging()
+STAGING_PATTERN = re.compile(r".+-pyvb-[0-9a-f]{8}$")
+
+# a staging environment this old was left behind by a run which died, not
+# one which is still building
+STALE_STAGING_AGE = 24 * 60 * 60
+
+
+def tree_size(path: str) -> int:
+    """Return the bytes of disk used by a directory tree
+
+    Files hardlinked within the tree are only counted once, and symlinks
+    are not followed.
+    """
+    total = 0
+    seen = set()
+    for directory, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                stat = os.lstat(os.path.join(directory, name))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+            total += stat.st_blocks * 512
+    return total
+
+
+def format_size(size: int) -> str:
+    """Format a number of bytes for people to read
+
+    >>> format_size(1536), format_size(21474836480), format_size(10)
+    ('1.5K', '20.0G', '10B')
+    """
+    for suffix in ["B", "K", "M", "G"]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        suffix = "T"
+    return "{:.1f}{}".format(size, suffix) if suffix != "B" else "{}B".format(size)
+
+
+# pylint: disable=too-few-public-methods
+class Candidate:
+    """Data class to hold an installed python which might be removed"""
+
+    def __init__(self, version: str, size: int, used: float, users: List[str]):
+        self.version = version
+        # bytes of disk it uses
+        self.size = size
+        # when pyvb last used it to build an environment, seconds since the epoch
+        self.used = used
+        # the environments which use it
+        self.users = users
+
+    def __repr__(self):
+        return "Candidate({!r})".format(self.version)
+
+
+def environment_users(version: str) -> List[str]:
+    """Return the names of the environments pyenv-virtualenv made from a python"""
+    try:
+        return sorted(
+            os.listdir(os.path.join(locations.versions_dir(), version, "envs"))
+        )
+    except OSError:
+        return []
+
+
+def pinned_versions() -> List[str]:
+    """Return the pythons selected with `pyenv global` or $PYENV_VERSION"""
+    pinned = os.environ.get("PYENV_VERSION", "").split(":")
+    try:
+        with open(
+            os.path.join(locations.pyenv_root(), "version"), encoding="utf-8"
+        ) as file:
+            pinned.extend(file.read().split())
+    except OSError:
+        pass
+    return [version for version in pinned if version]
+
+
+def choose_pythons(
+    candidates: List[Candidate],
+    max_bytes: Optional[int] = None,
+    min_idle: Optional[float] = None,
+    now: Optional[float] = None,
+) -> List[Candidate]:
+    """Choose which pythons to remove, least recently used first
+
+    :max_bytes: only remove pythons until all of them together use no more
+                than this, None to remove every one which can be
+    :min_idle: only remove pythons which haven't been used for this many seconds
+
+    Pythons which are used by an environment are never removed.
+
+    >>> old = Candidate('3.7.5', 100, 1000, [])
+    >>> new = Candidate('3.8.0', 100, 2000, [])
+    >>> used = Candidate('3.8.1', 100, 0, ['fred-3.8.1'])
+    >>> choose_pythons([new, old, used])
+    [Candidate('3.7.5'), Candidate('3.8.0')]
+    >>> choose_pythons([new, old, used], max_bytes=200)
+    [Candidate('3.7.5')]
+    >>> choose_pythons([new, old, used], min_idle=1500, now=3000)
+    [Candidate('3.7.5')]
+    """
+    if now is None:
+        now = time.time()
+    total = sum(candidate.size for candidate in candidates)
+    chosen = []
+    for candidate in sorted(candidates, key=lambda candidate: candidate.used):
+        if max_bytes is not None and total <= max_bytes:
+            break
+        if candidate.users:
+            continue
+        if min_idle is not None and now - candidate.used < min_idle:
+            continue
+        chosen.append(candidate)
+        total -= candidate.size
+    return chosen
+
+
+def stale_staging(now: Optional[float] = None) -> List[str]:
+    """Return the names of environments left half built by runs which died"""
+    if now is None:
+        now = time.time()
+    versions = locations.versions_dir()
+    try:
+        names = os.listdir(versions)
+    except OSError:
+        return []
+    stale = []
+    for name in sorted(names):
+        if not STAGING_PATTERN.match(name):
+            continue
+        try:
+            stat = os.lstat(os.path.join(versions, name))
+        except OSError:
+            continue
+        if now - stat.st_mtime > STALE_STAGING_AGE:
+            stale.append(name)
+    return stale
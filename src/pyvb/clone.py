@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Clone a directory tree as cheaply as the filesystem allows
+
+Files are reflinked where the filesystem supports it, so the copy shares
+blocks with the original until one of them is written. Otherwise package
+files, which pip replaces rather than edits, are hardlinked, and everything
+else is copied. References to the old location are rewritten in the files
+which hold them, like script shebangs, activate scripts, and pyvenv.cfg.
+"""
+
+import os
+import shutil
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+# directories, relative to the top of the tree, whose files may be hardlinked
+HARDLINK_DIRS = ("lib", "lib64")
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Make dst a copy-on-write clone of src
+
+    :return: True if it worked, False if the filesystem or platform can't do it
+    """
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover
+        return False
+    try:
+        with open(src, "rb") as source, open(dst, "wb") as dest:
+            fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def hardlink(src: str, dst: str) -> bool:
+    """Make dst a hardlink to src
+
+    :return: True if it worked, False if src is on another filesystem, or the
+             system won't let us link to it, for example because we don't own it
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        return False
+    return True
+
+
+def _rewrite(src: str, dst: str, old: bytes, new: bytes) -> bool:
+    """Copy src to dst replacing old with new, if src contains old
+
+    :return: True if src contained old and dst has been written
+    """
+    with open(src, "rb") as file:
+        content = file.read()
+    if old not in content:
+        return False
+    with open(dst, "wb") as file:
+        file.write(content.replace(old, new))
+    shutil.copystat(src, dst)
+    return True
+
+
+def clone_tree(src: str, dst: str, old: str, new: str) -> dict:
+    """Clone the directory tree at src to dst, replacing the path old with new
+
+    dst must not exist.
+
+    :return: a count of how many files were reflinked, hardlinked, copied,
+             and rewritten
+    """
+    counts = {"reflinked": 0, "hardlinked": 0, "copied": 0, "rewritten": 0}
+    can_reflink = True
+    can_hardlink = True
+    old_bytes = os.fsencode(old)
+    new_bytes = os.fsencode(new)
+    for dirpath, dirnames, filenames in os.walk(src):
+        relative = os.path.relpath(dirpath, src)
+        target_dir = os.path.normpath(os.path.join(dst, relative))
+        os.makedirs(target_dir)
+        shutil.copystat(dirpath, target_dir)
+        in_packages = relative.split(os.sep)[0] in HARDLINK_DIRS
+
+        # os.walk lists symlinks to directories as directories
+        for name in dirnames + filenames:
+            source = os.path.join(dirpath, name)
+            target = os.path.join(target_dir, name)
+            if os.path.islink(source):
+                link = os.readlink(source)
+                if link.startswith(old):
+                    link = new + link[len(old) :]
+                os.symlink(link, target)
+                if name in dirnames:
+                    # don't descend into it
+                    dirnames.remove(name)
+                continue
+            if name in dirnames:
+                continue
+
+            if not in_packages and _rewrite(source, target, old_bytes, new_bytes):
+                counts["rewritten"] += 1
+            elif can_reflink and reflink(source, target):
+                counts["reflinked"] += 1
+            elif in_packages and can_hardlink and hardlink(source, target):
+                can_reflink = False
+                counts["hardlinked"] += 1
+            else:
+                can_reflink = False
+                if in_packages:
+                    # on another filesystem, or owned by someone else
+                    can_hardlink = False
+                shutil.copy2(source, target)
+                counts["copied"] += 1
+    return counts
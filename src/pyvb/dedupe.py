@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Replace identical files in different environments with hardlinks to one copy
+
+Only package files are considered, which pip replaces rather than edits, so
+an environment can never change a file it shares with another one. Like
+clone_tree(), we leave scripts and configuration files alone, because they
+contain the path of their environment.
+"""
+
+import json
+import os
+from stat import S_ISREG
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from . import files, locations
+from .clone import HARDLINK_DIRS
+
+
+class HashIndex:
+    """A cache of file hashes, so unchanged files don't have to be read again
+
+    Each path is stored with the device, inode, size, and modification time
+    it had when it was hashed. If any of those have changed, the file is
+    hashed again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(locations.cache_dir(), "dedupe.json")
+        self.path = path
+        self.entries = {}
+        self._seen = set()
+        self.hashed = 0
+
+    def load(self):
+        """Read the index from disk, starting empty if it's missing or unreadable"""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = {}
+        self.entries = entries if isinstance(entries, dict) else {}
+
+    def digest(self, path: str, stat: os.stat_result) -> str:
+        """Return the sha256 of a file, from the index if it hasn't changed"""
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        self._seen.add(path)
+        signature = [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        entry = self.entries.get(path)
+        if entry and entry[:4] == signature:
+            return entry[4]
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(block)
+        self.hashed += 1
+        self.entries[path] = signature + [sha.hexdigest()]
+        return sha.hexdigest()
+
+    def update(self, path: str, stat: os.stat_result, digest: str):
+        """Record the hash of a file we know"""
+        self._seen.add(path)
+        signature = [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        self.entries[path] = signature + [digest]
+
+    def save(self):
+        """Atomically write the index, dropping files we didn't see this time"""
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        entries = {path: self.entries[path] for path in self._seen}
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".dedupe-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(entries, file)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+
+def package_files(root: str) -> Iterator[str]:
+    """Yield the package files in an environment which may be shared"""
+    for top in HARDLINK_DIRS:
+        top = os.path.join(root, top)
+        # lib64 is usually a symlink to lib, don't walk it twice
+        if os.path.islink(top):
+            continue
+        for directory, _, filenames in os.walk(top):
+            for name in filenames:
+                yield os.path.join(directory, name)
+
+
+def _same(stat: os.stat_result, other: os.stat_result) -> bool:
+    """Check if two stats are of the same, unchanged file"""
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns) == (
+        other.st_dev,
+        other.st_ino,
+        other.st_size,
+        other.st_mtime_ns,
+    )
+
+
+def replace_with_link(original: str, path: str, stat: os.stat_result) -> bool:
+    """Atomically replace path with a hardlink to original
+
+    The link is made next to path and renamed over it, so anything opening
+    path sees either the old file or the new one. Processes which already
+    have it open keep the old file.
+
+    :stat: the stat of path when it was hashed
+    :return: False if path changed since it was hashed, so it was left alone
+    """
+    tmpname = "{}.pyvb-dedupe-{}".format(path, os.getpid())
+    os.link(original, tmpname)
+    try:
+        if not _same(os.lstat(path), stat):
+            os.unlink(tmpname)
+            return False
+        os.replace(tmpname, path)
+    except BaseException:
+        if os.path.lexists(tmpname):
+            os.unlink(tmpname)
+        raise
+    return True
+
+
+def deduplicate(
+    roots: Iterable[str],
+    index: HashIndex,
+    dryrun: bool = False,
+    report: Optional[Callable[[str], None]] = None,
+) -> Tuple[int, int]:
+    """Hardlink identical package files in the environments in roots
+
+    :roots: the real directories of the environments
+    :index: the file hashes from last time
+    :dryrun: work out what would be linked, but don't link anything
+    :report: called with a message for each file which can't be linked
+    :return: a tuple of the number of files linked, and the bytes saved
+
+    Files are only linked if they are on the same filesystem and have the
+    same permissions and owner. Bytes are saved when the last link to a
+    file is replaced.
+    """
+    originals = {}
+    # links left to each inode we are replacing, so we can tell when it's freed
+    remaining = {}
+    linked = 0
+    saved = 0
+    for root in roots:
+        for path in package_files(root):
+            try:
+                stat = os.lstat(path)
+                if not S_ISREG(stat.st_mode) or not stat.st_size:
+                    continue
+                digest = index.digest(path, stat)
+            except OSError:
+                continue
+            key = (
+                stat.st_dev,
+                stat.st_size,
+                digest,
+                stat.st_mode,
+                stat.st_uid,
+                stat.st_gid,
+            )
+            original = originals.setdefault(key, (path, stat))
+            if original[1].st_ino == stat.st_ino:
+                continue
+            if not dryrun:
+                try:
+                    original_stat = os.lstat(original[0])
+                    if not _same(original_stat, original[1]):
+                        # it has changed, so use this file from now on
+                        originals[key] = (path, stat)
+                        continue
+                    if not replace_with_link(original[0], path, stat):
+                        continue
+                except OSError as err:
+                    if report:
+                        report("can't link {}: {}".format(path, err))
+                    continue
+                index.update(path, original_stat, digest)
+            linked += 1
+            inode = (stat.st_dev, stat.st_ino)
+            remaining.setdefault(inode, stat.st_nlink)
+            remaining[inode] -= 1
+            if remaining[inode] == 0:
+                saved += stat.st_blocks * 512
+    return linked, saved
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Find out about pyenv by reading its files instead of running it
+
+Running pyenv means running a pile of bash, which costs tens to hundreds of
+milliseconds each time. The functions here read the same information
+straight from disk. Each returns None when the layout on disk isn't one we
+recognize, so the caller can fall back to running pyenv.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+from . import locations
+
+PYENV_VERSION_RE = re.compile(r'^version="([^"]+)"', re.MULTILINE)
+
+
+def pyenv_version() -> Optional[str]:
+    """Return the version of pyenv in the same format as `pyenv --version`"""
+    import shutil  # pylint: disable=import-outside-toplevel
+
+    executable = shutil.which("pyenv")
+    if not executable:
+        return None
+    libexec = os.path.dirname(os.path.realpath(executable))
+    try:
+        with open(os.path.join(libexec, "pyenv---version"), encoding="utf-8") as file:
+            match = PYENV_VERSION_RE.search(file.read())
+    except OSError:
+        return None
+    if not match:
+        return None
+    return "pyenv {}".format(match.group(1))
+
+
+def available_pythons() -> Optional[List[str]]:
+    """Return the python versions pyenv can install, like `pyenv install --list`
+
+    These are the names of the python-build definition files, including any
+    in the directories listed in $PYTHON_BUILD_DEFINITIONS.
+    """
+    builtin = locations.python_build_definitions()
+    if not builtin:
+        return None
+    directories = [builtin]
+    custom = os.environ.get("PYTHON_BUILD_DEFINITIONS")
+    if custom:
+        directories.extend(x for x in custom.split(":") if x)
+
+    pythons = set()
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                pythons.update(x.name for x in entries if x.is_file())
+        except OSError:
+            continue
+    return sort_versions(pythons)
+
+
+def is_installed(version: str) -> bool:
+    """Check if pyenv has a python version installed"""
+    python = os.path.join(locations.versions_dir(), version, "bin", "python")
+    return os.path.isfile(python)
+
+
+def sort_versions(versions) -> List[str]:
+    """Sort versions the way python-build does for `pyenv install --list`
+
+    >>> sort_versions(['3.10.0', '3.9-dev', '3.9.1', 'pypy3.6-7.3.0', '2.7.18'])
+    ['2.7.18', '3.9-dev', '3.9.1', '3.10.0', 'pypy3.6-7.3.0']
+    """
+
+    def key(version):
+        # mirror the sed and sort commands in python-build: fields are
+        # separated by dots, dashes, and pluses; the first field sorts as text
+        # and the next four numerically, with whole lines breaking ties
+        line = re.sub(r"[+-]", ".", version)
+        line = re.sub(r".p(\d)", r".z.\1", line, count=1) + ".z"
+        fields = line.split(".")
+        numeric = []
+        for field in fields[1:5]:
+            match = re.match(r"\d+", field)
+            numeric.append(int(match.group(0)) if match else 0)
+        numeric.extend([0] * (4 - len(numeric)))
+        return (fields[0], numeric, line)
+
+    return sorted(versions, key=key)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+The environments pyvb builds
+"""
+
+import os
+import re
+
+from . import locations
+
+
+# pylint: disable=too-few-public-methods
+class Environment:
+    """Data class to hold info about a particular python environment"""
+
+    majmin_re = re.compile(r"\d+\.\d+")
+
+    def __init__(self, name=None, version=None, requirements=None):
+        self.name = name
+        self.version = version
+        # path to a requirements file to install in the environment
+        self.requirements = requirements
+        # while this environment is being rebuilt, the Environment it's built in
+        self.staging = None
+
+    @property
+    def major_minor(self):
+        """return a string of the major and minor components of the version"""
+        if self.version:
+            match = re.match(self.majmin_re, self.version)
+            if match:
+                return match.group(0)
+        return None
+
+    @property
+    def path(self):
+        """return the directory pyenv keeps this environment in"""
+        return os.path.join(locations.versions_dir(), self.name)
+
+    def make_staging(self):
+        """return an Environment with a unique temporary name to build this one in"""
+        import uuid  # pylint: disable=import-outside-toplevel
+
+        name = "{}-pyvb-{}".format(self.name, uuid.uuid4().hex[:8])
+        self.staging = Environment(name, self.version, self.requirements)
+        return self.staging
+
+    def is_healthy(self):
+        """return True if this environment exists and its python is runnable
+
+        The python in a virtualenv is a symlink to the base interpreter, so
+        this also checks that the base interpreter is still installed.
+        """
+        python = os.path.join(self.path, "bin", "python")
+        return os.path.isfile(os.path.join(self.path, "pyvenv.cfg")) and os.access(
+            python, os.X_OK
+        )
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A history of how long each kind of step took, to plan and predict later runs
+"""
+
+import json
+import os
+import platform
+import threading
+from typing import Optional
+
+from . import files, locations
+
+# seconds to assume when a step has never been timed
+DEFAULT_SECONDS = {
+    "install": 300,
+    "template": 10,
+    "create": 10,
+    "clone": 1,
+    "wheels": 60,
+    "requirements": 20,
+    "sync": 5,
+}
+
+# how much a new duration moves the average, the rest is the history
+WEIGHT = 0.3
+
+
+class History:
+    """A small json file of the average duration of steps on each host
+
+    Durations are keyed by the kind of step, the python version, the build
+    profile, and the host, because compiling the same python takes very
+    different amounts of time on a laptop and a build server.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(locations.state_dir(), "history.json")
+        self.path = path
+        self.host = platform.node()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: str, version: str, profile: Optional[str], host: str) -> str:
+        return " ".join([kind, version, profile or "default", host])
+
+    def durations(self) -> dict:
+        """Return a dictionary of key to average seconds and number of samples"""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        durations = data.get("durations") if isinstance(data, dict) else None
+        return durations if isinstance(durations, dict) else {}
+
+    def record(self, kind: str, version: str, profile: Optional[str], seconds: float):
+        """Add how long a step took to the history"""
+        key = self._key(kind, version, profile, self.host)
+        with self._lock:
+            durations = self.durations()
+            entry = durations.get(key)
+            if entry:
+                average = entry["seconds"] * (1 - WEIGHT) + seconds * WEIGHT
+                entry = {"seconds": average, "count": entry["count"] + 1}
+            else:
+                entry = {"seconds": seconds, "count": 1}
+            durations[key] = entry
+            self._write(durations)
+
+    def estimate(
+        self, kind: str, version: str, profile: Optional[str] = None
+    ) -> Optional[float]:
+        """Return how long a step is likely to take, or None if we have no idea
+
+        We use the average for this host if there is one, then the average on
+        other hosts, then the average for other versions on this host. The
+        fallbacks only use steps of the same kind and profile, because an
+        optimized build takes far longer than a default one.
+        """
+        durations = self.durations()
+        entry = durations.get(self._key(kind, version, profile, self.host))
+        if entry:
+            return entry["seconds"]
+        same_version = self._key(kind, version, profile, "")
+        others = [
+            entry["seconds"]
+            for key, entry in durations.items()
+            if key.startswith(same_version)
+        ]
+        if not others:
+            same_profile = self._key(kind, "", profile, self.host)
+            others = [
+                entry["seconds"]
+                for key, entry in durations.items()
+                if self._without_version(key) == same_profile
+            ]
+        if others:
+            return sum(others) / len(others)
+        return None
+
+    @staticmethod
+    def _without_version(key: str) -> str:
+        parts = key.split(" ")
+        if len(parts) == 4:
+            parts[1] = ""
+        return " ".join(parts)
+
+    def _write(self, durations: dict):
+        """Atomically replace the history file"""
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".history-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump({"durations": durations}, file, indent=2, sort_keys=True)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A journal of the steps a run has finished, so an interrupted run can be resumed
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Hashable, List, Optional
+
+from . import locations
+
+
+class Journal:
+    """An append only file with a line for each step which has finished
+
+    There is a journal for each target, ie a basename or a batch file, so
+    runs for different targets don't forget each other's progress. Each run
+    starts a new journal for its target, and the first line records its
+    arguments. Steps are identified by their scheduler key, like
+    ('install', '3.8.1') or ('replace', 'fred-3.8.1'). A line is written as
+    soon as each step finishes, so if the run is killed the journal still
+    says what was done. A partly written last line is ignored.
+    """
+
+    def __init__(self, target: str = "", path: Optional[str] = None):
+        if path is None:
+            import hashlib  # pylint: disable=import-outside-toplevel
+
+            digest = hashlib.sha256(target.encode("utf-8")).hexdigest()[:16]
+            path = os.path.join(
+                locations.state_dir(), "journals", "{}.jsonl".format(digest)
+            )
+        self.path = path
+        self._lock = threading.Lock()
+
+    def start(self, argv: List[str]):
+        """Begin a new journal for a run, forgetting the previous one"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"run": time.time(), "argv": argv}) + "\n")
+
+    def record(self, key: Hashable):
+        """Record that a step has finished"""
+        line = json.dumps({"done": key, "time": time.time()}) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+    def argv(self) -> Optional[List[str]]:
+        """Return the arguments of the run which started the journal
+
+        :return: None if there is no journal
+        """
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                entry = json.loads(file.readline())
+        except (OSError, ValueError):
+            return None
+        return entry.get("argv") if isinstance(entry, dict) else None
+
+    def completed(self) -> set:
+        """Return the keys of the finished steps, as json strings
+
+        Compare them with json.dumps(key), because tuples in keys come back
+        from json as lists.
+        """
+        done = set()
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict) and "done" in entry:
+                        done.add(json.dumps(entry["done"]))
+        except OSError:
+            pass
+        return done
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Locations on disk used by pyenv and pyvb
+"""
+
+import os
+from typing import Optional
+
+
+def pyenv_root() -> str:
+    """Return the root directory of the pyenv installation
+
+    This honors $PYENV_ROOT, and falls back to ~/.pyenv like pyenv does.
+    """
+    root = os.environ.get("PYENV_ROOT")
+    if not root:
+        root = os.path.join(os.path.expanduser("~"), ".pyenv")
+    return root
+
+
+def versions_dir() -> str:
+    """Return the directory where pyenv installs pythons and virtualenvs"""
+    return os.path.join(pyenv_root(), "versions")
+
+
+def state_dir() -> str:
+    """Return the directory where pyvb keeps track of what it has built
+
+    This lives inside $PYENV_ROOT, next to the pythons and environments it
+    describes.
+    """
+    return os.path.join(pyenv_root(), "pyvb")
+
+
+def python_build_definitions() -> Optional[str]:
+    """Return the directory containing the python-build definitions, or None
+
+    The definitions are the files which `pyenv install --list` reports. They
+    are usually in the python-build plugin inside $PYENV_ROOT, but when pyenv
+    was installed by a package manager they live next to the pyenv executable.
+    """
+    import shutil  # pylint: disable=import-outside-toplevel
+
+    candidates = [
+        os.path.join(pyenv_root(), "plugins", "python-build", "share", "python-build")
+    ]
+    executable = shutil.which("pyenv")
+    if executable:
+        # bin/pyenv is a symlink to libexec/pyenv, so go up two levels
+        prefix = os.path.dirname(os.path.dirname(os.path.realpath(executable)))
+        candidates.append(
+            os.path.join(prefix, "plugins", "python-build", "share", "python-build")
+        )
+        candidates.append(os.path.join(prefix, "share", "python-build"))
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            return candidate
+    return None
+
+
+def cache_dir() -> str:
+    """Return the directory where pyvb caches things, ie ~/.cache/pyvb
+
+    This honors $XDG_CACHE_HOME.
+    """
+    base = os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pyvb")
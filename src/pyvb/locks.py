@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Locks shared between pyvb processes, so concurrent runs don't duplicate work
+"""
+
+import os
+import time
+from typing import Callable, Optional
+
+from . import locations
+
+
+def lock_path(kind: str, name: str) -> str:
+    """Return the lock file for something pyvb builds, like a python or environment"""
+    return os.path.join(locations.state_dir(), "locks", "{}-{}.lock".format(kind, name))
+
+
+class FileLock:
+    """An exclusive lock on a file, held until it is released
+
+    The lock is taken with flock(), so the kernel releases it if the process
+    dies, and a stale lock file never blocks anyone.
+
+    >>> lock = FileLock(str(getfixture('tmp_path') / 'python-3.8.1.lock'))
+    >>> lock.acquire()
+    0.0
+    >>> FileLock(lock.path).acquire(timeout=0)
+    Traceback (most recent call last):
+    ...
+    TimeoutError: ...
+    >>> lock.release()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(
+        self, waiting: Optional[Callable] = None, timeout: Optional[float] = None
+    ) -> float:
+        """Take the lock, waiting for another process to release it
+
+        :waiting: called before we start waiting, if the lock is held elsewhere
+        :timeout: raise TimeoutError if we have waited this many seconds
+        :return: how many seconds we waited
+        """
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # pylint: disable=consider-using-with
+        file = open(self.path, "a", encoding="utf-8")
+        start = time.perf_counter()
+        try:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if waiting:
+                    waiting()
+                self._wait(file, start, timeout)
+            else:
+                start = None
+        except BaseException:
+            file.close()
+            raise
+        self._file = file
+        return 0.0 if start is None else time.perf_counter() - start
+
+    @staticmethod
+    def _wait(file, start: float, timeout: Optional[float]):
+        """Block until we have the lock on file"""
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        if timeout is None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            return
+        while True:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.perf_counter() - start >= timeout:
+                    raise TimeoutError("{} is locked".format(file.name)) from None
+                time.sleep(0.1)
+
+    def release(self):
+        """Release the lock, if we hold it"""
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A record of the environments pyvb has built
+"""
+
+import contextlib
+import json
+import os
+import time
+from typing import Optional
+
+from . import files, locations
+from .locks import FileLock
+
+
+class Manifest:
+    """A small json file recording each environment pyvb has created
+
+    For each environment name we keep the python version it was built from,
+    a fingerprint of how it was built, and when. Environments which are in
+    the manifest are considered to be managed by pyvb.
+
+    For each python we keep when pyvb last used it, and whether pyvb
+    installed it, so unused pythons can be garbage collected, and which build
+    profile it was installed with.
+
+    Updates hold a lock on a file next to the manifest, so concurrent pyvb
+    processes don't lose each other's changes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(locations.state_dir(), "manifest.json")
+        self.path = path
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the manifest lock while we read, change, and replace the file"""
+        lock = FileLock(self.path + ".lock")
+        lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _read(self, section: str) -> dict:
+        """Return one section of the manifest file"""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        entries = data.get(section) if isinstance(data, dict) else None
+        return entries if isinstance(entries, dict) else {}
+
+    def environments(self) -> dict:
+        """Return a dictionary of environment name to manifest entry"""
+        return self._read("environments")
+
+    def pythons(self) -> dict:
+        """Return a dictionary of python version to manifest entry"""
+        return self._read("pythons")
+
+    def get(self, name: str) -> Optional[dict]:
+        """Return the manifest entry for an environment, or None"""
+        return self.environments().get(name)
+
+    def record(self, name: str, version: str, fingerprint: str, **extra):
+        """Record that an environment has been built"""
+        entry = {
+            "version": version,
+            "fingerprint": fingerprint,
+            "created": time.time(),
+        }
+        entry.update(extra)
+        with self._locked():
+            environments = self.environments()
+            environments[name] = entry
+            self._write(environments=environments)
+
+    def remove(self, name: str):
+        """Forget about an environment"""
+        with self._locked():
+            environments = self.environments()
+            if environments.pop(name, None) is not None:
+                self._write(environments=environments)
+
+    def record_python(
+        self, version: str, installed: bool = False, profile: Optional[str] = None
+    ):
+        """Record that a python has been used to build an environment
+
+        :installed: True if pyvb installed this python just now
+        :profile: the build profile pyvb installed it with, None for the default
+        """
+        with self._locked():
+            pythons = self.pythons()
+            entry = pythons.get(version) or {"installed": False}
+            entry["used"] = time.time()
+            if installed:
+                entry["installed"] = True
+                entry["profile"] = profile
+            pythons[version] = entry
+            self._write(pythons=pythons)
+
+    def remove_python(self, version: str):
+        """Forget about a python"""
+        with self._locked():
+            pythons = self.pythons()
+            if pythons.pop(version, None) is not None:
+                self._write(pythons=pythons)
+
+    def _write(self, **sections):
+        """Atomically replace the manifest file"""
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        data = {
+            "environments": self.environments(),
+            "pythons": self.pythons(),
+        }
+        data.update(sections)
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(data, file, indent=2, sort_keys=True)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
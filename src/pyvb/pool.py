@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+A reserve of environments built ahead of time, ready to be claimed
+"""
+
+import json
+import os
+import re
+from typing import Iterator, List, Optional
+
+from . import files, locations
+
+PREFIX = "pyvb-pool-"
+
+
+class Pool:
+    """Environments waiting in $PYENV_ROOT/versions to be claimed
+
+    Each pool environment is an ordinary pyenv-virtualenv environment named
+    pyvb-pool-VERSION-XXXXXXXX. Claiming one renames its symlink in
+    $PYENV_ROOT/versions, which is atomic, so when many processes claim at
+    once each environment goes to exactly one of them.
+
+    How many environments to keep for each python version is kept in a small
+    json file, so the pool can be refilled without being told the size again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = os.path.join(locations.state_dir(), "pool.json")
+        self.path = path
+
+    @staticmethod
+    def entry_name(version: str) -> str:
+        """Return a new, unique name for a pool environment"""
+        import uuid  # pylint: disable=import-outside-toplevel
+
+        return "{}{}-{}".format(PREFIX, version, uuid.uuid4().hex[:8])
+
+    @staticmethod
+    def entries(version: str) -> List[str]:
+        """Return the names of the pool environments for a python version
+
+        Environments which are still being built have a different name, so
+        only finished ones are included.
+        """
+        pattern = re.compile(r"{}{}-[0-9a-f]{{8}}$".format(PREFIX, re.escape(version)))
+        versions = locations.versions_dir()
+        try:
+            names = os.listdir(versions)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name
+            for name in names
+            if pattern.match(name) and os.path.islink(os.path.join(versions, name))
+        )
+
+    def claim(self, version: str, name: str) -> Optional[str]:
+        """Take a pool environment for a python version and rename it to name
+
+        :return: the pool name of the environment which was claimed, or None
+                 if the pool is empty
+        """
+        versions = locations.versions_dir()
+        for entry in self._candidates(version):
+            try:
+                os.rename(os.path.join(versions, entry), os.path.join(versions, name))
+            except FileNotFoundError:
+                # someone else claimed it first
+                continue
+            return entry
+        return None
+
+    def _candidates(self, version: str) -> Iterator[str]:
+        """Yield pool environments to try to claim
+
+        Start at a different place for each process, so that concurrent
+        claimants don't all race for the same environment.
+        """
+        entries = self.entries(version)
+        if entries:
+            start = os.getpid() % len(entries)
+            yield from entries[start:] + entries[:start]
+
+    def sizes(self) -> dict:
+        """Return a dictionary of python version to the number of environments to keep"""
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        sizes = data.get("sizes") if isinstance(data, dict) else None
+        return sizes if isinstance(sizes, dict) else {}
+
+    def size(self, version: str) -> int:
+        """Return the number of environments to keep for a python version"""
+        return self.sizes().get(version, 0)
+
+    def set_size(self, version: str, size: int):
+        """Remember the number of environments to keep for a python version"""
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        sizes = self.sizes()
+        sizes[version] = size
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=directory, prefix=".pool-")
+        files.share(fd)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump({"sizes": sizes}, file, indent=2, sort_keys=True)
+            os.replace(tmpname, self.path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def lock(self):
+        """Return an open file holding an exclusive lock on the pool
+
+        Only one process at a time should fill the pool, otherwise concurrent
+        refills would each build the missing environments. Close the file to
+        release the lock.
+        """
+        import fcntl  # pylint: disable=import-outside-toplevel
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # pylint: disable=consider-using-with
+        file = open(self.path + ".lock", "a", encoding="utf-8")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        except BaseException:
+            file.close()
+            raise
+        return file
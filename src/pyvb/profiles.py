@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Named build profiles, which tell python-build how to compile a python
+"""
+
+import os
+from typing import Dict, Optional
+
+# fast builds a python as quickly as possible, optimized builds one which runs
+# as quickly as possible
+PROFILES = ["fast", "optimized"]
+
+OPTIMIZED_CONFIGURE_OPTS = "--enable-optimizations --with-lto"
+
+
+def profile_environ(
+    profile: Optional[str], environ: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """Return the environment to run python-build in for a build profile
+
+    :profile: one of PROFILES, or None to use the environment as it is
+    :environ: the environment to start from, default os.environ
+
+    Settings already in the environment are kept, the profile adds to them.
+
+    >>> env = profile_environ("optimized", {"PYTHON_CONFIGURE_OPTS": "--enable-shared"})
+    >>> env["PYTHON_CONFIGURE_OPTS"]
+    '--enable-shared --enable-optimizations --with-lto'
+    """
+    environ = dict(os.environ if environ is None else environ)
+    if profile is None:
+        pass
+    elif profile == "fast":
+        # parallel make, unless the user already said how to run make
+        if not environ.get("MAKE_OPTS") and not environ.get("MAKEOPTS"):
+            environ["MAKE_OPTS"] = "-j{}".format(os.cpu_count() or 1)
+        # and a compiler cache, if there is one
+        import shutil  # pylint: disable=import-outside-toplevel
+
+        compiler = environ.get("CC") or "cc"
+        if shutil.which("ccache") and not compiler.startswith("ccache"):
+            environ["CC"] = "ccache {}".format(compiler)
+    elif profile == "optimized":
+        options = environ.get("PYTHON_CONFIGURE_OPTS", "").split()
+        for option in OPTIMIZED_CONFIGURE_OPTS.split():
+            if option not in options:
+                options.append(option)
+        environ["PYTHON_CONFIGURE_OPTS"] = " ".join(options)
+    else:
+        raise ValueError("unknown build profile: {}".format(profile))
+    return environ
@@ -24,31 +24,32 @@
 Entry point for 'pyvb' command line program
 """
 
-import argparse
+import contextlib
+import json
+import os
 import subprocess
 import re
-from typing import List
+import sys
+import threading
+import time
+from typing import Iterator, List
 
 import pyvb
+from . import discovery, locations
+from .catalog import CatalogCache, parse_catalog
+from .environment import Environment
+from .history import DEFAULT_SECONDS, History
+from .journal import Journal
+from .locks import FileLock, lock_path
+from .manifest import Manifest
+from .profiles import PROFILES, profile_environ
+from .resources import ResourceBudget, estimate_build
+from .scheduler import DONE, Scheduler
+from .timing import SUBPROCESS, Tracer, format_duration
+from .versions import StreamingVersionIndex, VersionIndex
 
-# pylint: disable=too-few-public-methods
-class Environment:
-    """Data class to hold info about a particular python environment"""
-
-    majmin_re = re.compile(r"\d+\.\d+")
-
-    def __init__(self, name=None, version=None):
-        self.name = name
-        self.version = version
-
-    @property
-    def major_minor(self):
-        """return a string of the major and minor components of the version"""
-        if self.version:
-            match = re.match(self.majmin_re, self.version)
-            if match:
-                return match.group(0)
-        return None
+# the name the template environment for a python version is created with
+TEMPLATE_NAME = "pyvb-template-{}"
 
 
 class Pyvb:
@@ -58,16 +59,69 @@ class Pyvb:
         """initialize"""
         self.dryrun = False
         self.verbose = False
+        self.jobs = 1
+        self.refresh_catalog = False
+        self.incremental = False
+        self.sync = False
+        self.resume = False
+        self.journal = None
+        self.manifest = Manifest()
+        self._pool = None
+        self.tracer = Tracer()
+        self.history = History()
+        self.artifact_cache = None
+        self.profile = None
+        # estimated cpus and bytes of memory one compile needs, None to guess
+        self.compile_cpus = None
+        self.compile_memory = None
+        self.compile_budget = ResourceBudget()
+        self.template = False
+        self.dedupe = False
+        self.requirements = None
+        self.catalog_cache = CatalogCache()
         self._all_pythons = None
+        self._version_index = None
+        # python versions which were asked for, but aren't available
+        self.unresolved = []
+        self._pyenv_version = None
+        self._install_locks = {}
+        self._install_locks_lock = threading.Lock()
+        # locks on environments being built, by name, shared with other processes
+        self._environment_locks = {}
+        self._deletions = []
+        self._resumed = set()
+        # the scheduler which is running, so status messages can show an ETA
+        self._scheduler = None
+
+    @property
+    def pool(self):
+        """The pool of spare environments, only loaded by the commands which use it"""
+        if self._pool is None:
+            from .pool import Pool  # pylint: disable=import-outside-toplevel
+
+            self._pool = Pool()
+        return self._pool
 
     def _build_parser(self):
         """Build the argument parser"""
+        # importing argparse is slow, don't do it unless we have arguments to parse
+        import argparse  # pylint: disable=import-outside-toplevel
+
         parser = argparse.ArgumentParser(
             description="Create pyenv and virtualenv python environments",
+            epilog="""Use 'pyvb pool --help' to build environments ahead of time,
+            'pyvb gc --help' to remove pythons which are no longer used,
+            'pyvb dedupe --help' to share identical files between environments, and
+            'pyvb export --help' and 'pyvb import --help' to copy a python and its
+            environments to another host.""",
         )
 
         basename_help = "the base environment name"
-        parser.add_argument("basename", help=basename_help)
+        parser.add_argument("basename", nargs="?", help=basename_help)
+
+        batch_help = """Build environments for all the projects listed in FILE, a TOML
+        file, instead of for a single basename"""
+        parser.add_argument("--batch", metavar="FILE", help=batch_help)
 
         # write_help = 'write created environment names to .python-version in the current directory'
         # parser.add_argument('-w', '--write', action='store_true', help=write_help)
@@ -75,6 +129,50 @@ class Pyvb:
         # append_help = 'created environment names to .python-version in the current directory'
         # parser.add_argument('-a', '--append', action='store_true', help=append_help)
 
+        self._add_build_arguments(parser)
+
+        incremental_help = """Leave existing environments alone if they were built by pyvb
+        from the same python with the same options, and are still healthy."""
+        parser.add_argument(
+            "--incremental",
+            "-i",
+            action="store_true",
+            default=False,
+            help=incremental_help,
+        )
+
+        sync_help = """Update existing environments in place where possible, instead
+        of rebuilding them. Packages are installed or removed to match the
+        requirements, which must pin every package, like the output of pip-compile.
+        Environments are still rebuilt if their python has been reinstalled."""
+        parser.add_argument(
+            "--sync", action="store_true", default=False, help=sync_help
+        )
+
+        resume_help = """Carry on from where the last run for the same basename or
+        batch file stopped, skipping the pythons and environments it finished which
+        are still healthy and up to date. The other arguments must be the same."""
+        parser.add_argument(
+            "--resume", action="store_true", default=False, help=resume_help
+        )
+
+        requirements_help = """Install the packages in FILE in each environment. Wheels
+        are built once for each python version, and shared by every environment
+        which uses it."""
+        parser.add_argument(
+            "--requirements", "-r", metavar="FILE", help=requirements_help
+        )
+
+        version_help = "show the version of pyvb and exit"
+        parser.add_argument(
+            "--version", action="version", version=pyvb.__version__, help=version_help
+        )
+
+        return parser
+
+    @staticmethod
+    def _add_build_arguments(parser):
+        """Add the arguments which control how environments are built"""
         pythons_help = """Specify python versions. Default latest patch release for all
         supported minor versions. Use more than once or separate versions with commas to
         specify multiple versions.
@@ -93,9 +191,163 @@ class Pyvb:
             "-v", "--verbose", action="store_true", default=False, help=verbose_help
         )
 
-        version_help = "show the version of pyvb and exit"
+        jobs_help = """Number of environments to build at the same time. Default is 1,
+        which builds each environment in turn."""
         parser.add_argument(
-            "--version", action="version", version=pyvb.__version__, help=version_help
+            "--jobs", "-j", type=int, default=1, metavar="N", help=jobs_help
+        )
+
+        timings_help = "Show how long each step took when finished"
+        parser.add_argument(
+            "--timings", action="store_true", default=False, help=timings_help
+        )
+
+        trace_help = """Write how long each step took to FILE, in Chrome trace-event
+        format, which you can view with Perfetto or chrome://tracing"""
+        parser.add_argument("--trace", metavar="FILE", help=trace_help)
+
+        template_help = """Build one pristine environment for each python version, and
+        create environments by cloning it instead of running pyenv virtualenv"""
+        parser.add_argument(
+            "--template", action="store_true", default=False, help=template_help
+        )
+
+        profile_help = """How to compile pythons which aren't installed. fast uses
+        parallel make and ccache, optimized uses profile guided optimization and link
+        time optimization, which takes much longer but makes python faster. Default is
+        to use python-build's settings from the environment. Pythons pyvb installed
+        with a different profile are rebuilt."""
+        parser.add_argument("--profile", choices=PROFILES, help=profile_help)
+
+        compile_cpus_help = """How many cpus one compile of python uses. Compiles
+        are only started while they fit in the cpus which aren't busy. Default is
+        the number of make jobs, which python-build sets to the number of cpus,
+        divided by --jobs."""
+        parser.add_argument(
+            "--compile-cpus", type=int, metavar="N", help=compile_cpus_help
+        )
+
+        compile_memory_help = """How much memory one compile of python needs, like
+        1500M. Compiles are only started while there is enough memory available.
+        Default is 1G, or 3G for the optimized profile."""
+        parser.add_argument(
+            "--compile-memory", metavar="SIZE", help=compile_memory_help
+        )
+
+        artifact_help = """Keep compiled pythons in DIR, and restore them from there
+        instead of compiling them again. DIR can be shared between hosts."""
+        parser.add_argument("--artifact-cache", metavar="DIR", help=artifact_help)
+
+        artifact_size_help = """Remove the least recently used pythons from the artifact
+        cache when it is larger than SIZE, like 500M or 20G"""
+        parser.add_argument(
+            "--artifact-cache-size", metavar="SIZE", help=artifact_size_help
+        )
+
+        dedupe_help = """When finished, hardlink identical package files in all the
+        environments pyvb has built, like pyvb dedupe"""
+        parser.add_argument(
+            "--dedupe", action="store_true", default=False, help=dedupe_help
+        )
+
+        refresh_help = "Fetch the list of available pythons from pyenv, not the cache"
+        parser.add_argument(
+            "--refresh-catalog", action="store_true", default=False, help=refresh_help
+        )
+
+    def _build_pool_parser(self):
+        """Build the argument parser for pyvb pool"""
+        import argparse  # pylint: disable=import-outside-toplevel
+
+        parser = argparse.ArgumentParser(
+            prog="pyvb pool",
+            description="""Keep environments built ahead of time, so they can be
+            claimed without waiting for them to be built""",
+        )
+        actions = parser.add_subparsers(dest="action", metavar="ACTION")
+        actions.required = True
+
+        fill_help = "build environments until the pool is full"
+        fill = actions.add_parser("fill", help=fill_help, description=fill_help)
+        size_help = """Keep N environments for each python version. Default is the
+        size given the last time the pool was filled."""
+        fill.add_argument("--size", type=int, metavar="N", help=size_help)
+        self._add_build_arguments(fill)
+
+        claim_help = """take an environment for each python version from the pool,
+        and rename it to basename-version, then refill the pool in the background"""
+        claim = actions.add_parser("claim", help=claim_help, description=claim_help)
+        claim.add_argument("basename", help="the base environment name")
+        no_refill_help = "Don't refill the pool after claiming environments"
+        claim.add_argument(
+            "--no-refill",
+            dest="refill",
+            action="store_false",
+            default=True,
+            help=no_refill_help,
+        )
+        self._add_build_arguments(claim)
+
+        return parser
+
+    @staticmethod
+    def _build_gc_parser():
+        """Build the argument parser for pyvb gc"""
+        import argparse  # pylint: disable=import-outside-toplevel
+
+        parser = argparse.ArgumentParser(
+            prog="pyvb gc",
+            description="""Remove pythons which pyvb installed and no environment uses,
+            least recently used first, and environments left half built by runs
+            which died""",
+        )
+
+        max_size_help = """Only remove pythons until all of them together use no
+        more than SIZE, like 10G"""
+        parser.add_argument("--max-size", metavar="SIZE", help=max_size_help)
+
+        unused_help = "Only remove pythons which haven't been used for DAYS days"
+        parser.add_argument(
+            "--unused-days", type=float, metavar="DAYS", help=unused_help
+        )
+
+        all_help = """Also remove pythons which pyvb didn't install, if no environment
+        uses them"""
+        parser.add_argument("--all", action="store_true", default=False, help=all_help)
+
+        dryrun_help = """Don't remove anything, but show what would be removed and how
+        much space that would reclaim"""
+        parser.add_argument(
+            "--dry-run", "-n", action="store_true", default=False, help=dryrun_help
+        )
+
+        verbose_help = "Show what is removed"
+        parser.add_argument(
+            "-v", "--verbose", action="store_true", default=False, help=verbose_help
+        )
+
+        return parser
+
+    @staticmethod
+    def _build_dedupe_parser():
+        """Build the argument parser for pyvb dedupe"""
+        import argparse  # pylint: disable=import-outside-toplevel
+
+        parser = argparse.ArgumentParser(
+            prog="pyvb dedupe",
+            description="""Replace identical package files in the environments pyvb
+            has built with hardlinks to one copy. File hashes are cached, so only
+            new and changed files are read.""",
+        )
+
+        dryrun_help = "Don't link anything, but show how much space would be saved"
+        parser.add_argument(
+            "--dry-run", "-n", action="store_true", default=False, help=dryrun_help
+        )
+
+        verbose_help = "Display progress information"
+        parser.add_argument(
+            "-v", "--verbose", action="store_true", default=False, help=verbose_help
         )
 
         return parser
@@ -108,9 +360,11 @@ class Pyvb:
 
         Each element in the list can contain a comma separated list of versions
         formatted like MAJOR.MINOR.PATCH. If MINOR or PATCH is omitted, this method
-        will attempt to find the highest MINOR and PATCH in the available list
+        will attempt to find the highest MINOR and PATCH in the available list.
+        Requested versions which aren't available are added to self.unresolved.
         """
         # use a default list if none was provided
+        requested = bool(pythons)
         if not pythons:
             pythons = self.default_pythons()
 
@@ -124,7 +378,7 @@ class Pyvb:
 
         selected = []
         for python in requested_pythons:
-            if python in self.all_pythons():
+            if python in self.version_index():
                 # we have an exact match, use that version
                 selected.append(python)
             else:
@@ -132,12 +386,24 @@ class Pyvb:
                 found = self.find_latest_version(python)
                 if found:
                     selected.append(found)
+                elif requested:
+                    # not finding a default python isn't an error
+                    print("pyvb: no python {} is available".format(python))
+                    self.unresolved.append(python)
         return selected
 
     def status_message(self, msg):
-        """display a status message"""
+        """display a status message
+
+        While environments are being built, the message shows roughly how
+        long is left.
+        """
         if self.verbose:
-            print("pyvb: {}".format(msg))
+            eta = self._scheduler.eta() if self._scheduler else None
+            if eta is None:
+                print("pyvb: {}".format(msg))
+            else:
+                print("pyvb: [{} left] {}".format(format_duration(eta), msg))
 
     def main(self, argv=None):
         """Entry point for 'pyvb' command line program
@@ -145,77 +411,783 @@ class Pyvb:
         :return: an exit code
 
         0 = command completed successfully
-        1 = pyenv, a required dependency, is not installed
+        1 = pyenv, a required dependency, is not installed, one or more
+            environments could not be created, a requested python version
+            isn't available, or the batch file is invalid
         """
+        if argv is None:
+            argv = sys.argv[1:]
+        if argv[:1] == ["pool"]:
+            return self.pool_main(argv[1:])
+        if argv[:1] == ["gc"]:
+            return self.gc_main(argv[1:])
+        if argv[:1] == ["dedupe"]:
+            return self.dedupe_main(argv[1:])
+        if argv[:1] == ["export"]:
+            from .bundle import export_main  # pylint: disable=import-outside-toplevel
+
+            return export_main(self, argv[1:])
+        if argv[:1] == ["import"]:
+            from .bundle import import_main  # pylint: disable=import-outside-toplevel
+
+            return import_main(self, argv[1:])
+
         parser = self._build_parser()
         args = parser.parse_args(argv)
+        if bool(args.basename) == bool(args.batch):
+            parser.error("specify either a basename or --batch, but not both")
+
+        self._configure(parser, args)
+        self.incremental = args.incremental
+        self.sync = args.sync
+        self.resume = args.resume
+        if args.requirements:
+            self.requirements = os.path.abspath(args.requirements)
+
+        if not self.have_pyenv():
+            msg = "{0}: {0} requires pyenv, which is not installed".format(parser.prog)
+            print(msg)
+            return 1
+
+        projects = self._load_projects(parser, args)
+        if projects is None:
+            return 1
+
+        # keep track of what this run finishes, so it can be resumed
+        target = os.path.abspath(args.batch) if args.batch else args.basename
+        run_argv = [arg for arg in argv if arg != "--resume"]
+        self.journal = Journal(target)
+        if self.resume:
+            started = self.journal.argv()
+            if started is not None and started != run_argv:
+                msg = "{}: can't resume, the last run for {} was: {}".format(
+                    parser.prog, target, " ".join(started)
+                )
+                print(msg)
+                return 1
+            self._resumed = self.journal.completed()
+        elif not self.dryrun:
+            self.journal.start(run_argv)
+
+        # decide which pythons each project gets, and build one list of
+        # environments for all of them
+        environments = []
+        with self.tracer.span("resolve"):
+            for project in projects:
+                environments.extend(
+                    self.plan_project(
+                        project.name,
+                        project.pythons or args.python,
+                        project.requirements or self.requirements,
+                    )
+                )
 
+        self.close_catalog()
+
+        # create each environment
+        failed = self.create_environments(environments)
+        self.finish_deletions()
+        if self.dedupe and not self.dryrun:
+            self.dedupe_environments()
+
+        self._report(args)
+        return 1 if failed or self.unresolved else 0
+
+    def pool_main(self, argv):
+        """Entry point for 'pyvb pool'
+
+        :return: an exit code, as for main()
+        """
+        parser = self._build_pool_parser()
+        args = parser.parse_args(argv)
+        if args.action == "fill" and args.size is not None and args.size < 0:
+            parser.error("--size must not be negative")
+        self._configure(parser, args)
+
+        if not self.have_pyenv():
+            msg = "{0}: {0} requires pyenv, which is not installed".format(parser.prog)
+            print(msg)
+            return 1
+
+        if args.action == "fill":
+            failed = self.fill_pool(args.python, args.size)
+        else:
+            failed = self.claim_environments(args.basename, args.python, args.refill)
+        self.close_catalog()
+        self.finish_deletions()
+        if self.dedupe and not self.dryrun:
+            self.dedupe_environments()
+
+        self._report(args)
+        return 1 if failed or self.unresolved else 0
+
+    def gc_main(self, argv):
+        """Entry point for 'pyvb gc'
+
+        :return: an exit code, 1 if something could not be removed
+        """
+        # pylint: disable=import-outside-toplevel
+        from . import cleanup
+        from .artifacts import parse_size
+
+        parser = self._build_gc_parser()
+        args = parser.parse_args(argv)
         self.dryrun = args.dry_run
-        self.verbose = args.verbose
-        if self.dryrun:
-            self.verbose = True
+        self.verbose = args.verbose or args.dry_run
+        max_bytes = None
+        if args.max_size:
+            try:
+                max_bytes = parse_size(args.max_size)
+            except ValueError as err:
+                parser.error(str(err))
+        min_idle = None
+        if args.unused_days is not None:
+            min_idle = args.unused_days * 24 * 60 * 60
 
         if not self.have_pyenv():
             msg = "{0}: {0} requires pyenv, which is not installed".format(parser.prog)
             print(msg)
             return 1
 
-        # decide which minor_pythons we are going to install/use
-        selected_pythons = self.select_pythons(args.python)
+        reclaimed, failed = self.collect_garbage(max_bytes, min_idle, args.all)
+        print(
+            "pyvb: {} {}".format(
+                "would reclaim" if self.dryrun else "reclaimed",
+                cleanup.format_size(reclaimed),
+            )
+        )
+        return 1 if failed else 0
 
-        # build a list of environments
+    def dedupe_main(self, argv):
+        """Entry point for 'pyvb dedupe'
+
+        :return: an exit code
+        """
+        parser = self._build_dedupe_parser()
+        args = parser.parse_args(argv)
+        self.dryrun = args.dry_run
+        self.verbose = args.verbose or args.dry_run
+        self.dedupe_environments()
+        return 0
+
+    def dedupe_environments(self):
+        """Hardlink identical package files in the environments pyvb has built"""
+        from . import cleanup, dedupe  # pylint: disable=import-outside-toplevel
+
+        roots = []
+        for name in sorted(self.manifest.environments()):
+            path = Environment(name).path
+            if os.path.isdir(path):
+                roots.append(os.path.realpath(path))
+        index = dedupe.HashIndex()
+        index.load()
+        self.status_message(
+            "looking for identical files in {} environments".format(len(roots))
+        )
+        with self.tracer.span("dedupe"):
+            linked, saved = dedupe.deduplicate(
+                roots, index, self.dryrun, self.status_message
+            )
+            index.save()
+        print(
+            "pyvb: {} {} files, {} {}".format(
+                "would link" if self.dryrun else "linked",
+                linked,
+                "saving" if self.dryrun else "saved",
+                cleanup.format_size(saved),
+            )
+        )
+        self.status_message("hashed {} new or changed files".format(index.hashed))
+
+    @staticmethod
+    def _load_projects(parser, args):
+        """Return the projects to build, from --batch or the basename
+
+        :return: a list of Projects, or None if the batch file is invalid
+        """
+        # pylint: disable=import-outside-toplevel
+        from .batch import BatchError, Project, load_batch
+
+        if not args.batch:
+            return [Project(args.basename)]
+        try:
+            return load_batch(args.batch)
+        except BatchError as err:
+            print("{}: {}".format(parser.prog, err))
+            return None
+
+    def _configure(self, parser, args):
+        """Apply the arguments added by _add_build_arguments()"""
+        # pylint: disable=import-outside-toplevel
+        self.dryrun = args.dry_run
+        self.verbose = args.verbose
+        self.jobs = max(1, args.jobs)
+        self.refresh_catalog = args.refresh_catalog
+        self.template = args.template
+        self.dedupe = args.dedupe
+        self.profile = args.profile
+        self.compile_cpus = args.compile_cpus
+        if args.compile_memory:
+            from .artifacts import parse_size
+
+            try:
+                self.compile_memory = parse_size(args.compile_memory)
+            except ValueError as err:
+                parser.error(str(err))
+        if args.artifact_cache:
+            from .artifacts import ArtifactCache, parse_size
+
+            max_bytes = None
+            if args.artifact_cache_size:
+                try:
+                    max_bytes = parse_size(args.artifact_cache_size)
+                except ValueError as err:
+                    parser.error(str(err))
+            self.artifact_cache = ArtifactCache(args.artifact_cache, max_bytes)
+        if self.dryrun:
+            self.verbose = True
+
+    def _report(self, args):
+        """Show or write the timings, if the arguments asked for them"""
+        if args.timings:
+            print(self.tracer.summary())
+        if args.trace:
+            self.tracer.write_trace(args.trace)
+
+    def fill_pool(self, pythons, size=None) -> List:
+        """Build pool environments until there are size of them for each python
+
+        :pythons: a list of python versions, as passed to select_pythons()
+        :size: how many environments to keep for each python, or None to use
+               the size given last time
+        :return: a list of the environments which could not be created
+
+        Extra environments are removed if the pool is now smaller. Only one
+        process fills the pool at a time, others wait their turn.
+        """
+        lock = None if self.dryrun else self.pool.lock()
+        try:
+            environments = []
+            with self.tracer.span("resolve"):
+                versions = self.select_pythons(pythons)
+            for version in versions:
+                if size is None:
+                    wanted = self.pool.size(version)
+                else:
+                    wanted = size
+                    if not self.dryrun:
+                        self.pool.set_size(version, size)
+                entries = self.pool.entries(version)
+                self.status_message(
+                    "pool has {} of {} environments for python {}".format(
+                        len(entries), wanted, version
+                    )
+                )
+                for entry in entries[wanted:]:
+                    self.uninstall_environment(Environment(entry, version))
+                    if not self.dryrun:
+                        self.manifest.remove(entry)
+                for _ in range(wanted - len(entries)):
+                    name = self.pool.entry_name(version)
+                    environments.append(Environment(name, version))
+            return self.create_environments(environments)
+        finally:
+            if lock:
+                lock.close()
+
+    def claim_environments(self, basename, pythons, refill=True) -> List:
+        """Claim environments from the pool, building any which it doesn't have
+
+        :pythons: a list of python versions, as passed to select_pythons()
+        :refill: start a background process to refill the pool afterwards
+        :return: a list of the environments which could not be created
+        """
+        with self.tracer.span("resolve"):
+            environments = self.plan_project(basename, pythons)
+        unclaimed = [env for env in environments if not self.claim_environment(env)]
+        failed = self.create_environments(unclaimed)
+        if refill:
+            self.start_refill(sorted({env.version for env in environments}))
+        return failed
+
+    def claim_environment(self, env) -> bool:
+        """Take an environment from the pool and put it in place as env
+
+        :return: True if one was claimed, False if the pool has none for this python
+
+        The environment is locked like any other being built, so another pyvb
+        can't replace it at the same time. replace_environment() releases it.
+        """
+        with self.tracer.span("claim", environment=env.name, version=env.version):
+            if self.dryrun:
+                claimed = bool(self.pool.entries(env.version))
+            else:
+                self.lock_environment(env)
+                staging = env.make_staging()
+                entry = self.pool.claim(env.version, staging.name)
+                claimed = entry is not None
+                if claimed:
+                    self.manifest.remove(entry)
+                else:
+                    env.staging = None
+                    self.unlock_environment(env)
+        if not claimed:
+            self.status_message(
+                "pool has no environment for python {}".format(env.version)
+            )
+            return False
+        self.status_message("claimed environment {} from the pool".format(env.name))
+        self.replace_environment(env)
+        return True
+
+    def start_refill(self, versions: List):
+        """Refill the pool for some python versions in a background process"""
+        if not any(self.pool.size(version) for version in versions):
+            return
+        argv = [sys.executable, "-m", "pyvb", "pool", "fill"]
+        argv.extend(["-p", ",".join(versions), "-j", str(self.jobs)])
+        if self.template:
+            argv.append("--template")
+        if self.dedupe:
+            argv.append("--dedupe")
+        if self.profile:
+            argv.extend(["--profile", self.profile])
+        if self.compile_cpus:
+            argv.extend(["--compile-cpus", str(self.compile_cpus)])
+        if self.compile_memory:
+            argv.extend(["--compile-memory", str(self.compile_memory)])
+        if self.artifact_cache:
+            argv.extend(["--artifact-cache", self.artifact_cache.path])
+            if self.artifact_cache.max_bytes is not None:
+                argv.extend(
+                    ["--artifact-cache-size", str(self.artifact_cache.max_bytes)]
+                )
+        self.status_message("refilling the pool in the background")
+        if self.dryrun:
+            return
+        # pylint: disable=consider-using-with
+        subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def plan_project(self, basename, pythons, requirements=None) -> List:
+        """Return a list of environments for a basename and a list of python specifiers
+
+        :pythons: a list of python versions, as passed to select_pythons()
+        """
         environments = []
-        for majmin in selected_pythons:
+        for version in self.select_pythons(pythons):
             env = Environment()
-            env.name = "{}-{}".format(args.basename, majmin)
-            env.version = self.find_latest_version(majmin)
+            env.name = "{}-{}".format(basename, version)
+            # select_pythons() has already resolved each one to a full version
+            env.version = version
+            env.requirements = requirements
             environments.append(env)
+        return environments
 
-        # create each environment
+    def run_pyenv(self, argv: List, **kwargs):
+        """Run a pyenv command with subprocess.run(), recording how long it took"""
+        with self.tracer.span(" ".join(argv[:2]), SUBPROCESS, argv=argv):
+            return subprocess.run(argv, **kwargs)
+
+    def run_pip(self, python: str, args: List, **kwargs):
+        """Run pip with subprocess.run(), recording how long it took"""
+        argv = [python, "-m", "pip"] + args
+        with self.tracer.span("pip " + args[0], SUBPROCESS, argv=argv):
+            return subprocess.run(argv, **kwargs)
+
+    def create_environments(self, environments: List) -> List:
+        """Create a list of environments, using up to self.jobs worker threads
+
+        :return: a list of the environments which could not be created
+
+        Installing each python, creating each new environment, and putting
+        it in place of the old one are separate steps. Each step runs as soon
+        as the steps it depends on are done, so creating one environment
+        doesn't wait for an unrelated python to compile. A python needed by
+        several environments is installed once. The history of how long steps
+        took decides which to start first, see Scheduler.
+
+        When self.jobs is 1 the steps run one at a time, and we stop at the
+        first failure. Otherwise every environment is attempted.
+        """
+        scheduler = Scheduler(
+            jobs=self.jobs, keep_going=self.jobs > 1, finished=self._step_finished
+        )
+        creates = {}
+        for env in environments:
+            if self.incremental and self.environment_is_current(env):
+                self.status_message("environment {} is up to date".format(env.name))
+                continue
+            if any(
+                self.step_was_done((kind, env.name), env)
+                for kind in ("replace", "sync")
+            ):
+                self.status_message(
+                    "environment {} was finished by the last run".format(env.name)
+                )
+                continue
+            creates[env.name] = self.plan_environment(scheduler, env)
+
+        self._scheduler = scheduler
         try:
+            unfinished = scheduler.run()
+        finally:
+            self._scheduler = None
+            # remove environments which were staged, but whose later steps
+            # failed or were skipped
             for env in environments:
-                self.create_environment(env)
-        except subprocess.CalledProcessError:
-            return 1
+                if env.name in creates and creates[env.name].state != DONE:
+                    self.discard_staging(env)
+            # and release any locks that leaves
+            for lock in self._environment_locks.values():
+                lock.release()
+            self._environment_locks.clear()
+        for step in unfinished:
+            if step.error is None:
+                continue
+            if not isinstance(step.error, (subprocess.CalledProcessError, OSError)):
+                raise step.error
+            kind, what = step.key
+            if kind == "install":
+                print("pyvb: failed to install python {}: {}".format(what, step.error))
+            elif kind == "wheels":
+                print(
+                    "pyvb: failed to build wheels for {} in {}: {}".format(
+                        what[1], what[0], step.error
+                    )
+                )
+            elif kind == "template":
+                print(
+                    "pyvb: failed to create template for python {}: {}".format(
+                        what, step.error
+                    )
+                )
+            elif kind == "sync":
+                print(
+                    "pyvb: failed to sync environment {}: {}".format(what, step.error)
+                )
+            else:
+                print(
+                    "pyvb: failed to create environment {}: {}".format(what, step.error)
+                )
+        return [
+            env
+            for env in environments
+            if env.name in creates and creates[env.name].state != DONE
+        ]
 
-        return 0
+    def plan_environment(self, scheduler, env):
+        """Add the steps which create an environment to a scheduler
+
+        :return: the step which creates the environment
+        """
+        install_cost = 0
+        if not discovery.is_installed(env.version):
+            install_cost = self.estimate_step("install", env.version)
+        install = self.add_step(
+            scheduler,
+            ("install", env.version),
+            lambda: self.install_python(env.version),
+            cost=install_cost,
+        )
+        if self.sync and self.can_sync(env):
+            return self.plan_sync(scheduler, env, install)
+        requires = [install]
+        if self.template:
+            template = self.add_step(
+                scheduler,
+                ("template", env.version),
+                lambda: self.ensure_template(env.version),
+                [install],
+                self.estimate_step("template", env.version),
+            )
+            requires.append(template)
+        create = self.add_step(
+            scheduler,
+            ("create", env.name),
+            lambda: self.make_environment(env),
+            requires,
+            self.estimate_step("clone" if self.template else "create", env.version),
+        )
+        if env.requirements:
+            # wheels are shared by every environment with the same ABI, so build
+            # them with whichever python of that ABI comes first
+            wheels = self.add_step(
+                scheduler,
+                ("wheels", (self.wheelhouse_path(env), env.requirements)),
+                lambda: self.build_wheels(env),
+                [install],
+                self.estimate_step("wheels", env.version),
+            )
+            create = self.add_step(
+                scheduler,
+                ("requirements", env.name),
+                lambda: self.install_requirements(env),
+                [create, wheels],
+                self.estimate_step("requirements", env.version),
+            )
+        return self.add_step(
+            scheduler,
+            ("replace", env.name),
+            lambda: self.replace_environment(env),
+            [create],
+        )
+
+    def plan_sync(self, scheduler, env, install):
+        """Add the steps which update an existing environment in place
+
+        :return: the step which updates the environment
+        """
+        requires = [install]
+        if env.requirements:
+            requires.append(
+                self.add_step(
+                    scheduler,
+                    ("wheels", (self.wheelhouse_path(env), env.requirements)),
+                    lambda: self.build_wheels(env),
+                    [install],
+                    self.estimate_step("wheels", env.version),
+                )
+            )
+        return self.add_step(
+            scheduler,
+            ("sync", env.name),
+            lambda: self.sync_environment(env),
+            requires,
+            self.estimate_step("sync", env.version),
+        )
+
+    def acquire_lock(self, kind, name):
+        """Take a lock shared with other pyvb processes, waiting if we must
+
+        :return: the FileLock, or None in a dry run
+        """
+        if self.dryrun:
+            return None
+        lock = FileLock(lock_path(kind, name))
+        with self.tracer.span("lock", lock="{} {}".format(kind, name)):
+            waited = lock.acquire(
+                lambda: self.status_message(
+                    "waiting for another pyvb to finish with {} {}".format(kind, name)
+                )
+            )
+        if waited:
+            self.status_message(
+                "waited {} for {} {}".format(format_duration(waited), kind, name)
+            )
+        return lock
+
+    @contextlib.contextmanager
+    def locked(self, kind, name):
+        """Hold a lock shared with other pyvb processes for the body of a with statement"""
+        lock = self.acquire_lock(kind, name)
+        try:
+            yield
+        finally:
+            if lock:
+                lock.release()
+
+    @contextlib.contextmanager
+    def locked_if_free(self, kind, name):
+        """Hold a lock shared with other pyvb processes, unless one of them has it
+
+        The body of the with statement gets True if we have the lock, or False
+        if another pyvb holds it. In a dry run nothing is locked.
+        """
+        if self.dryrun:
+            yield True
+            return
+        lock = FileLock(lock_path(kind, name))
+        try:
+            lock.acquire(timeout=0)
+        except TimeoutError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lock.release()
+
+    def lock_environment(self, env):
+        """Lock an environment until it has been replaced, or its staging discarded"""
+        lock = self.acquire_lock("environment", env.name)
+        if lock:
+            self._environment_locks[env.name] = lock
+
+    def unlock_environment(self, env):
+        """Release the lock taken by lock_environment(), if we hold it"""
+        lock = self._environment_locks.pop(env.name, None)
+        if lock:
+            lock.release()
+
+    def estimate_step(self, kind, version):
+        """Return roughly how many seconds a step will take, from the history"""
+        seconds = self.history.estimate(kind, version, self.profile)
+        return DEFAULT_SECONDS[kind] if seconds is None else seconds
+
+    @contextlib.contextmanager
+    def timed(self, kind, version):
+        """Add how long the body of a with statement took to the history
+
+        Nothing is recorded if the body raises an exception.
+        """
+        start = time.perf_counter()
+        yield
+        self.history.record(kind, version, self.profile, time.perf_counter() - start)
+
+    def _step_finished(self, step):
+        """Report progress when a step has finished"""
+        if step.state == DONE and step.cost:
+            kind, what = step.key
+            name = what if isinstance(what, str) else os.path.basename(what[0])
+            self.status_message("finished {} {}".format(kind, name))
+
+    def add_step(self, scheduler, key, func, requires=(), cost=0):
+        """Add a step to a scheduler, and record it in the journal when it's done
+
+        When resuming, a step which the journal says was done, and which is
+        still done on disk, isn't run again.
+        """
+        if self.step_was_done(key):
+
+            def run():
+                self.status_message("{} {} was finished by the last run".format(*key))
+
+        else:
+
+            def run():
+                func()
+                if self.journal and not self.dryrun:
+                    self.journal.record(key)
+
+        return scheduler.add(key, run, requires, cost)
+
+    def step_was_done(self, key, env=None) -> bool:
+        """Check if the run we are resuming finished a step, and it's still done
+
+        Only steps whose results can be found on disk count. Environments
+        are built under a temporary name, so the steps before they replace
+        the old environment can't be resumed. A finished environment must
+        still match its fingerprint, so it is checked against env.
+        """
+        if not self.resume or json.dumps(key) not in self._resumed:
+            return False
+        kind, what = key
+        if kind == "install":
+            return discovery.is_installed(what)
+        if kind == "wheels":
+            wheelhouse = what[0]
+            return os.path.isdir(wheelhouse) and any(
+                name.endswith(".whl") for name in os.listdir(wheelhouse)
+            )
+        if kind in ("replace", "sync"):
+            return env is not None and self.environment_is_current(env)
+        return False
 
     def all_pythons(self) -> List:
         """Return a list of all available python versions as a list"""
         # cache the list
         if not self._all_pythons:
-            as_string = self._get_all_pythons()
-            pythons = as_string.split("\n")
-            # the first element of this list says "Available versions:"
-            _ = pythons.pop(0)
-            # and each python version is indented by a couple spaces
-            self._all_pythons = [x.strip() for x in pythons]
+            with self.tracer.span("catalog"):
+                self._all_pythons = list(self.catalog())
         return self._all_pythons
 
-    def _get_all_pythons(self) -> str:
-        """Use pyenv to get a list of pythons that are available to us"""
-        self.status_message("retrieving available pythons from pyenv")
+    def version_index(self) -> VersionIndex:
+        """Return an index of all available python versions, built once
 
-        process = subprocess.run(
-            ["pyenv", "install", "--list"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
+        The index reads the catalog as lookups need it, see StreamingVersionIndex.
+        When the catalog comes from pyenv, it is all fetched here, so that it
+        can be cached.
+        """
+        if self._version_index is None:
+            if self._all_pythons:
+                self._version_index = VersionIndex(self._all_pythons)
+            else:
+                with self.tracer.span("catalog"):
+                    self._version_index = StreamingVersionIndex(self.catalog())
+        return self._version_index
+
+    def close_catalog(self):
+        """Stop reading the catalog, once we won't look up any more versions"""
+        if self._version_index is not None:
+            self._version_index.close()
+
+    def catalog(self) -> Iterator[str]:
+        """Return an iterator over the available python versions, in pyenv's order
+
+        The versions come from the python-build definitions if we can find
+        them. Otherwise, unless --refresh-catalog was given, they are read
+        from the on-disk cache, and if that isn't valid, from
+        `pyenv install --list`, which is read to the end and saved in the cache.
+        """
+        pythons = discovery.available_pythons()
+        if pythons:
+            return iter(pythons)
+        # we don't recognize how python-build is installed, so ask pyenv
+        key = self.catalog_cache.key(self.pyenv_version())
+        if not self.refresh_catalog:
+            cached = self.catalog_cache.load(key)
+            if cached is not None:
+                self.status_message("using cached list of available pythons")
+                return cached
+        return iter(
+            self.catalog_cache.save(key, parse_catalog(self._get_all_pythons()))
         )
-        return process.stdout
+
+    def _get_all_pythons(self) -> Iterator[str]:
+        """Use pyenv to get a list of pythons that are available to us
+
+        The output of `pyenv install --list` is returned a line at a time as
+        pyenv prints it. If we stop reading early, pyenv is stopped.
+        """
+        self.status_message("retrieving available pythons from pyenv")
+        argv = ["pyenv", "install", "--list"]
+        with self.tracer.span(" ".join(argv[:2]), SUBPROCESS, argv=argv):
+            with subprocess.Popen(
+                argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            ) as process:
+                finished = False
+                try:
+                    yield from process.stdout
+                    finished = True
+                finally:
+                    if not finished:
+                        process.terminate()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, argv)
 
     def have_pyenv(self):
         """Check if pyenv is installed"""
-        self.status_message("checking if pyenv is installed")
-        process = subprocess.run(
-            ["pyenv", "--version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False,
-        )
-        return process.returncode == 0
+        return self.pyenv_version() is not None
+
+    def pyenv_version(self):
+        """Return the version reported by pyenv, or None if pyenv is not installed
+
+        The version is read from the pyenv installation if we can find it,
+        otherwise pyenv is run once and the result remembered.
+        """
+        if self._pyenv_version is None:
+            self._pyenv_version = discovery.pyenv_version()
+        if self._pyenv_version is None:
+            self.status_message("checking if pyenv is installed")
+            try:
+                process = self.run_pyenv(
+                    ["pyenv", "--version"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    check=False,
+                )
+            except FileNotFoundError:
+                return None
+            if process.returncode == 0:
+                self._pyenv_version = process.stdout.strip()
+        return self._pyenv_version
 
     @classmethod
     def default_pythons(cls):
@@ -233,37 +1205,567 @@ class Pyvb:
         >>> print(prog.find_latest_version('3.4'))
         3.4.10
 
+        dev, beta and rc versions are ignored. Version components must match
+        exactly, so '3.1' will not find '3.10.0'.
+
         :return: a version string like 3.8.1 or None if there are no matches
         """
-        # ignore dev, beta and rc versions
-        prereleases = re.compile(r"(dev$|rc[0-9]+$|b[0-9]+$)")
-        pythons = list(filter(lambda x: not prereleases.search(x), self.all_pythons()))
-
-        # iterate the list backwards (we want the highest version, which appears
-        # later in the `pyenv` output) to find the highest matching version
-        latest = None
-        for version in reversed(pythons):
-            if version.startswith(major_minor):
-                latest = version
-                break
-        return latest
-
-    def create_environment(self, env):
-        """Create an environment specified by the passed instance of an Environment class"""
-        self.install_python(env.version)
-        self.status_message("deleting environment {}".format(env.name))
-        if not self.dryrun:
-            subprocess.run(["pyenv", "uninstall", "-f", env.name], check=False)
+        return self.version_index().latest(major_minor)
 
+    def uninstall_environment(self, env):
+        """Delete an environment, if it exists"""
+        if os.path.lexists(env.path):
+            self.status_message("deleting environment {}".format(env.name))
+            with self.tracer.span("uninstall", environment=env.name):
+                if not self.dryrun:
+                    self.run_pyenv(["pyenv", "uninstall", "-f", env.name], check=False)
+
+    def make_environment(self, env):
+        """Use pyenv to create an environment from an installed python
+
+        The environment is created in env.staging, and replace_environment()
+        puts it in place. Throws a CalledProcessError exception if an error
+        occurs.
+        """
         self.status_message(
             "creating environment {} with version {}".format(env.name, env.version)
         )
-        if not self.dryrun:
-            argv = ["pyenv", "virtualenv", "-p"]
-            argv.append("python{}".format(env.major_minor))
-            argv.append(env.version)
-            argv.append(env.name)
-            subprocess.run(argv, check=True)
+        self.lock_environment(env)
+        with self.tracer.span("create", environment=env.name, version=env.version):
+            if self.dryrun:
+                return
+            staging = env.make_staging()
+            try:
+                if self.template:
+                    with self.timed("clone", env.version):
+                        self.clone_environment(staging)
+                else:
+                    with self.timed("create", env.version):
+                        self.run_pyenv(self._virtualenv_argv(staging), check=True)
+            except BaseException:
+                self.discard_staging(env)
+                raise
+
+    def discard_staging(self, env):
+        """Remove a partly built environment"""
+        if env.staging:
+            self.uninstall_environment(env.staging)
+            env.staging = None
+        self.unlock_environment(env)
+
+    def replace_environment(self, env):
+        """Atomically replace an environment with the one built in env.staging
+
+        pyenv-virtualenv makes $PYENV_ROOT/versions/NAME a symlink to the real
+        environment, so we point a new symlink at the staging environment and
+        rename it over the old one. The old environment is deleted in the
+        background.
+        """
+        self.status_message("replacing environment {}".format(env.name))
+        if self.dryrun:
+            return
+        try:
+            self._replace_environment(env)
+        finally:
+            self.unlock_environment(env)
+        self.record_environment(env)
+
+    def _replace_environment(self, env):
+        """Rename the staging environment into place"""
+        with self.tracer.span("replace", environment=env.name, version=env.version):
+            staging = env.staging
+            real = os.path.realpath(staging.path)
+            old = None
+            if os.path.islink(env.path):
+                old = os.path.realpath(env.path)
+            elif os.path.lexists(env.path):
+                # not made by pyenv-virtualenv, so it has to be moved out of
+                # the way before the symlink can replace it
+                old = "{}.pyvb-old-{}".format(env.path, os.path.basename(staging.path))
+                os.rename(env.path, old)
+            self.set_prompt(env, real)
+            link = staging.path + ".link"
+            os.symlink(real, link)
+            os.replace(link, env.path)
+            os.unlink(staging.path)
+            env.staging = None
+            if old and old != real:
+                self.delete_later(old)
+
+    @staticmethod
+    def set_prompt(env, real):
+        """Make the activate scripts of an environment in real show env.name
+
+        venv puts the name of the directory an environment is created in into
+        the prompt, but ours are created under a temporary name, or cloned from
+        the template. Names which are part of a path are left alone.
+        """
+        olds = {os.path.basename(real), TEMPLATE_NAME.format(env.version)}
+        olds.discard(env.name)
+        alternatives = "|".join(
+            re.escape(old) for old in sorted(olds, key=len, reverse=True)
+        )
+        pattern = re.compile(r"(?<![\w/.-])(?:{})(?![\w.-])".format(alternatives))
+        bindir = os.path.join(real, "bin")
+        paths = [os.path.join(real, "pyvenv.cfg")]
+        try:
+            paths.extend(
+                os.path.join(bindir, name)
+                for name in os.listdir(bindir)
+                if name.lower().startswith("activate")
+            )
+        except OSError:
+            pass
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    content = file.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            changed = pattern.sub(env.name, content)
+            if changed == content:
+                continue
+            # write a new file, in case it is hardlinked
+            tmpname = path + ".pyvb-prompt"
+            with open(tmpname, "w", encoding="utf-8") as file:
+                file.write(changed)
+            os.chmod(tmpname, os.stat(path).st_mode)
+            os.replace(tmpname, path)
+
+    def delete_later(self, path):
+        """Delete a directory tree in a background thread"""
+        import shutil  # pylint: disable=import-outside-toplevel
+
+        self.status_message("deleting {} in the background".format(path))
+        thread = threading.Thread(
+            target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}
+        )
+        thread.start()
+        self._deletions.append(thread)
+
+    def finish_deletions(self):
+        """Wait for background deletions to finish"""
+        while self._deletions:
+            self._deletions.pop().join()
+
+    def collect_garbage(self, max_bytes=None, min_idle=None, include_all=False):
+        """Remove stale environments and pythons which no environment uses
+
+        :max_bytes: only remove pythons until they use no more than this
+        :min_idle: only remove pythons which haven't been used for this many seconds
+        :include_all: also remove pythons which pyvb didn't install
+        :return: a tuple of the bytes reclaimed, and whether anything failed
+        """
+        from . import cleanup  # pylint: disable=import-outside-toplevel
+
+        reclaimed = 0
+        failed = False
+        environments = self.manifest.environments()
+
+        # forget environments which have been removed some other way
+        for name in sorted(environments):
+            if not os.path.lexists(Environment(name).path):
+                self.status_message("forgetting environment {}".format(name))
+                if not self.dryrun:
+                    self.manifest.remove(name)
+
+        for name in cleanup.stale_staging():
+            env = Environment(name)
+            # the lock is on the name the environment is being built for
+            with self.locked_if_free(
+                "environment", name.rsplit("-pyvb-", 1)[0]
+            ) as free:
+                if not free:
+                    self.status_message(
+                        "leaving environment {}, another pyvb is using it".format(name)
+                    )
+                    continue
+                size = cleanup.tree_size(os.path.realpath(env.path))
+                self.status_message(
+                    "removing stale environment {} ({})".format(
+                        name, cleanup.format_size(size)
+                    )
+                )
+                self.uninstall_environment(env)
+                reclaimed += size
+
+        candidates = self.python_candidates(include_all)
+        for candidate in cleanup.choose_pythons(candidates, max_bytes, min_idle):
+            # another pyvb may be installing it, or have just built something with it
+            with self.locked_if_free("python", candidate.version) as free:
+                if not free or self.python_was_used(candidate):
+                    self.status_message(
+                        "leaving python {}, another pyvb is using it".format(
+                            candidate.version
+                        )
+                    )
+                    continue
+                self.status_message(
+                    "removing python {}, last used {} ({})".format(
+                        candidate.version,
+                        time.strftime("%Y-%m-%d", time.localtime(candidate.used)),
+                        cleanup.format_size(candidate.size),
+                    )
+                )
+                try:
+                    self.uninstall_python(candidate.version)
+                except subprocess.CalledProcessError as err:
+                    print(
+                        "pyvb: failed to remove python {}: {}".format(
+                            candidate.version, err
+                        )
+                    )
+                    failed = True
+                else:
+                    reclaimed += candidate.size
+        return reclaimed, failed
+
+    def python_was_used(self, candidate):
+        """Check if a python has been used since it was chosen for removal
+
+        The manifest is read again, because another pyvb may have recorded
+        that it used the python, or started building an environment with it.
+        """
+        from . import cleanup  # pylint: disable=import-outside-toplevel
+
+        if self.dryrun:
+            return False
+        entry = self.manifest.pythons().get(candidate.version) or {}
+        if entry.get("used", candidate.used) != candidate.used:
+            return True
+        if cleanup.environment_users(candidate.version):
+            return True
+        return any(
+            info.get("version") == candidate.version
+            and os.path.lexists(Environment(name).path)
+            for name, info in self.manifest.environments().items()
+        )
+
+    def python_candidates(self, include_all=False):
+        """Return the installed pythons which garbage collection could remove
+
+        Each one knows which environments use it, and when pyvb last used it.
+        Pythons selected with `pyenv global` count as used.
+        """
+        from . import cleanup  # pylint: disable=import-outside-toplevel
+
+        versions = locations.versions_dir()
+        pythons = self.manifest.pythons()
+        users = {}
+        for name, entry in self.manifest.environments().items():
+            if os.path.lexists(Environment(name).path):
+                users.setdefault(entry.get("version"), set()).add(name)
+        for version in cleanup.pinned_versions():
+            users.setdefault(version, set()).add("pyenv global")
+
+        candidates = []
+        try:
+            with os.scandir(versions) as entries:
+                installed = [
+                    x
+                    for x in entries
+                    if x.is_dir(follow_symlinks=False) and not x.name.startswith(".")
+                ]
+        except OSError:
+            installed = []
+        for entry in installed:
+            tracked = pythons.get(entry.name) or {}
+            if tracked.get("installed"):
+                used = tracked.get("used", 0)
+            elif include_all:
+                used = tracked.get("used") or entry.stat(follow_symlinks=False).st_mtime
+            else:
+                continue
+            version_users = users.get(entry.name, set())
+            version_users.update(cleanup.environment_users(entry.name))
+            candidates.append(
+                cleanup.Candidate(
+                    entry.name,
+                    cleanup.tree_size(entry.path),
+                    used,
+                    sorted(version_users),
+                )
+            )
+        return candidates
+
+    def uninstall_python(self, version):
+        """Remove a python, and the template environment made from it
+
+        The caller should hold the lock on the python, see collect_garbage().
+        """
+        import shutil  # pylint: disable=import-outside-toplevel
+
+        if self.dryrun:
+            return
+        with self.locked("template", version):
+            self.run_pyenv(["pyenv", "uninstall", "-f", version], check=True)
+            self.manifest.remove_python(version)
+            template = self.template_path(version)
+            shutil.rmtree(template, ignore_errors=True)
+            if os.path.exists(template + ".json"):
+                os.unlink(template + ".json")
+
+    def record_environment(self, env):
+        """Record a finished environment in the manifest"""
+        self.manifest.record(
+            env.name,
+            env.version,
+            self.environment_fingerprint(env),
+            build=self.python_build(env.version),
+        )
+
+    @staticmethod
+    def python_build(version):
+        """Return something which changes whenever a python version is reinstalled
+
+        :return: a list of the inode, size, and modification time of the
+                 python executable, or None if it isn't installed
+        """
+        python = os.path.join(locations.versions_dir(), version, "bin", "python")
+        try:
+            stat = os.stat(python)
+        except OSError:
+            return None
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def can_sync(self, env):
+        """Check if an environment can be brought up to date without rebuilding it
+
+        It must have been built by pyvb from the python which is installed
+        now, still work, and if it has requirements they must all be pinned.
+        """
+        from . import sync  # pylint: disable=import-outside-toplevel
+
+        entry = self.manifest.get(env.name)
+        if not entry or not env.is_healthy():
+            return False
+        build = self.python_build(env.version)
+        if build is None or entry.get("build") != build:
+            self.status_message(
+                "python {} has changed since environment {} was built".format(
+                    env.version, env.name
+                )
+            )
+            return False
+        if env.requirements and sync.pinned_requirements(env.requirements) is None:
+            self.status_message(
+                "can't sync environment {} because {} doesn't pin every "
+                "requirement".format(env.name, env.requirements)
+            )
+            return False
+        return True
+
+    def sync_environment(self, env):
+        """Install and remove packages so an environment matches its requirements
+
+        Only packages which are missing or have a different version are
+        installed, from the wheelhouse, and packages which aren't required
+        are removed. Unlike a rebuild this changes the environment in place.
+        """
+        from . import sync  # pylint: disable=import-outside-toplevel
+
+        desired = {}
+        if env.requirements:
+            desired = sync.pinned_requirements(env.requirements) or {}
+        python = os.path.join(env.path, "bin", "python")
+        with self.locked("environment", env.name), self.tracer.span(
+            "sync", environment=env.name, version=env.version
+        ):
+            listing = self.run_pip(
+                python,
+                ["list", "--format=json"],
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            install, uninstall = sync.diff_packages(
+                sync.parse_pip_list(listing.stdout), desired
+            )
+            if not install and not uninstall:
+                self.status_message("environment {} is in sync".format(env.name))
+            for requirement in install:
+                self.status_message("installing {} in {}".format(requirement, env.name))
+            for name in uninstall:
+                self.status_message("removing {} from {}".format(name, env.name))
+            if self.dryrun:
+                return
+            with self.timed("sync", env.version):
+                if uninstall:
+                    self.run_pip(python, ["uninstall", "--yes"] + uninstall, check=True)
+                if install:
+                    argv = ["install", "--no-index"]
+                    argv.extend(["--find-links", self.wheelhouse_path(env)])
+                    self.run_pip(python, argv + install, check=True)
+        self.record_environment(env)
+
+    def wheelhouse_path(self, env):
+        """Return the directory of wheels shared by environments with the same ABI as env
+
+        CPython wheels depend on the major.minor version and the platform.
+        For other implementations we don't know, so use the whole version.
+        """
+        import sysconfig  # pylint: disable=import-outside-toplevel
+
+        abi = "{}-{}".format(env.major_minor or env.version, sysconfig.get_platform())
+        return os.path.join(locations.cache_dir(), "wheelhouse", abi)
+
+    def build_wheels(self, env):
+        """Build or download wheels for the requirements into the wheelhouse
+
+        pip reuses wheels which are already in the wheelhouse, so once the
+        wheelhouse is warm this is quick.
+        """
+        wheelhouse = self.wheelhouse_path(env)
+        python = os.path.join(locations.versions_dir(), env.version, "bin", "python")
+        self.status_message("building wheels in {}".format(wheelhouse))
+        with self.tracer.span("wheels", version=env.version):
+            if not self.dryrun:
+                argv = ["wheel", "--wheel-dir", wheelhouse, "--find-links", wheelhouse]
+                argv.extend(["-r", env.requirements])
+                with self.timed("wheels", env.version):
+                    self.run_pip(python, argv, check=True)
+
+    def install_requirements(self, env):
+        """Install the requirements into an environment, only from the wheelhouse
+
+        If the environment is being rebuilt, they are installed in env.staging.
+        """
+        wheelhouse = self.wheelhouse_path(env)
+        python = os.path.join((env.staging or env).path, "bin", "python")
+        self.status_message("installing requirements in {}".format(env.name))
+        with self.tracer.span(
+            "requirements", environment=env.name, version=env.version
+        ):
+            if not self.dryrun:
+                argv = ["install", "--no-index", "--find-links", wheelhouse]
+                argv.extend(["-r", env.requirements])
+                try:
+                    with self.timed("requirements", env.version):
+                        self.run_pip(python, argv, check=True)
+                except BaseException:
+                    self.discard_staging(env)
+                    raise
+
+    @staticmethod
+    def template_path(version):
+        """Return the directory of the template environment for a python version"""
+        return os.path.join(locations.state_dir(), "templates", version)
+
+    def ensure_template(self, version):
+        """Build the template environment for a python version, unless it's up to date
+
+        The template is created by pyenv virtualenv, then moved out of the
+        way so pyenv doesn't list it. We remember where it was created so
+        clones can rewrite that path, and which build of python it was
+        created from so it can be rebuilt if python is reinstalled.
+        """
+        build = self.python_build(version)
+        if self.template_is_current(version, build):
+            return
+        # another pyvb may be building the same template
+        with self.locked("template", version):
+            if self.template_is_current(version, build):
+                return
+            self._build_template(version, build)
+
+    def template_is_current(self, version, build) -> bool:
+        """Check if the template for a python version was made from this build of it"""
+        template = self.template_path(version)
+        try:
+            with open(template + ".json", encoding="utf-8") as file:
+                info = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return bool(build) and info.get("build") == build and os.path.isdir(template)
+
+    def _build_template(self, version, build):
+        """Create the template environment with pyenv virtualenv"""
+        import shutil  # pylint: disable=import-outside-toplevel
+
+        template = self.template_path(version)
+        self.status_message(
+            "creating template environment for python {}".format(version)
+        )
+        if self.dryrun:
+            return
+        with self.tracer.span("template", version=version):
+            shutil.rmtree(template, ignore_errors=True)
+            env = Environment(TEMPLATE_NAME.format(version), version)
+            self.uninstall_environment(env)
+            with self.timed("template", version):
+                self.run_pyenv(self._virtualenv_argv(env), check=True)
+            created = os.path.realpath(env.path)
+            os.makedirs(os.path.dirname(template), exist_ok=True)
+            shutil.move(created, template)
+            os.unlink(env.path)
+            with open(template + ".json", "w", encoding="utf-8") as file:
+                json.dump({"path": created, "build": build}, file)
+
+    def clone_environment(self, env):
+        """Create an environment by cloning the template for its python version"""
+        from .clone import clone_tree  # pylint: disable=import-outside-toplevel
+
+        template = self.template_path(env.version)
+        with open(template + ".json", encoding="utf-8") as file:
+            info = json.load(file)
+        # lay it out the same way pyenv virtualenv does
+        dest = os.path.join(locations.versions_dir(), env.version, "envs", env.name)
+        counts = clone_tree(template, dest, info["path"], dest)
+        os.symlink(dest, env.path)
+        self.status_message(
+            "cloned {}: {reflinked} reflinked, {hardlinked} hardlinked, "
+            "{copied} copied, {rewritten} rewritten".format(env.name, **counts)
+        )
+
+    @staticmethod
+    def _virtualenv_argv(env) -> List:
+        """Build the pyenv command which creates an environment"""
+        argv = ["pyenv", "virtualenv", "-p"]
+        argv.append("python{}".format(env.major_minor))
+        argv.append(env.version)
+        argv.append(env.name)
+        return argv
+
+    def environment_fingerprint(self, env):
+        """Return a fingerprint of everything an environment is built from
+
+        The fingerprint covers the python version, the installed build of that
+        python and the profile it was built with, the command used to create
+        the environment, and the requirements file if there is one. It is None
+        if the python is not installed.
+        """
+        import hashlib  # pylint: disable=import-outside-toplevel
+
+        build = self.python_build(env.version)
+        if build is None:
+            return None
+        ingredients = {
+            "version": env.version,
+            "build": build,
+            "argv": self._virtualenv_argv(env),
+        }
+        profile = self.python_profile(env.version)
+        if profile:
+            # left out for the default, so existing fingerprints still match
+            ingredients["profile"] = profile
+        if env.requirements:
+            try:
+                with open(env.requirements, "rb") as file:
+                    ingredients["requirements"] = hashlib.sha256(
+                        file.read()
+                    ).hexdigest()
+            except OSError:
+                return None
+        as_json = json.dumps(ingredients, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(as_json).hexdigest()
+
+    def environment_is_current(self, env):
+        """Check if an environment was built by pyvb exactly as we would build it now"""
+        entry = self.manifest.get(env.name)
+        if not entry or not env.is_healthy():
+            return False
+        fingerprint = self.environment_fingerprint(env)
+        return fingerprint is not None and entry.get("fingerprint") == fingerprint
 
     def install_python(self, version):
         """Use pyenv to install a python version, ie major.minor.version, ie 3.8.1
@@ -271,9 +1773,149 @@ class Pyvb:
         :version: a version string like 3.8.1
 
         Throws a CalledProcessError exception if an error occurs
+
+        When environments are built in parallel, several of them may share
+        a version. Installs of the same version are serialized, so the second
+        one finds the version already present and `pyenv install -s` skips it.
+        The same goes for other pyvb processes, which hold a lock on the
+        version while they install it.
         """
-        self.status_message("running pyenv to install python {}".format(version))
-        if not self.dryrun:
-            subprocess.run(
-                ["pyenv", "install", "-s", version], check=True,
+        with self._install_locks_lock:
+            lock = self._install_locks.setdefault(version, threading.Lock())
+        with lock, self.locked("python", version), self.tracer.span(
+            "install", version=version
+        ):
+            present = discovery.is_installed(version)
+            if present and not self.wrong_profile(version):
+                self.status_message("python {} is already installed".format(version))
+                installed = False
+            elif not present and self.restore_python(version):
+                installed = True
+            else:
+                if self.profile:
+                    self.status_message(
+                        "running pyenv to {} python {} with the {} profile".format(
+                            "rebuild" if present else "install", version, self.profile
+                        )
+                    )
+                else:
+                    self.status_message(
+                        "running pyenv to install python {}".format(version)
+                    )
+                if self.dryrun:
+                    return
+                self.compile_python(version, force=present)
+                self.store_python(version)
+                installed = True
+            # remember it's used, so garbage collection leaves it alone
+            if not self.dryrun:
+                self.manifest.record_python(version, installed, self.profile)
+
+    def wrong_profile(self, version) -> bool:
+        """Check if an installed python must be rebuilt with self.profile
+
+        Pythons which pyvb installed with another profile are rebuilt. We
+        don't know how other pythons were built, and they aren't ours to
+        replace, so we only warn about those.
+        """
+        if not self.profile:
+            return False
+        entry = self.manifest.pythons().get(version) or {}
+        if not entry.get("installed"):
+            print(
+                "pyvb: python {} wasn't installed by pyvb, so it may not be built "
+                "with the {} profile".format(version, self.profile)
+            )
+            return False
+        if entry.get("profile") == self.profile:
+            return False
+        self.status_message(
+            "python {} was installed with the {} profile".format(
+                version, entry.get("profile") or "default"
             )
+        )
+        return True
+
+    def python_profile(self, version):
+        """Return the profile a python is built with, once install_python() has run"""
+        if self.profile:
+            return self.profile
+        return (self.manifest.pythons().get(version) or {}).get("profile")
+
+    def compile_python(self, version, force=False):
+        """Run pyenv install, once the host has room for another compile
+
+        :force: build it even though it's installed, replacing it in place
+        """
+        environ = self.build_environ()
+        estimate = estimate_build(
+            environ, self.profile, self.compile_cpus, self.compile_memory, self.jobs
+        )
+        with self.tracer.span("wait", version=version):
+            self.compile_budget.acquire(
+                estimate,
+                lambda: self.status_message(
+                    "waiting for cpus and memory to compile python {}".format(version)
+                ),
+            )
+        try:
+            with self.timed("install", version):
+                self.run_pyenv(
+                    ["pyenv", "install", "-f" if force else "-s", version],
+                    check=True,
+                    env=environ,
+                )
+        finally:
+            self.compile_budget.release(estimate)
+
+    def build_environ(self):
+        """Return the environment to run python-build in, for self.profile"""
+        return profile_environ(self.profile)
+
+    def artifact_key(self, version):
+        """Return the artifact cache key for a python built with self.profile"""
+        # pylint: disable=import-outside-toplevel
+        from .artifacts import build_options, compiler_version
+
+        prefix = os.path.join(locations.versions_dir(), version)
+        environ = self.build_environ()
+        return self.artifact_cache.key(
+            version, prefix, build_options(environ), compiler_version(environ)
+        )
+
+    def restore_python(self, version) -> bool:
+        """Restore a python from the artifact cache, if it's there
+
+        :return: True if the python was restored
+        """
+        if not self.artifact_cache:
+            return False
+        prefix = os.path.join(locations.versions_dir(), version)
+        key = self.artifact_key(version)
+        with self.tracer.span("restore", version=version):
+            if self.dryrun:
+                return False
+            restored = self.artifact_cache.restore(key, prefix)
+        if restored:
+            self.status_message(
+                "restored python {} from artifact cache".format(version)
+            )
+        return restored
+
+    def store_python(self, version):
+        """Save a freshly installed python in the artifact cache"""
+        if not self.artifact_cache:
+            return
+        prefix = os.path.join(locations.versions_dir(), version)
+        key = self.artifact_key(version)
+        self.status_message("saving python {} in artifact cache".format(version))
+        with self.tracer.span("store", version=version):
+            try:
+                self.artifact_cache.store(key, prefix)
+            except OSError as err:
+                # the python is installed, so this isn't fatal
+                print(
+                    "pyvb: could not save python {} in artifact cache: {}".format(
+                        version, err
+                    )
+                )
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Decide how many pythons can be compiled at once without overloading the host
+"""
+
+import os
+import re
+import threading
+from typing import Callable, Dict, Optional
+
+GIGABYTE = 1024**3
+
+# roughly how much memory one compile of python needs at its peak. Link time
+# optimization is the hungry part of an optimized build.
+BUILD_MEMORY = 1 * GIGABYTE
+OPTIMIZED_BUILD_MEMORY = 3 * GIGABYTE
+
+
+# pylint: disable=too-few-public-methods
+class Estimate:
+    """Data class to hold the resources we expect one compile to use"""
+
+    def __init__(self, cpus: int, memory: int):
+        self.cpus = max(1, cpus)
+        # bytes
+        self.memory = memory
+
+    def __repr__(self):
+        return "Estimate(cpus={}, memory={})".format(self.cpus, self.memory)
+
+
+def make_jobs(environ: Dict[str, str]) -> Optional[int]:
+    """Return the number of make jobs python-build will run, if it was told
+
+    >>> make_jobs({"MAKE_OPTS": "-j 4"})
+    4
+    >>> make_jobs({"MAKEOPTS": "--jobs=6"}), make_jobs({})
+    (6, None)
+    """
+    # python-build prefers MAKEOPTS over MAKE_OPTS
+    options = environ.get("MAKEOPTS") or environ.get("MAKE_OPTS") or ""
+    match = re.search(r"(?:-j\s*|--jobs[=\s]\s*)(\d+)", options)
+    return int(match.group(1)) if match else None
+
+
+def estimate_build(
+    environ: Dict[str, str],
+    profile: Optional[str] = None,
+    cpus: Optional[int] = None,
+    memory: Optional[int] = None,
+    jobs: int = 1,
+) -> Estimate:
+    """Estimate the resources one compile of python will use
+
+    :environ: the environment python-build runs in
+    :profile: the build profile, see pyvb.profiles
+    :cpus: override the estimated number of cpus
+    :memory: override the estimated memory, in bytes
+    :jobs: how many things pyvb has been asked to build at once
+
+    Unless MAKE_OPTS says otherwise, python-build runs one make job for each
+    cpu. Those make jobs spend much of their time waiting on each other, so
+    when several pythons are built at once they are assumed to share the
+    make jobs between them, rather than each needing all of them.
+
+    >>> estimate_build({"MAKE_OPTS": "-j8"}, jobs=2)
+    Estimate(cpus=4, memory=1073741824)
+    """
+    if cpus is None:
+        cpus = (make_jobs(environ) or os.cpu_count() or 1) // max(1, jobs)
+    if memory is None:
+        memory = OPTIMIZED_BUILD_MEMORY if profile == "optimized" else BUILD_MEMORY
+    return Estimate(cpus, memory)
+
+
+def load_average() -> Optional[float]:
+    """Return the one minute load average, or None if we can't tell"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def available_memory() -> Optional[int]:
+    """Return how many bytes of memory can be used without swapping, or None"""
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class ResourceBudget:
+    """Admit compiles while the host has room for them
+
+    A compile is admitted if the cpus it needs fit alongside the load on the
+    machine, and the memory it needs is available. The load average lags
+    behind, so the cpus of compiles we have already started count as load
+    straight away. Their memory is counted as well as what they have already
+    used, which errs on the side of starting fewer compiles.
+
+    One compile is always admitted when none of ours are running, otherwise
+    a busy machine would never get anything built.
+
+    >>> budget = ResourceBudget(cpus=4, load=lambda: 0.0, memory=lambda: 8 * GIGABYTE)
+    >>> budget.acquire(Estimate(2, GIGABYTE))
+    False
+    >>> budget.fits(Estimate(2, GIGABYTE))
+    True
+    >>> budget.fits(Estimate(3, GIGABYTE))
+    False
+    """
+
+    def __init__(
+        self,
+        cpus: Optional[int] = None,
+        load: Callable[[], Optional[float]] = load_average,
+        memory: Callable[[], Optional[int]] = available_memory,
+        poll: float = 5.0,
+    ):
+        self.cpus = cpus or os.cpu_count() or 1
+        self._load = load
+        self._memory = memory
+        # how often to look at the load and memory again while waiting
+        self.poll = poll
+        self.running = 0
+        self.committed_cpus = 0
+        self.committed_memory = 0
+        self._condition = threading.Condition()
+
+    def fits(self, estimate: Estimate) -> bool:
+        """Check if a compile could start now"""
+        if self.running == 0:
+            return True
+        load = self._load()
+        busy = self.committed_cpus if load is None else max(load, self.committed_cpus)
+        if busy + estimate.cpus > self.cpus:
+            return False
+        memory = self._memory()
+        if memory is not None and self.committed_memory + estimate.memory > memory:
+            return False
+        return True
+
+    def acquire(self, estimate: Estimate, waiting: Optional[Callable] = None) -> bool:
+        """Wait until a compile fits, and account for it
+
+        :waiting: called once, if we have to wait
+        :return: True if we had to wait
+        """
+        waited = False
+        with self._condition:
+            while not self.fits(estimate):
+                if not waited and waiting:
+                    waiting()
+                waited = True
+                self._condition.wait(self.poll)
+            self.running += 1
+            self.committed_cpus += estimate.cpus
+            self.committed_memory += estimate.memory
+        return waited
+
+    def release(self, estimate: Estimate):
+        """Account for a finished compile"""
+        with self._condition:
+            self.running -= 1
+            self.committed_cpus -= estimate.cpus
+            self.committed_memory -= estimate.memory
+            self._condition.notify_all()
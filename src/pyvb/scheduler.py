@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Run a graph of dependent steps, each as soon as the steps it requires are done
+"""
+
+import threading
+import time
+from typing import Callable, Hashable, Iterable, List, Optional
+
+# states of a step
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# a step is skipped if a step it requires failed or was skipped
+SKIPPED = "skipped"
+
+
+# pylint: disable=too-few-public-methods
+class Step:
+    """Data class to hold one unit of work and the steps it requires"""
+
+    def __init__(
+        self, key: Hashable, func: Callable, requires: Iterable = (), cost: float = 0
+    ):
+        # steps are deduplicated by key
+        self.key = key
+        self.func = func
+        self.requires = list(requires)
+        # roughly how many seconds we expect it to take
+        self.cost = cost
+        self.state = PENDING
+        # the exception raised by func, if it failed
+        self.error = None
+        # time.perf_counter() when it started running
+        self.started = None
+        # the cost of this step and the longest chain of steps which need it
+        self.rank = cost
+
+    def __repr__(self):
+        return "Step({!r}, {})".format(self.key, self.state)
+
+
+class Scheduler:
+    """Run steps on a pool of worker threads, respecting their dependencies
+
+    With more than one job, of the steps which are ready, the one at the
+    head of the longest chain of remaining work, by cost, is started first.
+    Starting the longest work first means the short steps fill in around it
+    at the end, rather than one long step running on its own after everything
+    else is done. With one job the order can't change how long it all takes,
+    so steps start in the order they were added.
+
+    >>> done = []
+    >>> scheduler = Scheduler(jobs=2)
+    >>> install = scheduler.add(('install', '3.8.1'), lambda: done.append('install'))
+    >>> _ = scheduler.add(('create', 'fred'), lambda: done.append('create'), [install])
+    >>> scheduler.run()
+    []
+    >>> done
+    ['install', 'create']
+    """
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        keep_going: bool = True,
+        finished: Optional[Callable[[Step], None]] = None,
+    ):
+        self.jobs = max(1, jobs)
+        # if False, don't start any more steps after one fails
+        self.keep_going = keep_going
+        # called from the worker thread after each step finishes, before
+        # run() can return
+        self.finished = finished
+        self.steps = {}
+        self._order = []
+        self._condition = threading.Condition()
+
+    def add(
+        self, key: Hashable, func: Callable, requires: Iterable = (), cost: float = 0
+    ) -> Step:
+        """Add a step, unless one with the same key has already been added
+
+        :cost: roughly how many seconds the step will take
+        :return: the step with this key
+        """
+        step = self.steps.get(key)
+        if step is None:
+            step = Step(key, func, requires, cost)
+            self.steps[key] = step
+            self._order.append(step)
+        return step
+
+    def _rank(self):
+        """Work out the longest chain of remaining work starting at each step"""
+        # a step is always added after the steps it requires, so walking
+        # backwards visits every step after all the steps which need it
+        for step in self._order:
+            step.rank = step.cost
+        for step in reversed(self._order):
+            for requirement in step.requires:
+                requirement.rank = max(requirement.rank, requirement.cost + step.rank)
+
+    def eta(self) -> Optional[float]:
+        """Estimate the seconds until all the steps are finished, or None
+
+        This is the longer of the remaining cost shared between the workers,
+        and the longest remaining chain of steps. It is None if no step has
+        a cost.
+        """
+        now = time.perf_counter()
+        total = 0
+        longest = 0
+        known = False
+        for step in self._order:
+            known = known or step.cost > 0
+            if step.state not in (PENDING, RUNNING):
+                continue
+            left = step.cost
+            if step.state == RUNNING and step.started is not None:
+                left = max(0, step.cost - (now - step.started))
+            total += left
+            longest = max(longest, step.rank - step.cost + left)
+        if not known:
+            return None
+        return max(total / self.jobs, longest)
+
+    def _ready(self) -> List[Step]:
+        """Mark steps with failed requirements as skipped, and return runnable steps"""
+        ready = []
+        for step in self._order:
+            if step.state != PENDING:
+                continue
+            states = {requirement.state for requirement in step.requires}
+            if states & {FAILED, SKIPPED}:
+                step.state = SKIPPED
+            elif states <= {DONE}:
+                ready.append(step)
+        return ready
+
+    def _work(self, step: Step):
+        """Run a step in a worker thread"""
+        try:
+            step.func()
+            state = DONE
+        except Exception as err:  # pylint: disable=broad-except
+            step.error = err
+            state = FAILED
+        with self._condition:
+            step.state = state
+            if self.finished:
+                self.finished(step)
+            self._condition.notify_all()
+
+    def run(self) -> List[Step]:
+        """Run all the steps, returning those which failed or were skipped
+
+        Steps are started as soon as a worker is free and everything they
+        require is done. With more than one job, those with the longest chain
+        of work after them go first, otherwise and when ranks are equal they
+        start in the order they were added.
+        """
+        self._rank()
+        running = 0
+        failed = False
+        with self._condition:
+            while True:
+                ready = self._ready()
+                if self.jobs > 1:
+                    ready.sort(key=lambda step: -step.rank)
+                while ready and running < self.jobs and (self.keep_going or not failed):
+                    step = ready.pop(0)
+                    step.state = RUNNING
+                    step.started = time.perf_counter()
+                    running += 1
+                    threading.Thread(
+                        target=self._work, args=(step,), daemon=True
+                    ).start()
+                if running == 0:
+                    break
+                self._condition.wait()
+                running = sum(1 for s in self._order if s.state == RUNNING)
+                failed = any(s.state == FAILED for s in self._order)
+
+        for step in self._order:
+            if step.state == PENDING:
+                step.state = SKIPPED
+        return [s for s in self._order if s.state in (FAILED, SKIPPED)]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Work out how to bring the packages in an environment up to date in place
+"""
+
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# packages which come with every environment, and are never removed
+SEED_PACKAGES = {"pip", "setuptools", "wheel", "distribute", "pkg-resources"}
+
+# options which only say where to find packages, not which to install
+LOCATION_OPTIONS = ("--index-url", "--extra-index-url", "--find-links", "-i", "-f")
+
+PIN = re.compile(
+    r"^(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*==\s*(?P<version>[^\s;*]+)$"
+)
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a package name the way pip compares them
+
+    >>> normalize_name('Zope.Interface'), normalize_name('typing_extensions')
+    ('zope-interface', 'typing-extensions')
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_pins(lines) -> Optional[Dict[str, str]]:
+    """Parse a requirements file in which every requirement is pinned
+
+    Hashes, like those written by pip-compile --generate-hashes, are allowed.
+
+    >>> parse_pins(['Django==3.0.2  # via -r in', 'pytz==2019.3 \\\\', '  --hash=sha256:ab'])
+    {'django': '3.0.2', 'pytz': '2019.3'}
+    >>> print(parse_pins(['requests>=2']))
+    None
+
+    :return: a dictionary of normalized name to version, or None if there are
+             requirements we can't compare with what is installed, like
+             ranges, includes, editables or environment markers
+    """
+    pins = {}
+    logical = ""
+    for line in lines:
+        line = re.sub(r"(^|\s)#.*", "", line.rstrip("\n"))
+        if line.endswith("\\"):
+            logical += line[:-1] + " "
+            continue
+        logical = (logical + line).strip()
+        # the options which may follow a requirement on the same line
+        logical = re.sub(r"\s--hash[=\s]\S+", "", logical).strip()
+        line, logical = logical, ""
+        if not line or line.startswith(LOCATION_OPTIONS):
+            continue
+        match = PIN.match(line)
+        if not match:
+            return None
+        pins[normalize_name(match.group("name"))] = match.group("version")
+    return pins
+
+
+def pinned_requirements(path: str) -> Optional[Dict[str, str]]:
+    """Read the pins from a requirements file, see parse_pins()
+
+    :return: the pins, or None if the file can't be read or isn't fully pinned
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return parse_pins(file)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def parse_pip_list(output: str) -> Dict[str, str]:
+    """Parse the output of pip list --format=json into normalized name to version"""
+    try:
+        packages = json.loads(output or "[]")
+    except ValueError:
+        return {}
+    return {
+        normalize_name(package["name"]): package["version"]
+        for package in packages
+        if isinstance(package, dict) and "name" in package and "version" in package
+    }
+
+
+def diff_packages(
+    installed: Dict[str, str], desired: Dict[str, str]
+) -> Tuple[List[str], List[str]]:
+    """Work out which packages to install and remove to get the desired ones
+
+    >>> diff_packages({'pip': '20.0', 'six': '1.13', 'attrs': '19.3'},
+    ...               {'six': '1.14', 'toml': '0.10'})
+    (['six==1.14', 'toml==0.10'], ['attrs'])
+
+    :return: a tuple of requirements to install, and names to uninstall
+    """
+    install = [
+        "{}=={}".format(name, version)
+        for name, version in sorted(desired.items())
+        if installed.get(name) != version
+    ]
+    uninstall = [
+        name
+        for name in sorted(installed)
+        if name not in desired and name not in SEED_PACKAGES
+    ]
+    return install, uninstall
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Record how long each step of building environments takes
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import List
+
+# categories of spans
+PHASE = "phase"
+SUBPROCESS = "subprocess"
+
+
+def format_duration(seconds: float) -> str:
+    """Format a number of seconds for people to read
+
+    >>> format_duration(42.5), format_duration(130), format_duration(7380)
+    ('42s', '2m10s', '2h03m')
+    """
+    seconds = round(seconds)
+    if seconds < 60:
+        return "{}s".format(seconds)
+    if seconds < 60 * 60:
+        return "{}m{:02d}s".format(seconds // 60, seconds % 60)
+    return "{}h{:02d}m".format(seconds // 3600, seconds % 3600 // 60)
+
+
+# pylint: disable=too-few-public-methods
+class Span:
+    """Data class to hold one timed step"""
+
+    def __init__(self, name, category, start, thread, args):
+        self.name = name
+        self.category = category
+        # seconds, from time.perf_counter()
+        self.start = start
+        self.end = None
+        # which thread ran this step
+        self.thread = thread
+        # tags like the environment name and python version
+        self.args = args
+
+    @property
+    def duration(self):
+        """return the number of seconds this step took"""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+
+class Tracer:
+    """Collect timed spans, and report them as a table or a Chrome trace
+
+    Spans may be recorded from several threads at once.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = PHASE, **args):
+        """Time the body of a with statement
+
+        >>> tracer = Tracer()
+        >>> with tracer.span('install', version='3.8.1'):
+        ...     pass
+        >>> tracer.spans[0].args
+        {'version': '3.8.1'}
+        """
+        with self._lock:
+            thread = self._threads.setdefault(
+                threading.get_ident(), len(self._threads) + 1
+            )
+            span = Span(name, category, time.perf_counter(), thread, args)
+            self.spans.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+
+    def summary(self) -> str:
+        """Return a table of how long each phase took"""
+        rows = [("step", "environment", "version", "seconds")]
+        for span in self.spans:
+            if span.category != PHASE or span.end is None:
+                continue
+            rows.append(
+                (
+                    span.name,
+                    span.args.get("environment", ""),
+                    span.args.get("version", ""),
+                    "{:.2f}".format(span.duration),
+                )
+            )
+        rows.append(
+            ("total", "", "", "{:.2f}".format(time.perf_counter() - self._origin))
+        )
+        widths = [max(len(row[col]) for row in rows) for col in range(4)]
+        template = "{{:<{}}}  {{:<{}}}  {{:<{}}}  {{:>{}}}".format(*widths)
+        lines = [template.format(*row).rstrip() for row in rows]
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """Return the spans in Chrome trace-event format, which Perfetto can also read"""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            if span.end is None:
+                continue
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round((span.start - self._origin) * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": span.args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str):
+        """Write the spans to a file in Chrome trace-event format"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file)
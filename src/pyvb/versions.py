@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Parse python version strings and index the versions pyenv can install
+"""
+
+import bisect
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# an optional implementation name, like 'pypy3.6' or 'anaconda3', followed by
+# a dash, then a numeric release, like '3.8.1', then an optional tag, like
+# 'rc1', '-dev', or '-src'
+VERSION_RE = re.compile(
+    r"^(?:(?P<implementation>[A-Za-z][\w.-]*?)-)?"
+    r"(?P<release>\d+(?:\.\d+)*)"
+    r"(?P<tag>.*)$"
+)
+# a version specifier has no tag, and may have an implementation with no release
+SPEC_RE = re.compile(
+    # an optional implementation, followed by a dash or by nothing else
+    r"^(?:(?P<implementation>[A-Za-z][\w.-]*?)(?:-|$))?"
+    # an optional numeric release
+    r"(?P<release>\d+(?:\.\d+)*)?$"
+)
+
+
+# pylint: disable=too-few-public-methods
+class Version:
+    """A parsed version string from the pyenv catalog
+
+    >>> v = Version.parse('pypy3.6-7.3.0-src')
+    >>> v.implementation, v.release, v.tag
+    ('pypy3.6', (7, 3, 0), '-src')
+    >>> v = Version.parse('3.7.5rc1')
+    >>> v.implementation, v.release, v.tag
+    (None, (3, 7, 5), 'rc1')
+    """
+
+    __slots__ = ("text", "implementation", "release", "tag")
+
+    def __init__(
+        self, text: str, implementation: Optional[str], release: Tuple, tag: str
+    ):
+        self.text = text
+        # None for CPython
+        self.implementation = implementation
+        self.release = release
+        # anything after the release, like 'rc1', '-dev', or '-src'
+        self.tag = tag
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["Version"]:
+        """Parse a version string, returning None if it has no numeric release"""
+        match = VERSION_RE.match(text)
+        if not match:
+            return None
+        release = tuple(int(x) for x in match.group("release").split("."))
+        return cls(text, match.group("implementation"), release, match.group("tag"))
+
+    @property
+    def is_final(self) -> bool:
+        """True if this is a final release, not a dev, beta, rc, or source build"""
+        return not self.tag
+
+    def __repr__(self):
+        return "Version({!r})".format(self.text)
+
+
+class VersionIndex:
+    """A sorted index of the final releases in the pyenv catalog
+
+    Build it once from the catalog, then look up the latest release matching
+    a specifier. Lookups by major.minor are a dictionary access, other
+    lookups are a binary search.
+
+    >>> index = VersionIndex(['3.1.5', '3.10.0', '3.10.1', '3.10-dev', 'pypy3.6-7.3.0'])
+    >>> index.latest('3.1')
+    '3.1.5'
+    >>> index.latest('3')
+    '3.10.1'
+    >>> index.latest('pypy3.6')
+    'pypy3.6-7.3.0'
+    """
+
+    def __init__(self, versions: Iterable[str] = ()):
+        self._all = set()
+        # sorted release tuples and versions for each implementation
+        self._releases: Dict[Optional[str], List[Tuple]] = {}
+        self._versions: Dict[Optional[str], List[Version]] = {}
+        # the latest version for each (implementation, major, minor)
+        self._latest_minor: Dict[Tuple, Version] = {}
+        for text in versions:
+            self.add(text)
+
+    def add(self, text: str) -> Optional[Version]:
+        """Add a version from the catalog to the index
+
+        :return: the parsed version, or None if it has no numeric release
+        """
+        self._all.add(text)
+        version = Version.parse(text)
+        if not version or not version.is_final:
+            return version
+        impl = version.implementation
+        releases = self._releases.setdefault(impl, [])
+        # the catalog is mostly sorted, so this is usually an append
+        position = bisect.bisect_right(releases, version.release)
+        releases.insert(position, version.release)
+        self._versions.setdefault(impl, []).insert(position, version)
+        if len(version.release) >= 2:
+            key = (impl,) + version.release[:2]
+            latest = self._latest_minor.get(key)
+            if latest is None or latest.release <= version.release:
+                self._latest_minor[key] = version
+        return version
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._all
+
+    def close(self):
+        """Release the catalog, which for a plain index is nothing"""
+
+    def latest(self, spec: str) -> Optional[str]:
+        """Return the latest final release matching a specifier, or None
+
+        :spec: a version specifier like '3', '3.8', '3.8.1', 'pypy3.6', or
+               'pypy3.6-7.3'. Matching is by whole numeric components, so
+               '3.1' does not match '3.10.0'.
+        """
+        match = SPEC_RE.match(spec)
+        if not match:
+            return None
+        impl = match.group("implementation")
+        release = match.group("release")
+        if impl is None and release is None:
+            return None
+        prefix = tuple(int(x) for x in release.split(".")) if release else ()
+
+        if len(prefix) == 2:
+            latest = self._latest_minor.get((impl,) + prefix)
+            return latest.text if latest else None
+
+        releases = self._releases.get(impl)
+        if not releases:
+            return None
+        if not prefix:
+            return self._versions[impl][-1].text
+        # everything starting with prefix sorts between prefix and the next
+        # value of its last component
+        upper = prefix[:-1] + (prefix[-1] + 1,)
+        low = bisect.bisect_left(releases, prefix)
+        high = bisect.bisect_left(releases, upper)
+        if high > low:
+            return self._versions[impl][high - 1].text
+        return None
+
+
+class StreamingVersionIndex(VersionIndex):
+    """A VersionIndex which reads the catalog only as far as it has to
+
+    The catalog must be in the order `pyenv install --list` prints it, where
+    CPython versions are sorted by release. Looking up a CPython version
+    stops reading as soon as a later release has been seen, so asking for
+    the latest 3.8 doesn't parse the hundreds of versions after it. Other
+    lookups, and lookups which find nothing, read the rest of the catalog,
+    so a catalog in some other order gives the same answers, only slower.
+
+    >>> index = StreamingVersionIndex(iter(['3.8.0', '3.8.1', '3.9.0', '3.10.0']))
+    >>> index.latest('3.8')
+    '3.8.1'
+    >>> '3.10.0' in index._all
+    False
+    """
+
+    def __init__(self, versions: Iterator[str]):
+        super().__init__()
+        self._source = versions
+        self._exhausted = False
+        # the release of the last CPython version read from the catalog
+        self._last = ()
+
+    def _read(self) -> bool:
+        """Read one more version from the catalog, return False at the end"""
+        if self._exhausted:
+            return False
+        try:
+            text = next(self._source)
+        except StopIteration:
+            self._exhausted = True
+            return False
+        version = self.add(text)
+        if version and version.implementation is None:
+            self._last = version.release
+        return True
+
+    def _read_past(self, spec: str):
+        """Read until every version matching spec has been read"""
+        match = SPEC_RE.match(spec) or VERSION_RE.match(spec)
+        release = match.group("release") if match else None
+        if not match or match.group("implementation") or not release:
+            # no shortcut, read everything
+            self._read_rest()
+            return
+        prefix = tuple(int(x) for x in release.split("."))
+        while self._last[: len(prefix)] <= prefix and self._read():
+            pass
+
+    def _read_rest(self):
+        """Read the rest of the catalog"""
+        while self._read():
+            pass
+
+    def close(self):
+        """Stop reading the catalog, releasing whatever it is read from
+
+        Lookups afterwards only see the versions which were already read.
+        """
+        close = getattr(self._source, "close", None)
+        if close:
+            close()
+        self._exhausted = True
+
+    def __contains__(self, text: str) -> bool:
+        if text not in self._all:
+            self._read_past(text)
+        if text not in self._all:
+            self._read_rest()
+        return super().__contains__(text)
+
+    def latest(self, spec: str) -> Optional[str]:
+        self._read_past(spec)
+        found = super().latest(spec)
+        if found is None and not self._exhausted:
+            self._read_rest()
+            found = super().latest(spec)
+        return found
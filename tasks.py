@@ -54,6 +54,16 @@ def pytest_clean(context):
 namespace_clean.add_task(pytest_clean, "pytest")
 
 
+@invoke.task
+def bench(context):
+    "Run the benchmarks"
+    context.run("python benchmarks/bench_version_index.py", pty=True)
+    context.run("python benchmarks/bench_pyvb.py", pty=True)
+
+
+namespace.add_task(bench)
+
+
 @invoke.task
 def pylint(context):
     "Check code quality using pylint"
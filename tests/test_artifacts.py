@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the cache of compiled pythons
+"""
+
+import os
+import shutil
+
+import pytest
+
+from pyvb.artifacts import ArtifactCache, compiler_version, parse_size
+
+
+def test_parse_size():
+    assert parse_size("500M") == 500 * 1024 * 1024
+    assert parse_size("1.5k") == 1536
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_key_depends_on_build():
+    key = ArtifactCache.key("3.8.1", "/pyenv/versions/3.8.1", {})
+    assert key.startswith("3.8.1-")
+    assert key == ArtifactCache.key("3.8.1", "/pyenv/versions/3.8.1", {})
+    assert key != ArtifactCache.key("3.8.1", "/other/versions/3.8.1", {})
+    assert key != ArtifactCache.key("3.8.1", "/pyenv/versions/3.8.1", {"CC": "clang"})
+    # upgrading the compiler changes the key, even when CC isn't set
+    gcc9 = ArtifactCache.key("3.8.1", "/pyenv/versions/3.8.1", {}, "gcc 9.3.0")
+    gcc10 = ArtifactCache.key("3.8.1", "/pyenv/versions/3.8.1", {}, "gcc 10.2.0")
+    assert gcc9 != gcc10
+
+
+def test_compiler_version(tmp_path):
+    compiler = tmp_path / "cc"
+    compiler.write_text('#!/bin/sh\necho "cc (Fake) 9.3.0"\necho "Copyright"\n')
+    compiler.chmod(0o755)
+    assert compiler_version({"CC": str(compiler)}) == "cc (Fake) 9.3.0"
+    # a compiler which can't be run is known by its command
+    missing = str(tmp_path / "missing")
+    assert compiler_version({"CC": missing + " -m64"}) == missing + " -m64"
+
+
+def test_store_and_restore(tmp_path, fake_env):
+    prefix = fake_env("3.8.1")
+    os.symlink("python", str(prefix / "bin" / "python3"))
+    cache = ArtifactCache(str(tmp_path / "artifacts"))
+    key = cache.key("3.8.1", str(prefix))
+    assert not cache.restore(key, str(prefix))
+
+    cache.store(key, str(prefix))
+    shutil.rmtree(str(prefix))
+    assert cache.restore(key, str(prefix))
+    assert (prefix / "bin" / "python").is_file()
+    assert os.readlink(str(prefix / "bin" / "python3")) == "python"
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=250)
+    for age, name in enumerate(["new", "middle", "old"]):
+        path = tmp_path / (name + ".tar.gz")
+        path.write_bytes(b"x" * 100)
+        os.utime(str(path), (1000 - age, 1000 - age))
+    cache.evict()
+    assert sorted(os.listdir(str(tmp_path))) == ["middle.tar.gz", "new.tar.gz"]
+
+
+def test_install_uses_cache(prog, mocker, tmp_path, fake_env):
+    def run(argv, **kwargs):
+        if argv[:2] == ["pyenv", "install"]:
+            fake_env(argv[-1])
+
+    run_mock = mocker.patch("subprocess.run", side_effect=run)
+    compiler = mocker.patch("pyvb.artifacts.compiler_version", return_value="gcc 9.3.0")
+    prog.artifact_cache = ArtifactCache(str(tmp_path / "artifacts"))
+    prog.install_python("3.8.1")
+    assert run_mock.call_count == 1
+    shutil.rmtree(str(fake_env("3.8.1")))
+
+    prog.install_python("3.8.1")
+    assert run_mock.call_count == 1
+    assert (fake_env("3.8.1") / "bin" / "python").is_file()
+    shutil.rmtree(str(fake_env("3.8.1")))
+
+    # a new compiler means compiling again
+    compiler.return_value = "gcc 10.2.0"
+    prog.install_python("3.8.1")
+    assert run_mock.call_count == 2
+
+
+def test_profiles_are_cached_separately(prog, mocker, tmp_path, fake_env):
+    def run(argv, **kwargs):
+        if argv[:2] == ["pyenv", "install"]:
+            fake_env(argv[-1])
+
+    run_mock = mocker.patch("subprocess.run", side_effect=run)
+    mocker.patch("pyvb.artifacts.compiler_version", return_value="gcc 9.3.0")
+    prog.artifact_cache = ArtifactCache(str(tmp_path / "artifacts"))
+    prog.install_python("3.8.1")
+    shutil.rmtree(str(fake_env("3.8.1")))
+
+    # an optimized python isn't the same as the one in the cache
+    prog.profile = "optimized"
+    prog.install_python("3.8.1")
+    assert run_mock.call_count == 2
+    env = run_mock.call_args.kwargs["env"]
+    assert "--enable-optimizations" in env["PYTHON_CONFIGURE_OPTS"]
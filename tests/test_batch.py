@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for batch files
+"""
+
+import pytest
+
+from pyvb.batch import BatchError, load_batch
+
+BATCH = """
+[defaults]
+python = ["3.7", "3.8"]
+
+[projects.fred]
+python = "3.6,3.8"
+requirements = "fred/requirements.txt"
+
+[projects.wilma]
+"""
+
+
+def test_load_batch(tmp_path):
+    path = tmp_path / "batch.toml"
+    path.write_text(BATCH)
+    fred, wilma = load_batch(str(path))
+    assert fred.name == "fred"
+    assert fred.pythons == ["3.6,3.8"]
+    assert fred.requirements == str(tmp_path / "fred" / "requirements.txt")
+    assert wilma.pythons == ["3.7", "3.8"]
+    assert wilma.requirements is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "[projects.fred]\nbogus = 1\n",
+        "[projects.fred]\npython = 3.8\n",
+        "[defaults]\npython = ['3.8']\n",
+        "[project.fred]\n",
+        "not toml",
+    ],
+)
+def test_load_batch_errors(tmp_path, content):
+    path = tmp_path / "batch.toml"
+    path.write_text(content)
+    with pytest.raises(BatchError):
+        load_batch(str(path))
+
+
+def test_main_batch(prog, mocker, tmp_path, pyenv_run, pyenv_root):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    run_mock = pyenv_run
+    path = tmp_path / "batch.toml"
+    path.write_text("[projects.fred]\npython = '3.7,3.8'\n[projects.wilma]\n")
+    assert prog.main(["--batch", str(path), "-p", "3.8", "-j", "2"]) == 0
+
+    commands = [c.args[0] for c in run_mock.call_args_list]
+    installs = [argv[-1] for argv in commands if argv[1] == "install"]
+    # both projects want 3.8.1, but it's only installed once
+    assert sorted(installs) == ["3.7.6", "3.8.1"]
+    created = sorted(x.name for x in (pyenv_root / "versions").iterdir())
+    assert created == ["3.7.6", "3.8.1", "fred-3.7.6", "fred-3.8.1", "wilma-3.8.1"]
+
+
+def test_main_batch_invalid(prog, mocker, tmp_path, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["--batch", str(tmp_path / "missing.toml")]) == 1
+    assert "can't read" in capsys.readouterr().out
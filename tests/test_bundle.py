@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for bundles of pythons and environments
+"""
+
+import io
+import json
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+import pyvb
+from pyvb.bundle import BundleError, read_bundle, rewrite_tree, write_bundle
+
+
+def make_bundle(members, manifest):
+    """Write a tarball with some files and a bundle.json"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in list(members.items()) + [
+            ("bundle.json", json.dumps(manifest).encode("utf-8"))
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def test_round_trip(tmp_path):
+    prefix = tmp_path / "old" / "versions" / "3.8.1"
+    (prefix / "bin").mkdir(parents=True)
+    (prefix / "bin" / "python3.8").write_bytes(b"\0binary")
+    (prefix / "bin" / "python").symlink_to("python3.8")
+    (prefix / "envs" / "pool").mkdir(parents=True)
+    env = tmp_path / "old" / "fred"
+    (env / "bin").mkdir(parents=True)
+    (env / "pyvenv.cfg").write_text("home = {}/bin\n".format(prefix))
+    (env / "bin" / "python").symlink_to(prefix / "bin" / "python")
+
+    buffer = io.BytesIO()
+    write_bundle(buffer, "3.8.1", str(prefix), {"fred": str(env)}, str(tmp_path))
+    buffer.seek(0)
+    dest = tmp_path / "dest"
+    manifest = read_bundle(buffer, str(dest))
+    assert manifest["version"] == "3.8.1"
+    assert manifest["environments"] == {"fred": str(env)}
+    # environments are bundled by themselves
+    assert not (dest / "python" / "envs").exists()
+    assert (dest / "python" / "bin" / "python3.8").read_bytes() == b"\0binary"
+
+    new_prefix = str(tmp_path / "new" / "versions" / "3.8.1")
+    count = rewrite_tree(str(dest / "envs" / "fred"), [(str(prefix), new_prefix)])
+    assert count == 2
+    assert os.readlink(str(dest / "envs" / "fred" / "bin" / "python")) == (
+        new_prefix + "/bin/python"
+    )
+    cfg = (dest / "envs" / "fred" / "pyvenv.cfg").read_text()
+    assert cfg == "home = {}/bin\n".format(new_prefix)
+
+
+def test_checksum_mismatch(tmp_path):
+    manifest = {
+        "format": 1,
+        "version": "3.8.1",
+        "environments": {},
+        "files": {"python/bin/python": "0" * 64},
+    }
+    bundle = make_bundle({"python/bin/python": b"tampered"}, manifest)
+    with pytest.raises(BundleError, match="checksum"):
+        read_bundle(bundle, str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    "name, manifest",
+    [
+        ("etc/passwd", {}),
+        ("python/../../escape", {}),
+        ("python/bin/python", {"format": 1, "version": "../3.8.1"}),
+        ("python/bin/python", None),
+    ],
+)
+def test_bad_bundles(tmp_path, name, manifest):
+    bundle = make_bundle({name: b""}, manifest)
+    with pytest.raises(BundleError):
+        read_bundle(bundle, str(tmp_path))
+
+
+def test_export_import(prog, mocker, pyenv_root, pyenv_run, tmp_path, monkeypatch):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8"]) == 0
+    bundle = str(tmp_path / "bundle.tar.gz")
+    assert pyvb.Pyvb().main(["export", "3.8.1", "-o", bundle]) == 0
+    assert pyvb.Pyvb().main(["export", "3.9.0", "-o", bundle]) == 1
+
+    # import on a host with a different $PYENV_ROOT
+    new_root = tmp_path / "elsewhere"
+    monkeypatch.setenv("PYENV_ROOT", str(new_root))
+    assert pyvb.Pyvb().main(["import", bundle]) == 0
+    env = new_root / "versions" / "fred-3.8.1"
+    assert env.is_symlink()
+    assert os.path.realpath(str(env)).startswith(str(new_root / "versions" / "3.8.1"))
+    assert str(pyenv_root) not in (env / "pyvenv.cfg").read_text()
+    assert pyvb.pyvb.Environment("fred-3.8.1").is_healthy()
+    assert "fred-3.8.1" in pyvb.pyvb.Manifest().environments()
+
+    # importing again replaces the environment and keeps the python
+    assert pyvb.Pyvb().main(["import", bundle]) == 0
+    assert pyvb.pyvb.Environment("fred-3.8.1").is_healthy()
+
+
+def test_import_under_longer_root(
+    prog, mocker, pyenv_root, pyenv_run, tmp_path, monkeypatch
+):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8"]) == 0
+    # a python which reads a file from its prefix, and a pip which runs it
+    prefix = pyenv_root / "versions" / "3.8.1"
+    (prefix / "lib").mkdir()
+    (prefix / "lib" / "site.txt").write_text("works\n")
+    (prefix / "bin" / "python").write_text(
+        '#!/bin/sh\ncat "{}/lib/site.txt"\n'.format(prefix)
+    )
+    env = pyenv_root / "versions" / "fred-3.8.1"
+    pip = env / "bin" / "pip"
+    pip.write_text("#!{}/bin/python\n".format(os.path.realpath(str(env))))
+    pip.chmod(0o755)
+    # the bundle gets the mode from the umask, like any other file
+    monkeypatch.setattr("pyvb.files._umask", 0o027)
+    bundle = str(tmp_path / "bundle.tar.gz")
+    assert pyvb.Pyvb().main(["export", "3.8.1", "-o", bundle]) == 0
+    assert os.stat(bundle).st_mode & 0o777 == 0o640
+
+    # the new root starts with the old one, so paths must only be rewritten once
+    new_root = str(pyenv_root) + "2"
+    monkeypatch.setenv("PYENV_ROOT", new_root)
+    assert pyvb.Pyvb().main(["import", bundle]) == 0
+    new_env = os.path.join(new_root, "versions", "fred-3.8.1")
+    real = os.path.realpath(new_env)
+    assert real.startswith(os.path.join(new_root, "versions", "3.8.1") + os.sep)
+    with open(os.path.join(real, "pyvenv.cfg"), encoding="utf-8") as file:
+        assert new_root + "2" not in file.read()
+    # subprocess.run is mocked, so use Popen to run them
+    for program in ["python", "pip"]:
+        with subprocess.Popen(
+            [os.path.join(new_env, "bin", program)], stdout=subprocess.PIPE, text=True
+        ) as process:
+            assert process.stdout.read() == "works\n"
+        assert process.returncode == 0
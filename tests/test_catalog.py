@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the on-disk catalog cache
+"""
+
+import os
+
+import pytest
+
+import pyvb
+from pyvb.catalog import CatalogCache
+
+
+def test_cache_round_trip(tmp_path):
+    cache = CatalogCache(str(tmp_path / "catalog.txt"))
+    key = cache.key("pyenv 1.2.16")
+    assert cache.load(key) is None
+    assert list(cache.save(key, iter(["3.8.0", "3.8.1"]))) == ["3.8.0", "3.8.1"]
+    assert list(cache.load(key)) == ["3.8.0", "3.8.1"]
+    # a different pyenv version invalidates the cache
+    assert cache.load(cache.key("pyenv 1.2.17")) is None
+
+
+def test_cache_ttl(tmp_path):
+    cache = CatalogCache(str(tmp_path / "catalog.txt"), ttl=-1)
+    key = cache.key("pyenv 1.2.16")
+    list(cache.save(key, iter(["3.8.1"])))
+    assert cache.load(key) is None
+
+
+def test_cache_not_saved_on_error(tmp_path):
+    cache = CatalogCache(str(tmp_path / "catalog.txt"))
+    key = cache.key("pyenv 1.2.16")
+
+    def failing():
+        yield "3.8.0"
+        raise OSError("pyenv died")
+
+    with pytest.raises(OSError):
+        list(cache.save(key, failing()))
+    assert cache.load(key) is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_all_pythons_uses_cache(mocker, pythons):
+    mocker.patch("pyvb.Pyvb.pyenv_version", return_value="pyenv 1.2.16")
+    mocker.patch("pyvb.discovery.available_pythons", return_value=None)
+    all_mock = mocker.patch(
+        "pyvb.Pyvb._get_all_pythons",
+        side_effect=lambda: iter(pythons.splitlines(keepends=True)),
+    )
+    pyvb.Pyvb().all_pythons()
+    pyvb.Pyvb().all_pythons()
+    assert all_mock.call_count == 1
+    prog = pyvb.Pyvb()
+    prog.refresh_catalog = True
+    prog.all_pythons()
+    assert all_mock.call_count == 2
+
+
+def test_lookup_saves_whole_catalog(mocker, tmp_path, pythons):
+    mocker.patch("pyvb.Pyvb.pyenv_version", return_value="pyenv 1.2.16")
+    mocker.patch("pyvb.discovery.available_pythons", return_value=None)
+    mocker.patch(
+        "pyvb.Pyvb._get_all_pythons",
+        side_effect=lambda: iter(pythons.splitlines(keepends=True)),
+    )
+    prog = pyvb.Pyvb()
+    prog.catalog_cache = CatalogCache(str(tmp_path / "catalog.txt"))
+    # the lookup could stop early, but the catalog is still cached in full
+    assert prog.version_index().latest("3.6") == "3.6.10"
+    prog.close_catalog()
+    key = prog.catalog_cache.key("pyenv 1.2.16")
+    assert list(prog.catalog_cache.load(key)) == list(
+        pyvb.catalog.parse_catalog(pythons.splitlines())
+    )
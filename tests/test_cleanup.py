@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for garbage collecting pythons and environments
+"""
+
+import os
+
+import pytest
+
+from pyvb.cleanup import Candidate, choose_pythons, stale_staging, tree_size
+from pyvb.locks import FileLock, lock_path
+
+
+@pytest.fixture
+def installed(prog, mocker, fake_env, pyenv_root):
+    """Install pythons, some by pyvb and some by hand, and a half built environment"""
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    for version in ["3.6.10", "3.7.5", "3.8.1"]:
+        fake_env(version)
+    prog.manifest.record_python("3.7.5", installed=True)
+    prog.manifest.record_python("3.8.1", installed=True)
+    fake_env("3.8.1", "fred-3.8.1")
+    prog.manifest.record("fred-3.8.1", "3.8.1", "fingerprint")
+    fake_env("3.8.1", "wilma-3.8.1-pyvb-0123abcd")
+    staging = pyenv_root / "versions" / "wilma-3.8.1-pyvb-0123abcd"
+    os.utime(str(staging), (0, 0), follow_symlinks=False)
+    return pyenv_root / "versions"
+
+
+def test_tree_size(tmp_path):
+    (tmp_path / "a").write_bytes(b"x" * 10000)
+    os.link(str(tmp_path / "a"), str(tmp_path / "b"))
+    os.symlink("a", str(tmp_path / "c"))
+    size = tree_size(str(tmp_path))
+    assert 10000 <= size < 20000
+
+
+def test_choose_never_removes_used():
+    used = Candidate("3.8.1", 1000, 0, ["fred-3.8.1"])
+    assert choose_pythons([used], max_bytes=0) == []
+
+
+def test_stale_staging(installed):
+    assert stale_staging() == ["wilma-3.8.1-pyvb-0123abcd"]
+    # one which is still being built isn't stale
+    assert stale_staging(now=0) == []
+
+
+def test_gc_dry_run(prog, installed, pyenv_run, capsys):
+    assert prog.main(["gc", "--dry-run"]) == 0
+    out = capsys.readouterr().out
+    assert "removing python 3.7.5" in out
+    assert "removing stale environment wilma-3.8.1-pyvb-0123abcd" in out
+    assert out.splitlines()[-1].startswith("pyvb: would reclaim")
+    assert not pyenv_run.called
+
+
+def test_gc(prog, installed, pyenv_run, capsys):
+    assert prog.main(["gc"]) == 0
+    assert capsys.readouterr().out.startswith("pyvb: reclaimed")
+    # 3.6.10 wasn't installed by pyvb, and 3.8.1 is used by fred-3.8.1
+    assert sorted(os.listdir(str(installed))) == ["3.6.10", "3.8.1", "fred-3.8.1"]
+    assert sorted(prog.manifest.pythons()) == ["3.8.1"]
+
+    assert prog.main(["gc", "--all"]) == 0
+    assert sorted(os.listdir(str(installed))) == ["3.8.1", "fred-3.8.1"]
+
+
+def test_gc_budget(prog, installed, pyenv_run):
+    # everything already fits
+    assert prog.main(["gc", "--max-size", "1T"]) == 0
+    assert (installed / "3.7.5").exists()
+    # 3.7.5 was used just now
+    assert prog.main(["gc", "--unused-days", "1"]) == 0
+    assert (installed / "3.7.5").exists()
+
+
+def test_gc_leaves_what_other_runs_use(prog, installed, pyenv_run, capsys):
+    # another pyvb is installing 3.7.5 and building wilma-3.8.1
+    locks = [
+        FileLock(lock_path("python", "3.7.5")),
+        FileLock(lock_path("environment", "wilma-3.8.1")),
+    ]
+    for lock in locks:
+        lock.acquire()
+    assert prog.main(["gc", "-v"]) == 0
+    for lock in locks:
+        lock.release()
+    assert (installed / "3.7.5").exists()
+    assert (installed / "wilma-3.8.1-pyvb-0123abcd").is_symlink()
+    assert "leaving python 3.7.5" in capsys.readouterr().out
+    assert not pyenv_run.called
+
+
+def test_gc_rechecks_manifest(prog, installed, pyenv_run, mocker):
+    # another pyvb used 3.7.5 after gc chose it
+    candidates = prog.python_candidates()
+    prog.manifest.record_python("3.7.5")
+    mocker.patch("pyvb.Pyvb.python_candidates", return_value=candidates)
+    assert prog.main(["gc"]) == 0
+    assert (installed / "3.7.5").exists()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for cloning directory trees
+"""
+
+import errno
+import os
+
+from pyvb.clone import clone_tree
+
+
+def test_clone_tree(tmp_path):
+    src = tmp_path / "src"
+    (src / "bin").mkdir(parents=True)
+    (src / "lib" / "site-packages").mkdir(parents=True)
+    (src / "bin" / "pip").write_text("#!{}/bin/python\n".format(src))
+    (src / "bin" / "pip").chmod(0o755)
+    (src / "bin" / "data").write_text("nothing to rewrite")
+    (src / "lib" / "site-packages" / "pip.py").write_text("# mentions {}\n".format(src))
+    os.symlink(str(src / "bin" / "pip"), str(src / "bin" / "pip3"))
+    os.symlink("site-packages", str(src / "lib" / "packages"))
+
+    dst = tmp_path / "dst"
+    counts = clone_tree(str(src), str(dst), str(src), str(dst))
+    assert counts["rewritten"] == 1
+    assert counts["reflinked"] + counts["hardlinked"] + counts["copied"] == 2
+    assert (dst / "bin" / "pip").read_text() == "#!{}/bin/python\n".format(dst)
+    assert os.access(str(dst / "bin" / "pip"), os.X_OK)
+    assert os.readlink(str(dst / "bin" / "pip3")) == str(dst / "bin" / "pip")
+    assert os.readlink(str(dst / "lib" / "packages")) == "site-packages"
+    # package files are shared, not rewritten
+    package = dst / "lib" / "site-packages" / "pip.py"
+    assert package.read_text() == "# mentions {}\n".format(src)
+    if counts["hardlinked"]:
+        assert os.path.samefile(
+            str(package), str(src / "lib" / "site-packages" / "pip.py")
+        )
+
+
+def test_clone_tree_copies_when_it_cant_link(tmp_path, mocker):
+    src = tmp_path / "src"
+    (src / "lib" / "site-packages").mkdir(parents=True)
+    for name in ["pip.py", "six.py"]:
+        (src / "lib" / "site-packages" / name).write_text("# {}\n".format(name))
+    mocker.patch("pyvb.clone.reflink", return_value=False)
+    # like a template on another filesystem
+    link = mocker.patch(
+        "os.link", side_effect=OSError(errno.EXDEV, "Invalid cross-device link")
+    )
+
+    dst = tmp_path / "dst"
+    counts = clone_tree(str(src), str(dst), str(src), str(dst))
+    assert counts["copied"] == 2
+    assert counts["hardlinked"] == 0
+    # once linking fails, it isn't tried again
+    assert link.call_count == 1
+    assert (dst / "lib" / "site-packages" / "six.py").read_text() == "# six.py\n"
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for hardlinking identical files between environments
+"""
+
+import os
+
+import pytest
+
+from pyvb.dedupe import HashIndex, deduplicate, replace_with_link
+
+
+@pytest.fixture
+def envs(fake_env):
+    """Two environments with the same packages installed"""
+    envs = []
+    for name in ["fred-3.8.1", "wilma-3.8.1"]:
+        env = fake_env("3.8.1", name)
+        site = env / "lib" / "python3.8" / "site-packages"
+        site.mkdir(parents=True)
+        (site / "pip.py").write_bytes(b"x" * 10000)
+        (site / "empty.py").write_text("")
+        (site / (name + ".py")).write_text(name)
+        (env / "bin" / "pip").write_bytes(b"x" * 10000)
+        envs.append(env)
+    return envs
+
+
+def site_file(env, name):
+    return env / "lib" / "python3.8" / "site-packages" / name
+
+
+def test_deduplicate(envs, tmp_path):
+    fred, wilma = envs
+    index = HashIndex(str(tmp_path / "index.json"))
+    linked, saved = deduplicate([str(fred), str(wilma)], index)
+    assert linked == 1
+    assert saved >= 10000
+    assert site_file(fred, "pip.py").samefile(site_file(wilma, "pip.py"))
+    # scripts are never linked
+    assert not (fred / "bin" / "pip").samefile(wilma / "bin" / "pip")
+    assert not site_file(fred, "empty.py").samefile(site_file(wilma, "empty.py"))
+
+    # nothing left to do, and nothing has to be read again
+    index.save()
+    index = HashIndex(str(tmp_path / "index.json"))
+    index.load()
+    assert deduplicate([str(fred), str(wilma)], index) == (0, 0)
+    assert index.hashed == 0
+
+
+def test_dry_run(envs, tmp_path):
+    fred, wilma = envs
+    index = HashIndex(str(tmp_path / "index.json"))
+    assert deduplicate([str(fred), str(wilma)], index, dryrun=True)[0] == 1
+    assert not site_file(fred, "pip.py").samefile(site_file(wilma, "pip.py"))
+
+
+def test_changed_file_is_left_alone(envs):
+    fred, wilma = envs
+    original = site_file(fred, "pip.py")
+    path = site_file(wilma, "pip.py")
+    stat = os.lstat(str(path))
+    path.write_bytes(b"y" * 20000)
+    assert not replace_with_link(str(original), str(path), stat)
+    assert path.read_bytes() == b"y" * 20000
+    assert sorted(os.listdir(str(path.parent))) == [
+        "empty.py",
+        "pip.py",
+        "wilma-3.8.1.py",
+    ]
+
+
+def test_main_dedupe(prog, envs, capsys):
+    for env in envs:
+        prog.manifest.record(env.name, "3.8.1", "fingerprint")
+    assert prog.main(["dedupe"]) == 0
+    assert capsys.readouterr().out.startswith("pyvb: linked 1 files")
+    fred, wilma = envs
+    assert site_file(fred, "pip.py").samefile(site_file(wilma, "pip.py"))
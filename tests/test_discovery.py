@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for finding out about pyenv from the filesystem
+"""
+
+from pyvb import discovery
+
+
+def test_available_pythons(tmp_path, mocker, monkeypatch):
+    builtin = tmp_path / "python-build"
+    builtin.mkdir()
+    for name in ["3.10.0", "3.9.1", "2.7.18"]:
+        (builtin / name).write_text("")
+    (builtin / "patches").mkdir()
+    custom = tmp_path / "custom"
+    custom.mkdir()
+    (custom / "3.9-dev").write_text("")
+    mocker.patch("pyvb.locations.python_build_definitions", return_value=str(builtin))
+    monkeypatch.setenv("PYTHON_BUILD_DEFINITIONS", str(custom))
+    assert discovery.available_pythons() == ["2.7.18", "3.9-dev", "3.9.1", "3.10.0"]
+
+
+def test_available_pythons_unrecognized(mocker):
+    mocker.patch("pyvb.locations.python_build_definitions", return_value=None)
+    assert discovery.available_pythons() is None
+
+
+def test_is_installed(fake_env):
+    assert not discovery.is_installed("3.8.1")
+    fake_env("3.8.1", "fred-3.8.1")
+    assert discovery.is_installed("3.8.1")
+    assert not discovery.is_installed("3.7.6")
+
+
+def test_pyenv_version(tmp_path, mocker):
+    libexec = tmp_path / "libexec"
+    libexec.mkdir()
+    (libexec / "pyenv").write_text("")
+    (libexec / "pyenv---version").write_text('#!/bin/bash\nversion="2.6.8"\n')
+    mocker.patch("shutil.which", return_value=str(libexec / "pyenv"))
+    assert discovery.pyenv_version() == "pyenv 2.6.8"
+    mocker.patch("shutil.which", return_value=None)
+    assert discovery.pyenv_version() is None
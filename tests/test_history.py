@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the step duration history
+"""
+
+import pytest
+
+from pyvb.history import History
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = History(str(tmp_path / "history.json"))
+    history.host = "laptop"
+    return history
+
+
+def test_record_and_estimate(history):
+    assert history.estimate("install", "3.8.1") is None
+    history.record("install", "3.8.1", None, 100)
+    assert history.estimate("install", "3.8.1") == 100
+    # recent runs count for more than old ones, but don't replace them
+    history.record("install", "3.8.1", None, 200)
+    assert history.estimate("install", "3.8.1") == pytest.approx(130)
+    # profiles are timed separately
+    assert history.estimate("install", "3.8.1", "optimized") is None
+    history.record("install", "3.8.1", "optimized", 900)
+    assert history.estimate("install", "3.8.1", "optimized") == 900
+
+
+def test_estimate_falls_back(history):
+    history.host = "server"
+    history.record("install", "3.8.1", None, 60)
+    history.host = "laptop"
+    history.record("install", "3.7.6", None, 240)
+    # another host has built this version
+    assert history.estimate("install", "3.8.1") == 60
+    # nobody has built it, use other versions on this host
+    assert history.estimate("install", "3.9.1") == 240
+    assert history.estimate("create", "3.9.1") is None
+
+
+def test_estimate_keeps_profiles_apart(history):
+    history.host = "server"
+    history.record("install", "3.8.1", "optimized", 900)
+    history.host = "laptop"
+    history.record("install", "3.7.6", None, 240)
+    history.record("install", "3.7.6", "debug", 400)
+    # other hosts' times only count for the same profile
+    assert history.estimate("install", "3.8.1") == 240
+    assert history.estimate("install", "3.8.1", "optimized") == 900
+    # other versions only count for the same profile
+    assert history.estimate("install", "3.9.1", "debug") == 400
+    assert history.estimate("install", "3.9.1", "optimized") is None
+
+
+def test_unreadable_history(history, tmp_path):
+    (tmp_path / "history.json").write_text("not json")
+    assert history.durations() == {}
+    history.record("create", "3.8.1", None, 5)
+    assert history.estimate("create", "3.8.1") == 5
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for locks shared between processes
+"""
+
+import threading
+
+from pyvb.locks import FileLock, lock_path
+
+
+def test_lock_path(pyenv_root):
+    path = lock_path("python", "3.8.1")
+    assert path == str(pyenv_root / "pyvb" / "locks" / "python-3.8.1.lock")
+
+
+def test_wait_for_lock(tmp_path):
+    path = str(tmp_path / "environment-fred.lock")
+    holder = FileLock(path)
+    holder.acquire()
+    waiting = threading.Event()
+
+    def release():
+        waiting.wait(5)
+        holder.release()
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    lock = FileLock(path)
+    assert lock.acquire(waiting.set) > 0
+    thread.join()
+    lock.release()
+    # releasing twice is harmless
+    lock.release()
+    assert FileLock(path).acquire() == 0
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the record of environments pyvb has built
+"""
+
+import threading
+
+from pyvb.manifest import Manifest
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "manifest.json")
+
+    def build(prefix):
+        # each writer is like a separate pyvb process, with its own Manifest
+        manifest = Manifest(path)
+        for count in range(25):
+            manifest.record("{}-{}".format(prefix, count), "3.8.1", "abc")
+            manifest.record_python("{}.{}".format(prefix, count))
+
+    threads = [
+        threading.Thread(target=build, args=(prefix,))
+        for prefix in ["fred", "wilma", "barney", "betty"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manifest = Manifest(path)
+    # nobody's changes were lost
+    assert len(manifest.environments()) == 100
+    assert len(manifest.pythons()) == 100
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the pool of prebuilt environments
+"""
+
+import threading
+
+from pyvb.locks import FileLock, lock_path
+from pyvb.pool import Pool
+
+
+def virtualenvs(run_mock):
+    return [c.args[0] for c in run_mock.call_args_list if c.args[0][1] == "virtualenv"]
+
+
+def test_fill(prog, mocker, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["pool", "fill", "--size", "2", "-p", "3.7,3.8"]) == 0
+    assert len(Pool.entries("3.7.6")) == 2
+    assert len(Pool.entries("3.8.1")) == 2
+    assert len(virtualenvs(pyenv_run)) == 4
+
+    # the pool is full, so nothing is built
+    pyenv_run.reset_mock()
+    assert prog.main(["pool", "fill", "-p", "3.8"]) == 0
+    assert not virtualenvs(pyenv_run)
+
+    # a smaller pool removes the extras
+    assert prog.main(["pool", "fill", "--size", "1", "-p", "3.8"]) == 0
+    assert len(Pool.entries("3.8.1")) == 1
+    assert Pool().sizes() == {"3.7.6": 2, "3.8.1": 1}
+
+
+def test_claim(prog, mocker, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    popen = mocker.patch("subprocess.Popen")
+    assert prog.main(["pool", "fill", "--size", "1", "-p", "3.8"]) == 0
+    (entry,) = Pool.entries("3.8.1")
+    real = (pyenv_root / "versions" / entry).resolve()
+
+    pyenv_run.reset_mock()
+    assert prog.main(["pool", "claim", "fred", "-p", "3.8"]) == 0
+    # the pool environment was put in place, not built
+    assert not virtualenvs(pyenv_run)
+    assert (pyenv_root / "versions" / "fred-3.8.1").resolve() == real
+    assert not Pool.entries("3.8.1")
+    assert prog.manifest.get("fred-3.8.1")
+    assert not prog.manifest.get(entry)
+
+    # and the pool is refilled in the background
+    argv = popen.call_args.args[0]
+    assert argv[2:] == ["pyvb", "pool", "fill", "-p", "3.8.1", "-j", "1"]
+
+
+def test_claim_waits_for_environment_lock(prog, mocker, pyenv_root, pyenv_run, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["pool", "fill", "--size", "1", "-p", "3.8"]) == 0
+    # another pyvb is building fred-3.8.1
+    other = FileLock(lock_path("environment", "fred-3.8.1"))
+    other.acquire()
+    timer = threading.Timer(0.2, other.release)
+    timer.start()
+    argv = ["pool", "claim", "fred", "-p", "3.8", "--no-refill", "-v"]
+    assert prog.main(argv) == 0
+    timer.join()
+    out = capsys.readouterr().out
+    assert "waiting for another pyvb to finish with environment fred-3.8.1" in out
+    assert (pyenv_root / "versions" / "fred-3.8.1" / "pyvenv.cfg").exists()
+    # and the lock has been released
+    assert FileLock(lock_path("environment", "fred-3.8.1")).acquire(timeout=0) == 0
+
+
+def test_claim_empty_pool(prog, mocker, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    popen = mocker.patch("subprocess.Popen")
+    assert prog.main(["pool", "claim", "fred", "-p", "3.8"]) == 0
+    # the environment is built instead
+    assert len(virtualenvs(pyenv_run)) == 1
+    assert (pyenv_root / "versions" / "fred-3.8.1" / "pyvenv.cfg").exists()
+    # there is no pool for 3.8.1 to refill
+    assert not popen.called
+
+
+def test_concurrent_claims(pyenv_root, fake_env):
+    for _ in range(3):
+        fake_env("3.8.1", Pool.entry_name("3.8.1"))
+    pool = Pool()
+    claimed = []
+
+    def claim(number):
+        claimed.append(pool.claim("3.8.1", "fred-{}".format(number)))
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winners = [entry for entry in claimed if entry]
+    # each environment went to exactly one claimant
+    assert len(winners) == 3
+    assert len(set(winners)) == 3
+    assert not Pool.entries("3.8.1")
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for build profiles
+"""
+
+import pytest
+
+from pyvb.profiles import profile_environ
+
+
+def test_no_profile():
+    assert profile_environ(None, {"CC": "clang"}) == {"CC": "clang"}
+
+
+def test_fast(mocker):
+    mocker.patch("shutil.which", return_value="/usr/bin/ccache")
+    mocker.patch("os.cpu_count", return_value=8)
+    env = profile_environ("fast", {"CC": "clang"})
+    assert env == {"CC": "ccache clang", "MAKE_OPTS": "-j8"}
+    # the user's own settings win
+    assert profile_environ("fast", {"MAKE_OPTS": "-j2"})["MAKE_OPTS"] == "-j2"
+
+
+def test_fast_without_ccache(mocker):
+    mocker.patch("shutil.which", return_value=None)
+    assert "CC" not in profile_environ("fast", {})
+
+
+def test_optimized():
+    env = profile_environ("optimized", {"PYTHON_CONFIGURE_OPTS": "--with-lto"})
+    assert env["PYTHON_CONFIGURE_OPTS"] == "--with-lto --enable-optimizations"
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        profile_environ("bogus", {})
@@ -24,7 +24,13 @@
 pyvb test suite
 """
 
+import json
+import os
+import subprocess
+import threading
+
 import pyvb
+from pyvb.locks import FileLock, lock_path
 
 
 def test_find_latest_version(prog):
@@ -52,4 +58,337 @@ def test_select_pythons_exact(prog):
 
 def test_all_pythons(prog, pythons):
     all_pythons = prog.all_pythons()
-    assert len(all_pythons) == len(pythons.split("\n")) - 1
+    # every line but the "Available versions:" header
+    assert len(all_pythons) == len(pythons.splitlines()) - 1
+
+
+def test_main_jobs(prog, mocker, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    run_mock = pyenv_run
+    assert prog.main(["fred", "-p", "3.6,3.7,3.8", "--jobs", "3"]) == 0
+    installs = [c.args[0] for c in run_mock.call_args_list if c.args[0][1] == "install"]
+    assert sorted(x[-1] for x in installs) == ["3.6.10", "3.7.6", "3.8.1"]
+
+
+def test_main_jobs_failure(prog, mocker, pyenv_run, pyenv_root):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        if argv[-1] == "3.7.6":
+            raise subprocess.CalledProcessError(1, argv)
+        return pyenv(argv, **kwargs)
+
+    pyenv_run.side_effect = run
+    assert prog.main(["fred", "-p", "3.6,3.7,3.8", "-j", "2"]) == 1
+    # the other environments were still created
+    versions = pyenv_root / "versions"
+    assert (versions / "fred-3.6.10").is_symlink()
+    assert (versions / "fred-3.8.1").is_symlink()
+    assert not (versions / "fred-3.7.6").exists()
+
+
+def test_incremental(prog, mocker, fake_env, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    run_mock = pyenv_run
+    fake_env("3.8.1", "fred-3.8.1")
+    assert prog.main(["fred", "-p", "3.8.1"]) == 0
+    # python is already installed, so only virtualenv is run
+    assert run_mock.call_count == 1
+
+    # nothing has changed, so nothing is run
+    run_mock.reset_mock()
+    assert prog.main(["fred", "-p", "3.8.1", "--incremental"]) == 0
+    assert run_mock.call_count == 0
+
+    # a broken environment is rebuilt
+    env = fake_env("3.8.1").parent / "fred-3.8.1"
+    (env / "pyvenv.cfg").unlink()
+    assert prog.main(["fred", "-p", "3.8.1", "--incremental"]) == 0
+    assert run_mock.call_count == 1
+
+
+def test_timings_and_trace(prog, mocker, tmp_path, capsys, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    trace = tmp_path / "trace.json"
+    argv = ["fred", "-p", "3.7,3.8", "--timings", "--trace", str(trace)]
+    assert prog.main(argv) == 0
+    out = capsys.readouterr().out
+    assert "fred-3.8.1" in out
+    assert out.splitlines()[-1].startswith("total")
+
+    events = json.loads(trace.read_text())["traceEvents"]
+    names = [event["name"] for event in events]
+    assert names.count("install") == 2
+    assert names.count("pyenv install") == 2
+    assert {"catalog", "resolve", "create", "pyenv virtualenv"} <= set(names)
+    create = [event for event in events if event["name"] == "create"][0]
+    assert create["ph"] == "X"
+    assert create["args"] == {"environment": "fred-3.7.6", "version": "3.7.6"}
+
+
+def test_template(prog, mocker, pyenv_root, fake_env):
+    fake_env("3.8.1")
+
+    def run(argv, **kwargs):
+        # act like pyenv virtualenv
+        if argv[:2] == ["pyenv", "virtualenv"]:
+            env = fake_env(argv[-2], argv[-1])
+            (env / "bin" / "pip").write_text("#!{}/bin/python\n".format(env))
+            site = env / "lib" / "python3.8" / "site-packages"
+            site.mkdir(parents=True)
+            (site / "pip.py").write_text("")
+
+    run_mock = mocker.patch("subprocess.run", side_effect=run)
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8.1", "--template"]) == 0
+    assert pyvb.Pyvb().main(["wilma", "-p", "3.8.1", "--template"]) == 0
+    # only the template is created by pyenv
+    assert run_mock.call_count == 1
+
+    env = pyenv_root / "versions" / "wilma-3.8.1"
+    real = env.resolve()
+    assert real.parent == pyenv_root / "versions" / "3.8.1" / "envs"
+    assert (env / "bin" / "pip").read_text() == "#!{}/bin/python\n".format(real)
+    assert (env / "lib" / "python3.8" / "site-packages" / "pip.py").exists()
+
+
+def test_requirements_share_wheelhouse(prog, mocker, tmp_path, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    run_mock = pyenv_run
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("requests\n")
+    argv = ["fred", "-p", "3.8.0,3.8.1,3.7.6", "-j", "3", "-r", str(requirements)]
+    assert prog.main(argv) == 0
+
+    pips = [
+        c.args[0] for c in run_mock.call_args_list if c.args[0][1:3] == ["-m", "pip"]
+    ]
+    wheels = [argv for argv in pips if argv[3] == "wheel"]
+    installs = [argv for argv in pips if argv[3] == "install"]
+    # 3.8.0 and 3.8.1 share a wheelhouse
+    assert len(wheels) == 2
+    assert len(installs) == 3
+    for argv in installs:
+        assert "--no-index" in argv
+        assert argv[-1] == str(requirements)
+
+
+def test_replace_is_atomic(prog, mocker, pyenv_root, fake_env, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    old = fake_env("3.8.1", "fred-3.8.1")
+    link = pyenv_root / "versions" / "fred-3.8.1"
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        # while the new environment is built, the old one is still there
+        assert link.resolve() == old
+        return pyenv(argv, **kwargs)
+
+    pyenv_run.side_effect = run
+    assert prog.main(["fred", "-p", "3.8.1"]) == 0
+    assert link.resolve() != old
+    assert (link / "pyvenv.cfg").exists()
+    assert not old.exists()
+    # only the replaced environment is left
+    assert sorted(os.listdir(str(pyenv_root / "versions"))) == ["3.8.1", "fred-3.8.1"]
+    # the prompt shows its name, not the temporary one it was built under
+    activate = (link / "bin" / "activate").read_text()
+    assert 'PS1="(fred-3.8.1) ' in activate
+    assert 'VIRTUAL_ENV="{}"'.format(link.resolve()) in activate
+
+
+def test_failed_wheels_discards_staging(prog, mocker, pyenv_root, pyenv_run, tmp_path):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("attrs==19.3.0\n")
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        if argv[1:4] == ["-m", "pip", "wheel"]:
+            raise subprocess.CalledProcessError(1, argv)
+        return pyenv(argv, **kwargs)
+
+    pyenv_run.side_effect = run
+    # with -j 2 the environment is created before the wheels step fails
+    argv = ["fred", "-p", "3.8.1", "-r", str(requirements), "-j", "2"]
+    assert prog.main(argv) == 1
+    versions = pyenv_root / "versions"
+    assert not [name for name in os.listdir(str(versions)) if "-pyvb-" in name]
+    assert not [
+        name
+        for name in os.listdir(str(versions / "3.8.1" / "envs"))
+        if "-pyvb-" in name
+    ]
+
+
+def test_failed_build_keeps_old_environment(
+    prog, mocker, pyenv_root, fake_env, pyenv_run
+):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    old = fake_env("3.8.1", "fred-3.8.1")
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        pyenv(argv, **kwargs)
+        if argv[1] == "virtualenv":
+            raise subprocess.CalledProcessError(1, argv)
+
+    pyenv_run.side_effect = run
+    assert prog.main(["fred", "-p", "3.8.1"]) == 1
+    assert (pyenv_root / "versions" / "fred-3.8.1").resolve() == old
+    # the partly built environment is cleaned up
+    assert sorted(os.listdir(str(pyenv_root / "versions"))) == ["3.8.1", "fred-3.8.1"]
+    assert os.listdir(str(old.parent)) == ["fred-3.8.1"]
+
+
+def test_resume(prog, mocker, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        if argv[-1] == "3.7.6":
+            raise subprocess.CalledProcessError(1, argv)
+        return pyenv(argv, **kwargs)
+
+    # the run stops when 3.7.6 fails to compile
+    pyenv_run.side_effect = run
+    assert prog.main(["fred", "-p", "3.6,3.7,3.8"]) == 1
+    assert (pyenv_root / "versions" / "fred-3.6.10").is_symlink()
+
+    # only the environments which weren't finished are built
+    pyenv_run.side_effect = pyenv
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(["fred", "-p", "3.6,3.7,3.8", "--resume"]) == 0
+    created = [
+        c.args[0][-2] for c in pyenv_run.call_args_list if "virtualenv" in c.args[0]
+    ]
+    assert sorted(created) == ["3.7.6", "3.8.1"]
+
+    # without --resume everything is built again
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(["fred", "-p", "3.6,3.7,3.8"]) == 0
+    created = [
+        c.args[0][-2] for c in pyenv_run.call_args_list if "virtualenv" in c.args[0]
+    ]
+    assert len(created) == 3
+
+
+def test_resume_checks_disk(prog, mocker, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8"]) == 0
+    # the journal says it's done, but it has been broken since
+    (pyenv_root / "versions" / "fred-3.8.1" / "pyvenv.cfg").unlink()
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(["fred", "-p", "3.8", "--resume"]) == 0
+    assert pyenv_run.call_count == 1
+
+
+def test_resume_checks_requirements(prog, mocker, tmp_path, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("requests\n")
+    argv = ["fred", "-p", "3.8", "-r", str(requirements)]
+    assert prog.main(argv) == 0
+    # the environment is healthy, but no longer has what it should
+    requirements.write_text("requests\nattrs\n")
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(argv + ["--resume"]) == 0
+    installs = [c.args[0] for c in pyenv_run.call_args_list if "install" in c.args[0]]
+    assert [argv[-1] for argv in installs if "pip" in argv] == [str(requirements)]
+
+
+def test_resume_needs_same_arguments(prog, mocker, pyenv_root, pyenv_run, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8"]) == 0
+    # a run for another basename has a journal of its own
+    assert pyvb.Pyvb().main(["barney", "-p", "3.8"]) == 0
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(["fred", "-p", "3.8", "--resume"]) == 0
+    assert pyenv_run.call_count == 0
+
+    assert pyvb.Pyvb().main(["fred", "-p", "3.7", "--resume"]) == 1
+    assert pyenv_run.call_count == 0
+    assert "the last run for fred was: fred -p 3.8" in capsys.readouterr().out
+
+
+def test_durations_recorded(prog, mocker, pyenv_root, pyenv_run, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8", "-v"]) == 0
+    history = pyvb.history.History()
+    assert history.estimate("install", "3.8.1") is not None
+    assert history.estimate("create", "3.8.1") is not None
+    # the status messages say how long is left
+    assert "left] finished install 3.8.1" in capsys.readouterr().out
+
+
+def test_install_waits_for_other_process(prog, pyenv_run, fake_env, capsys):
+    # another pyvb is installing 3.8.1
+    other = FileLock(lock_path("python", "3.8.1"))
+    other.acquire()
+
+    def finish():
+        fake_env("3.8.1")
+        other.release()
+
+    timer = threading.Timer(0.2, finish)
+    timer.start()
+    prog.verbose = True
+    prog.install_python("3.8.1")
+    timer.join()
+    # we used their python rather than compiling our own
+    assert pyenv_run.call_count == 0
+    out = capsys.readouterr().out
+    assert "waiting for another pyvb to finish with python 3.8.1" in out
+    assert "python 3.8.1 is already installed" in out
+
+
+def test_state_files_are_readable(prog, mocker, pyenv_root, pyenv_run):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    umask = os.umask(0o022)
+    try:
+        assert prog.main(["fred", "-p", "3.8.1"]) == 0
+    finally:
+        os.umask(umask)
+    # other users of a shared $PYENV_ROOT can read what we wrote
+    for name in ["manifest.json", "history.json"]:
+        mode = os.stat(str(pyenv_root / "pyvb" / name)).st_mode
+        assert mode & 0o777 == 0o644
+
+
+def test_unavailable_python(prog, mocker, pyenv_run, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    assert prog.main(["fred", "-p", "3.8,3.99"]) == 1
+    assert "no python 3.99 is available" in capsys.readouterr().out
+    # the versions which were found are still built
+    assert pyvb.pyvb.Environment("fred-3.8.1").is_healthy()
+
+
+def test_profile_is_recorded(prog, mocker, pyenv_run, fake_env, capsys):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+
+    def pyenv_commands():
+        return [c.args[0][1:3] for c in pyenv_run.call_args_list]
+
+    assert prog.main(["fred", "-p", "3.8.1"]) == 0
+    assert prog.manifest.pythons()["3.8.1"]["profile"] is None
+
+    # asking for another profile rebuilds the python, and so the environment
+    pyenv_run.reset_mock()
+    argv = ["fred", "-p", "3.8.1", "-i", "--profile", "optimized"]
+    assert pyvb.Pyvb().main(argv) == 0
+    assert ["install", "-f"] in pyenv_commands()
+    assert ["virtualenv", "-p"] in pyenv_commands()
+    assert prog.manifest.pythons()["3.8.1"]["profile"] == "optimized"
+
+    # after which it's up to date, with or without the profile
+    pyenv_run.reset_mock()
+    assert pyvb.Pyvb().main(argv) == 0
+    assert pyvb.Pyvb().main(["fred", "-p", "3.8.1", "-i"]) == 0
+    assert not pyenv_run.called
+
+    # pythons pyvb didn't install are left alone, with a warning
+    fake_env("3.7.6")
+    assert pyvb.Pyvb().main(["wilma", "-p", "3.7.6", "--profile", "fast"]) == 0
+    assert ["install", "-f"] not in pyenv_commands()
+    assert "python 3.7.6 wasn't installed by pyvb" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for deciding how many pythons to compile at once
+"""
+
+import threading
+
+from pyvb.resources import GIGABYTE, Estimate, ResourceBudget, estimate_build
+
+
+def test_estimate_build(mocker):
+    mocker.patch("os.cpu_count", return_value=8)
+    assert estimate_build({}).cpus == 8
+    assert estimate_build({"MAKE_OPTS": "-j2"}).cpus == 2
+    # parallel builds share the cpus
+    assert estimate_build({}, jobs=4).cpus == 2
+    assert estimate_build({}, jobs=16).cpus == 1
+    assert estimate_build({}, cpus=3, jobs=4).cpus == 3
+    assert estimate_build({}, "optimized").memory == 3 * GIGABYTE
+    estimate = estimate_build({}, cpus=3, memory=GIGABYTE // 2)
+    assert (estimate.cpus, estimate.memory) == (3, GIGABYTE // 2)
+
+
+def test_first_compile_always_fits():
+    budget = ResourceBudget(cpus=2, load=lambda: 50.0, memory=lambda: 0)
+    assert budget.fits(Estimate(4, 8 * GIGABYTE))
+
+
+def test_load_counts_against_cpus():
+    load = 0.0
+    budget = ResourceBudget(cpus=8, load=lambda: load, memory=lambda: None)
+    budget.acquire(Estimate(2, GIGABYTE))
+    assert budget.fits(Estimate(2, GIGABYTE))
+    # someone else is busy on this machine
+    load = 7.0
+    assert not budget.fits(Estimate(2, GIGABYTE))
+
+
+def test_memory_counts_running_compiles():
+    budget = ResourceBudget(cpus=8, load=lambda: None, memory=lambda: 4 * GIGABYTE)
+    budget.acquire(Estimate(1, 3 * GIGABYTE))
+    assert not budget.fits(Estimate(1, 2 * GIGABYTE))
+    assert budget.fits(Estimate(1, GIGABYTE))
+
+
+def test_wait_for_release():
+    budget = ResourceBudget(cpus=4, load=lambda: None, memory=lambda: None, poll=5)
+    estimate = Estimate(4, GIGABYTE)
+    budget.acquire(estimate)
+    waiting = threading.Event()
+    acquired = threading.Event()
+
+    def second():
+        budget.acquire(estimate, waiting.set)
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert waiting.wait(5)
+    assert not acquired.is_set()
+    budget.release(estimate)
+    assert acquired.wait(5)
+    thread.join()
+    assert budget.running == 1
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for the step scheduler
+"""
+
+import threading
+
+import pytest
+
+from pyvb.scheduler import DONE, FAILED, SKIPPED, Scheduler
+
+
+def fail():
+    raise ValueError("boom")
+
+
+def test_dedupe():
+    calls = []
+    scheduler = Scheduler()
+    first = scheduler.add("install", lambda: calls.append(1))
+    second = scheduler.add("install", lambda: calls.append(2))
+    assert first is second
+    assert scheduler.run() == []
+    assert calls == [1]
+
+
+def test_failure_skips_dependents():
+    scheduler = Scheduler(jobs=2)
+    install = scheduler.add("install", fail)
+    create = scheduler.add("create", lambda: None, [install])
+    other = scheduler.add("other", lambda: None)
+    assert scheduler.run() == [install, create]
+    assert install.state == FAILED
+    assert isinstance(install.error, ValueError)
+    assert create.state == SKIPPED
+    assert other.state == DONE
+
+
+def test_stop_at_first_failure():
+    scheduler = Scheduler(jobs=1, keep_going=False)
+    first = scheduler.add("first", fail)
+    second = scheduler.add("second", lambda: None)
+    assert scheduler.run() == [first, second]
+    assert second.state == SKIPPED
+
+
+def test_independent_steps_overlap():
+    # a slow install must not hold up a step which doesn't depend on it
+    release = threading.Event()
+    scheduler = Scheduler(jobs=2)
+    slow = scheduler.add("slow", lambda: release.wait(5) or pytest.fail("blocked"))
+    scheduler.add("fast", release.set)
+    scheduler.add("after", lambda: None, [slow])
+    assert scheduler.run() == []
+
+
+def test_longest_chain_first():
+    started = []
+    scheduler = Scheduler(jobs=2)
+    scheduler.add("short", lambda: started.append("short"), cost=10)
+    slow = scheduler.add("slow", lambda: started.append("slow"), cost=5)
+    scheduler.add("after", lambda: started.append("after"), [slow], cost=20)
+    assert scheduler.run() == []
+    assert started[0] == "slow"
+
+
+def test_one_job_keeps_order():
+    started = []
+    scheduler = Scheduler(jobs=1)
+    scheduler.add("cheap", lambda: started.append("cheap"), cost=1)
+    scheduler.add("dear", lambda: started.append("dear"), cost=100)
+    assert scheduler.run() == []
+    assert started == ["cheap", "dear"]
+
+
+def test_eta():
+    scheduler = Scheduler(jobs=2)
+    assert scheduler.eta() is None
+    install = scheduler.add("install", lambda: None, cost=300)
+    scheduler.add("create", lambda: None, [install], cost=10)
+    scheduler.add("other", lambda: None, cost=30)
+    scheduler._rank()
+    # the chain through install is longer than the work shared out
+    assert scheduler.eta() == 310
+    etas = []
+    scheduler.finished = lambda step: etas.append(scheduler.eta())
+    assert scheduler.run() == []
+    assert etas[-1] == 0
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+make sure pyvb starts quickly
+
+pyvb is run from shell hooks, so the time it takes to import matters
+"""
+
+import os
+import subprocess
+import sys
+
+# microseconds, as reported by python -X importtime. Importing pyvb currently
+# takes about 40ms, the slack is for slow or busy test machines.
+IMPORT_BUDGET = 60000
+
+# modules which are slow to import and which pyvb only needs for some commands
+DEFERRED_MODULES = [
+    "pkg_resources",
+    "argparse",
+    "concurrent.futures",
+    "hashlib",
+    "pyvb.artifacts",
+    "pyvb.batch",
+    "pyvb.bundle",
+    "pyvb.cleanup",
+    "pyvb.clone",
+    "pyvb.dedupe",
+    "pyvb.pool",
+    "pyvb.sync",
+]
+
+
+def import_times():
+    """Import pyvb in a fresh interpreter, return a dict of module to cumulative time"""
+    # compile the bytecode first, like installing pyvb does, so we don't time
+    # the compiler
+    environ = dict(os.environ)
+    environ.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.run(
+        [sys.executable, "-c", "import pyvb.__main__"], env=environ, check=True
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import pyvb.__main__"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_budget():
+    times = import_times()
+    assert times["pyvb.__main__"] < IMPORT_BUDGET
+
+
+def test_deferred_imports():
+    times = import_times()
+    for module in DEFERRED_MODULES:
+        assert module not in times
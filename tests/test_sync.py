@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for updating environments in place
+"""
+
+import json
+import subprocess
+
+import pytest
+
+import pyvb
+from pyvb.sync import parse_pins
+
+REQUIREMENTS = """\
+# pinned by pip-compile
+--index-url https://pypi.org/simple
+
+attrs==19.3.0 \\
+    --hash=sha256:08a96c641c3a74e44eb59afb61a24f2cb9f4d7188748e76ba4bb5edfa3cb7d1c
+Six==1.14.0  # via -r requirements.in
+zope.interface[test]==4.7.1
+"""
+
+
+def test_parse_pins():
+    assert parse_pins(REQUIREMENTS.splitlines(keepends=True)) == {
+        "attrs": "19.3.0",
+        "six": "1.14.0",
+        "zope-interface": "4.7.1",
+    }
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "requests",
+        "requests>=2.0",
+        "requests==2.*",
+        "requests==2.22.0; python_version < '3.8'",
+        "-r other.txt",
+        "-e .",
+        "git+https://github.com/kotfu/pyvb.git",
+    ],
+)
+def test_parse_pins_unpinned(line):
+    assert parse_pins([line]) is None
+
+
+def test_sync(prog, mocker, pyenv_run, pyenv_root, tmp_path):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("attrs==19.3.0\nsix==1.13.0\n")
+    assert prog.main(["fred", "-p", "3.8", "-r", str(requirements)]) == 0
+
+    installed = [
+        {"name": "pip", "version": "20.0.2"},
+        {"name": "attrs", "version": "19.3.0"},
+        {"name": "six", "version": "1.13.0"},
+        {"name": "toml", "version": "0.10.0"},
+    ]
+    pyenv = pyenv_run.side_effect
+
+    def run(argv, **kwargs):
+        if argv[1:4] == ["-m", "pip", "list"]:
+            return subprocess.CompletedProcess(argv, 0, json.dumps(installed))
+        return pyenv(argv, **kwargs)
+
+    pyenv_run.side_effect = run
+    pyenv_run.reset_mock()
+    requirements.write_text("attrs==19.3.0\nsix==1.14.0\n")
+    assert (
+        pyvb.Pyvb().main(["fred", "-p", "3.8", "-r", str(requirements), "--sync"]) == 0
+    )
+    commands = [c.args[0] for c in pyenv_run.call_args_list]
+    assert not [argv for argv in commands if "virtualenv" in argv]
+    pips = [argv[3:] for argv in commands if argv[1:3] == ["-m", "pip"]]
+    assert ["uninstall", "--yes", "toml"] in pips
+    assert pips[-1][0] == "install" and pips[-1][-1:] == ["six==1.14.0"]
+    # it's recorded as up to date
+    env = pyvb.pyvb.Environment("fred-3.8.1", "3.8.1", str(requirements))
+    assert pyvb.Pyvb().environment_is_current(env)
+
+
+def test_sync_rebuilds(prog, mocker, pyenv_run, pyenv_root, tmp_path):
+    mocker.patch("pyvb.Pyvb.have_pyenv", return_value=True)
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("requests>=2\n")
+    assert prog.main(["fred", "-p", "3.8", "-r", str(requirements)]) == 0
+    pyenv_run.reset_mock()
+    # requirements which aren't pinned can't be synced
+    argv = ["fred", "-p", "3.8", "-r", str(requirements), "--sync"]
+    assert pyvb.Pyvb().main(argv) == 0
+    commands = [c.args[0] for c in pyenv_run.call_args_list]
+    assert [argv for argv in commands if "virtualenv" in argv]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Jared Crapo
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+tests for parsing and indexing python versions
+"""
+
+from pyvb.versions import StreamingVersionIndex, Version, VersionIndex
+
+
+def test_parse():
+    version = Version.parse("3.8.1")
+    assert version.implementation is None
+    assert version.release == (3, 8, 1)
+    assert version.is_final
+    version = Version.parse("jython-2.5.4-rc1")
+    assert version.implementation == "jython"
+    assert version.release == (2, 5, 4)
+    assert not version.is_final
+    assert Version.parse("miniconda-latest") is None
+
+
+def test_latest_does_not_match_partial_components():
+    index = VersionIndex(["3.1.4", "3.1.5", "3.10.0", "3.10.2rc1"])
+    assert index.latest("3.1") == "3.1.5"
+    assert index.latest("3.10") == "3.10.0"
+    assert index.latest("3.1.4") == "3.1.4"
+    assert index.latest("3.1.40") is None
+
+
+def test_latest_implementation(pythons):
+    index = VersionIndex(x.strip() for x in pythons.split("\n")[1:])
+    assert index.latest("pypy3.6") == "pypy3.6-7.3.0"
+    assert index.latest("anaconda3-2019") == "anaconda3-2019.10"
+    assert index.latest("3") == "3.8.1"
+    assert index.latest("fred") is None
+    assert "3.7.5rc1" in index
+
+
+def test_streaming_stops_early():
+    read = []
+
+    def catalog():
+        for version in ["2.7.18", "3.8.0", "3.8.1", "3.9.0", "3.9.1", "pypy3.6-7.3.0"]:
+            read.append(version)
+            yield version
+
+    index = StreamingVersionIndex(catalog())
+    assert index.latest("3.8") == "3.8.1"
+    # it had to read 3.9.0 to know there is no later 3.8
+    assert read[-1] == "3.9.0"
+    assert "3.8.0" in index
+    assert len(read) == 4
+    assert index.latest("pypy3.6") == "pypy3.6-7.3.0"
+    assert index.latest("3.9") == "3.9.1"
+    assert "3.10.0" not in index
+
+
+def test_streaming_unsorted_catalog():
+    # sorted as text, so 3.10 comes before 3.8
+    index = StreamingVersionIndex(iter(["3.10.0", "3.8.0", "3.8.1", "3.9.1"]))
+    assert index.latest("3.8") == "3.8.1"
+    assert "3.9.1" in index
+    assert index.latest("3.11") is None